@@ -1,26 +1,25 @@
 # ai_module.py
-from datetime import date, timedelta, datetime
+from datetime import date, datetime, timedelta
 import statistics
 import database
+import history
+
+# --- One habit (the app): a couple of small queries, no pandas ---
 
 def suggest_reminder_time(habit_id, window_days=30):
     """
     Suggest reminder time as median hour of completion in the last window_days.
     Falls back to habit.target_time or '08:00'.
     """
-    prog = database.get_progress(habit_id, days=window_days)
     hours = []
-    for p in prog:
+    for p in database.get_progress(habit_id, days=window_days):
         if p.get("completed_at"):
             try:
-                dt = datetime.fromisoformat(p["completed_at"])
-                hours.append(dt.hour)
-            except Exception:
+                hours.append(datetime.fromisoformat(str(p["completed_at"])).hour)
+            except ValueError:
                 pass
     if hours:
-        median_hour = int(statistics.median(hours))
-        return f"{median_hour:02d}:00"
-    # fallback to habit's target_time
+        return f"{int(statistics.median(hours)):02d}:00"
     habit = database.get_habit(habit_id)
     if habit and habit.get("target_time"):
         return habit["target_time"]
@@ -35,13 +34,12 @@ def predict_dropout_risk(habit_id, window_days=14):
     habit = database.get_habit(habit_id)
     if not habit:
         return (0.0, "unknown")
-    frequency = habit.get("frequency", "daily")
-    prog = database.get_progress(habit_id, days=window_days)
-    done_count = sum(1 for p in prog if p["status"] == "done")
-    expected = window_days if frequency == "daily" else max(1, window_days // 7)
-    # normalize
-    ratio = done_count / expected if expected > 0 else 0
-    risk = max(0.0, min(1.0, 1 - ratio))
+    today = date.today()
+    # The user's histories are cached, so this is usually just the get_habit query
+    days = database.get_histories(habit["user_id"]).get(habit_id, history.EMPTY)
+    done = days.count(today - timedelta(days=window_days), today)
+    expected = window_days if habit["frequency"] == "daily" else max(1, window_days // 7)
+    risk = max(0.0, min(1.0, 1 - done / expected))
     if risk >= 0.6:
         label = "HIGH"
     elif risk >= 0.3:
@@ -49,3 +47,66 @@ def predict_dropout_risk(habit_id, window_days=14):
     else:
         label = "LOW"
     return (risk, label)
+
+# --- Batch versions: every habit (or every habit of some users) at once ---
+# One streaming query for the progress window plus one for the habits,
+# then pandas group-bys instead of two queries and a Python loop per habit.
+# Worth it from a few dozen habits on (manage.py ai-report); for one habit
+# importing and setting up pandas costs more than the queries.
+
+def window_stats(window_days, habit_ids=None, user_ids=None):
+    """
+    Per-habit stats over the last window_days: DataFrame indexed by habit_id
+    with `done` (count of done days) and `median_hour` (median hour of the
+    logged completions, NaN if none). Habits with no rows are absent.
+    """
+    import pandas as pd
+    parts = []
+    for rows in database.iter_progress_window(window_days, habit_ids=habit_ids, user_ids=user_ids):
+        batch = pd.DataFrame.from_records(rows, columns=["habit_id", "status", "completed_at"])
+        # Keep only compact columns so memory is ~10 bytes per row, not a dict per row
+        parts.append(pd.DataFrame({
+            "habit_id": batch["habit_id"].astype("int64"),
+            "done": batch["status"].eq("done"),
+            "hour": pd.to_datetime(batch["completed_at"], errors="coerce").dt.hour,
+        }))
+    if not parts:
+        return pd.DataFrame({"done": pd.Series(dtype="int64"), "median_hour": pd.Series(dtype="float64")},
+                            index=pd.Index([], name="habit_id", dtype="int64"))
+    df = pd.concat(parts, ignore_index=True)
+    return df.groupby("habit_id").agg(done=("done", "sum"), median_hour=("hour", "median"))
+
+def suggest_reminder_times(habit_ids=None, user_ids=None, window_days=30):
+    """suggest_reminder_time for many habits (default: all). Returns {habit_id: 'HH:MM'}."""
+    habits = database.get_habit_settings(habit_ids=habit_ids, user_ids=user_ids)
+    stats = window_stats(window_days, habit_ids=habit_ids, user_ids=user_ids)
+    hours = stats["median_hour"].dropna().astype(int).to_dict()
+    times = {}
+    for h in habits:
+        if h["id"] in hours:
+            times[h["id"]] = f"{hours[h['id']]:02d}:00"
+        else:
+            times[h["id"]] = h.get("target_time") or "08:00"
+    return times
+
+def predict_dropout_risks(habit_ids=None, user_ids=None, window_days=14):
+    """predict_dropout_risk for many habits (default: all). Returns {habit_id: (risk, label)}."""
+    import numpy as np
+    habits = database.get_habit_settings(habit_ids=habit_ids, user_ids=user_ids)
+    if not habits:
+        return {}
+    ids = [h["id"] for h in habits]
+    # Done days per habit = popcount of its window bits; one id chunk of histories in memory at a time
+    today = date.today()
+    since = today - timedelta(days=window_days)
+    position = {habit_id: i for i, habit_id in enumerate(ids)}
+    done = np.zeros(len(ids))
+    for chunk in database.iter_histories(window_days, habit_ids=ids):
+        for habit_id, history in chunk.items():
+            done[position[habit_id]] = history.count(since, today)
+    daily = np.array([h["frequency"] == "daily" for h in habits])
+    expected = np.where(daily, window_days, max(1, window_days // 7)).astype(float)
+    ratio = np.divide(done, expected, out=np.zeros_like(done), where=expected > 0)
+    risk = np.clip(1 - ratio, 0.0, 1.0)
+    labels = np.select([risk >= 0.6, risk >= 0.3], ["HIGH", "MEDIUM"], "LOW")
+    return {habit_id: (float(r), str(label)) for habit_id, r, label in zip(ids, risk, labels)}
@@ -1,10 +1,69 @@
 # app.py
+import io
+import os
+import uuid
 import streamlit as st
-import pandas as pd
-import matplotlib.pyplot as plt
-from datetime import date
 import database
-
+import instrumentation
+import projection
+import writer
+
+
+
+# --- Heavy libraries, loaded once per process by the pages that need them ---
+@st.cache_resource(show_spinner=False)
+def load_pandas():
+    import pandas
+    return pandas
+
+
+@st.cache_resource(show_spinner=False)
+def load_figure():
+    import matplotlib
+    matplotlib.use("Agg")  # render off-screen; Streamlit only needs the image
+    from matplotlib.figure import Figure  # not tracked by pyplot, so nothing piles up between reruns
+    return Figure
+
+
+# --- Charts ---
+CHART_CACHE_SIZE = int(os.environ.get("DUO_CHART_CACHE", "256"))  # PNGs kept, ~30 KB each
+NATIVE_CHARTS = os.environ.get("DUO_NATIVE_CHARTS", "") not in ("", "0")  # browser-drawn charts, no matplotlib
+
+
+PROGRESS_CHART_SPEC = {
+    "height": 220,
+    "mark": {"type": "line", "point": True},
+    "encoding": {
+        "x": {"field": "date", "type": "temporal", "title": "Date"},
+        "y": {"field": "done", "type": "quantitative", "title": None,
+              "scale": {"domain": [0, 1]}, "axis": {"values": [0, 1], "labelExpr": "datum.value ? 'done' : 'miss'"}},
+    },
+}
+
+
+@st.cache_data(max_entries=CHART_CACHE_SIZE, show_spinner=False)
+def render_progress_chart(habit_id, dates, values):
+    """
+    PNG of a habit's last-N-days line. Keyed by (habit_id, dates, values) —
+    the data itself is the version — so reruns over unchanged progress reuse
+    the cached image instead of drawing a new figure.
+    """
+    Figure = load_figure()
+    fig = Figure(figsize=(8, 2.5))
+    try:
+        ax = fig.subplots()
+        ax.plot(dates, values, marker="o")
+        ax.set_ylim(-0.1, 1.1)
+        ax.set_yticks([0, 1])
+        ax.set_yticklabels(["miss", "done"])
+        ax.set_xlabel("Date")
+        ax.set_xticks(dates[::5])  # show fewer x labels
+        ax.tick_params(axis='x', rotation=45)
+        buf = io.BytesIO()
+        fig.savefig(buf, format="png", bbox_inches="tight", dpi=200)  # what st.pyplot would send
+        return buf.getvalue()
+    finally:
+        fig.clear()
 
 
 # --- Page Config ---
@@ -13,11 +72,93 @@ st.set_page_config(page_title="Habit Tracker", layout="wide")
 # --- Session State ---
 if "user" not in st.session_state:
     st.session_state.user = None
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+if "pending_writes" not in st.session_state:
+    st.session_state.pending_writes = {}  # ticket -> {"habit_id", "status"} not written yet
+
+# --- Query profiling (DUO_DEV_PANEL=1 shows it in the sidebar, DUO_QUERY_STATS=1 only exports) ---
+DEV_PANEL = os.environ.get("DUO_DEV_PANEL", "") not in ("", "0")
+rerun_profile = None
+if DEV_PANEL or instrumentation.ENABLED:
+    rerun_profile = instrumentation.start(page=st.session_state.get("nav", "🏠 Home"))
+
+
+def finish_profile():
+    """Close this rerun's profile (once) and show it in the developer panel."""
+    global rerun_profile
+    profile, rerun_profile = rerun_profile, None
+    if profile is None:
+        return
+    instrumentation.finish(profile)
+    if DEV_PANEL:
+        with st.sidebar.expander(f"🛠 {len(profile.queries)} queries, {profile.query_ms:.1f} ms"):
+            cache = database.cache_stats()
+            st.caption(f"Render took {profile.elapsed_ms:.1f} ms (page: {profile.page}) · "
+                       f"user cache hit rate {cache['hit_rate']:.0%} · "
+                       f"worker {os.environ.get('DUO_WORKER_ID', '-')}")
+            for q in profile.slowest(5):
+                st.markdown(f"**{q['ms']:.2f} ms** · {q['rows']} rows · `{q['caller']}`")
+                st.code(q["sql"] + "\n-- params " + q["shape"], language="sql")
+
+
+# Pages end early with these instead of st.stop()/st.rerun(), so the profile still covers them
+def stop():
+    finish_profile()
+    st.stop()
+
+
+def rerun():
+    finish_profile()
+    st.rerun()
 
 
 def login_or_create(username, email=None):
     user = database.create_or_get_user(username, email)
     st.session_state.user = user
+    st.query_params["uid"] = str(user["id"])  # router.py pins this user to one worker on the next visit
+
+
+def queue_progress(habit_id, status):
+    """Button callback: hand the click to the write queue and show it as pending."""
+    ticket = writer.queue.submit(st.session_state.session_id, habit_id, status)
+    st.session_state.pending_writes[ticket] = {"habit_id": habit_id, "status": status}
+
+
+def collect_writes():
+    """Report clicks the write queue has finished since the last rerun."""
+    session_id = st.session_state.session_id
+    idle = not writer.queue.in_flight(session_id)
+    for res in writer.queue.poll(session_id):
+        st.session_state.pending_writes.pop(res["ticket"], None)
+        if not res.get("ok"):
+            st.warning(res.get("msg", f"Could not mark {res['status']}"))
+        elif res["status"] == "done":
+            st.toast(f"Marked done — streak now {res['streak']}, +{res['xp_gain']} XP")
+        else:
+            st.toast("Marked as skipped — streak reset")
+    if idle:
+        st.session_state.pending_writes.clear()  # none of ours queued: tickets from before a restart will never report
+
+
+@st.fragment(run_every=0.5)
+def wait_for_writes():
+    """
+    While clicks are still being written, check twice a second and redraw
+    the page once this session's land (other sessions may keep the queue busy).
+    """
+    session_id = st.session_state.session_id
+    if st.session_state.pending_writes and (
+            writer.queue.has_results(session_id) or not writer.queue.in_flight(session_id)):
+        st.rerun(scope="app")
+
+
+def load_more_log(user_id):
+    """Append the next page of the activity log to the rows already shown."""
+    more = st.session_state.log_more
+    older = database.get_progress_log_page(user_id, after=more["next"])
+    more["rows"] = more["rows"] + older["rows"]
+    more["next"] = older["next"]
 
 
 def get_badge(progress_count: int):
@@ -36,14 +177,15 @@ def get_badge(progress_count: int):
 # --- Sidebar Navigation ---
 with st.sidebar:
     st.title("Duo Tracker ⚡")
-    menu = st.radio("Navigate", ["🏠 Home", "✅ Habit Tracker", "💰 Finance Tracker"])
+    menu = st.radio("Navigate", ["🏠 Home", "✅ Habit Tracker", "💰 Finance Tracker"], key="nav")
     st.header("Account")
 
     if st.session_state.user:
         st.write(f"Logged in as **{st.session_state.user['username']}**")
         if st.button("Logout"):
             st.session_state.user = None
-            st.rerun()
+            st.query_params.pop("uid", None)
+            rerun()
     else:
         u = st.text_input("Username")
         e = st.text_input("Email (optional)")
@@ -52,7 +194,7 @@ with st.sidebar:
                 st.warning("Enter a username")
             else:
                 login_or_create(u.strip(), e.strip() or None)
-                st.rerun()
+                rerun()
 
 
 # ===========================
@@ -69,7 +211,7 @@ if menu == "🏠 Home":
        Slack off? Streak breaks & wallet cries 😭  
        Stay consistent, grow rich (in habits + coins)! ⚡
         """)
-        st.stop()
+        stop()
 
     user = st.session_state.user
     st.header(f"Hello, {user['username']} 👋")
@@ -82,21 +224,32 @@ if menu == "🏠 Home":
 elif menu == "✅ Habit Tracker":
     if not st.session_state.user:
         st.warning("Please log in from the sidebar first.")
-        st.stop()
+        stop()
 
     user = st.session_state.user
     st.header("✅ Habit Tracker")
+    pd = load_pandas()
+    collect_writes()
+
+    # One round trip for everything this page renders
+    page = database.get_habit_tracker_page(user["id"], progress_days=30)
+
+    # Clicks still in the write queue: show them as if written
+    pending = {w["habit_id"]: w["status"] for w in st.session_state.pending_writes.values()}
+    pending_xp = 10 * sum(1 for status in pending.values() if status == "done")
+    if pending:
+        wait_for_writes()
 
     # Dashboard summary
-    dash = database.get_user_dashboard(user["id"])
-    daily_streak = database.get_daily_streak(user["id"])
-    progress = database.get_user_progress_count(user["id"])
+    dash = page["dashboard"]
+    daily_streak = page["daily_streak"]
+    progress = page["progress_count"]
     progress_count = progress["done_count"] or 0
     badge = get_badge(progress_count)
 
     # --- Top summary panel ---
     col1, col2, col3, col4 = st.columns(4)
-    col1.metric("⭐ XP", dash["xp"])
+    col1.metric("⭐ XP", dash["xp"] + pending_xp)
     col2.metric("📋 Habits", dash["habit_count"])
     col3.metric("🔥 Daily Streak", int(daily_streak))
     col4.metric("🎖 Badge", badge)
@@ -116,11 +269,11 @@ elif menu == "✅ Habit Tracker":
             else:
                 database.add_habit(user["id"], name.strip(), frequency=freq, target_time=tstr)
                 st.success("Habit added. Reloading...")
-                st.rerun()
+                rerun()
 
     # --- List habits ---
     st.subheader("Your habits")
-    habits = database.get_habits(user["id"])
+    habits = page["habits"]
     if not habits:
         st.info("No habits yet — add one above.")
     else:
@@ -130,23 +283,17 @@ elif menu == "✅ Habit Tracker":
                 cols[0].markdown(f"**{h['name']}**  \nFrequency: {h['frequency']}")
                 cols[1].markdown(f"Streak: **{h['streak']}**")
                 cols[2].markdown(f"Longest: **{h['longest_streak']}**")
-                cols[3].markdown(f"Last done: {h['last_done_date'] or '-'}")
-
-                if cols[4].button("✅ Done", key=f"done-{h['id']}"):
-                    res = database.mark_habit_done(h["id"])
-                    if res.get("ok"):
-                        st.success(f"Marked done — streak now {res['streak']}, +{res['xp_gain']} XP")
-                    else:
-                        st.warning(res.get("msg", "Could not mark done"))
-                    st.rerun()
-
-                if cols[4].button("⏭ Skip", key=f"skip-{h['id']}"):
-                    res = database.mark_habit_skipped(h["id"])
-                    if res.get("ok"):
-                        st.info("Marked as skipped — streak reset")
-                    else:
-                        st.warning(res.get("msg", "Could not mark skipped"))
-                    st.rerun()
+                if h["id"] in pending:
+                    cols[3].markdown(f"⏳ Saving {pending[h['id']]}…")
+                else:
+                    cols[3].markdown(f"Last done: {h['last_done_date'] or '-'}")
+
+                # Callbacks only queue the write; the rerun they trigger shows it as pending
+                saving = h["id"] in pending
+                cols[4].button("✅ Done", key=f"done-{h['id']}", disabled=saving,
+                               on_click=queue_progress, args=(h["id"], "done"))
+                cols[4].button("⏭ Skip", key=f"skip-{h['id']}", disabled=saving,
+                               on_click=queue_progress, args=(h["id"], "skipped"))
 
         # --- Habit details + charts ---
         st.subheader("Habit progress")
@@ -154,30 +301,27 @@ elif menu == "✅ Habit Tracker":
         selected_name = st.selectbox("Select habit to view", list(habit_choices.keys()))
         selected_id = habit_choices[selected_name]
 
-        prog = database.get_progress(selected_id, days=30)
-        # Build dataframe of last 30 days
-        last_30 = pd.date_range(end=date.today(), periods=30).strftime("%Y-%m-%d").tolist()
-        df = pd.DataFrame({"date": last_30})
-        status_map = {p["date"]: p["status"] for p in prog}
-        df["status"] = df["date"].apply(lambda d: 1 if status_map.get(d) == "done" else 0)
+        # Last 30 days for every habit is already in the snapshot — just pick the row
+        matrix = page["progress_matrix"]
+        status = matrix.loc[selected_id].to_numpy()
 
         st.markdown("**Last 30 days (1 = done)**")
-        fig, ax = plt.subplots(figsize=(8, 2.5))
-        ax.plot(df["date"], df["status"], marker="o")
-        ax.set_ylim(-0.1, 1.1)
-        ax.set_yticks([0, 1])
-        ax.set_yticklabels(["miss", "done"])
-        ax.set_xlabel("Date")
-        ax.set_xticks(df["date"].iloc[::5])  # show fewer x labels
-        ax.tick_params(axis='x', rotation=45)
-        st.pyplot(fig)
+        if NATIVE_CHARTS:
+            # Hand-written Vega-Lite spec: skips building an Altair chart every rerun
+            st.vega_lite_chart(pd.DataFrame({"date": matrix.columns, "done": status}), PROGRESS_CHART_SPEC,
+                               width="stretch")
+        else:
+            png = render_progress_chart(selected_id, tuple(matrix.columns), tuple(status.tolist()))
+            st.image(png, width="stretch")
 
 
     # --- Leaderboard ---
     st.subheader("Leaderboard")
-    lb = database.get_leaderboard()
+    lb = page["leaderboard"]
     if lb:
         st.table(lb)
+        if page["rank"]:
+            st.caption(f"Your rank: #{page['rank']}")
     else:
         st.write("No users yet.")
 
@@ -185,11 +329,11 @@ elif menu == "✅ Habit Tracker":
     ##streak freeze
 
     st.markdown("## 🛒 Streak Freeze Shop")
-    dashboard = dashboard = database.get_user_dashboard(user["id"])
+    dashboard = dash
     col1, col2 = st.columns(2)
 
     with col1:
-        st.metric("⭐ XP", dashboard["xp"])
+        st.metric("⭐ XP", dashboard["xp"] + pending_xp)
 
     with col2:
         st.metric("❄️ Streak Freezes", dashboard["streak_freeze"])
@@ -198,18 +342,23 @@ elif menu == "✅ Habit Tracker":
         if dashboard["xp"] >= 50:
             database.buy_streak_freeze(user["id"], cost=50)
             st.success("You bought a ❄️ Streak Freeze!")
-            st.rerun()  # 🔥 this reloads and fetches updated values
+            rerun()  # 🔥 this reloads and fetches updated values
         else:
             st.error("Not enough XP to buy a streak freeze.")
 
     # --- Daily Log ---
-    st.markdown("### 📅 Daily Activity Log (last 7 days)")
-
-    log = database.get_user_progress_log(user["id"], days=7)
+    st.markdown("### 📅 Daily Activity Log")
+
+    # The snapshot holds the newest page; "Load more" pages are kept until new activity shifts it
+    first = page["log"]
+    more = st.session_state.get("log_more")
+    if more is None or more["anchor"] != first["next"]:
+        more = st.session_state.log_more = {"anchor": first["next"], "rows": [], "next": first["next"]}
+    log = first["rows"] + more["rows"]
     if not log:
         st.info("No activity recorded yet.")
     else:
-        df = pd.DataFrame(log)
+        df = pd.DataFrame(log).drop(columns=["id"])
         df["date"] = pd.to_datetime(df["date"]).dt.date
         df["completed_at"] = pd.to_datetime(df["completed_at"]).dt.strftime("%H:%M:%S")
 
@@ -219,6 +368,8 @@ elif menu == "✅ Habit Tracker":
             "status": "Status",
             "completed_at": "Time"
         }))
+        if more["next"] is not None:
+            st.button("Load more", key="log-more", on_click=load_more_log, args=(user["id"],))
 
 
 # ===========================
@@ -227,7 +378,7 @@ elif menu == "✅ Habit Tracker":
 elif menu == "💰 Finance Tracker":
     if not st.session_state.user:
         st.warning("Please log in from the sidebar first.")
-        st.stop()
+        stop()
 
     user = st.session_state.user
     st.header("💰 Finance Tracker")
@@ -242,7 +393,7 @@ elif menu == "💰 Finance Tracker":
         if submitted:
             database.save_finance(user["id"], salary, emi, debt)
             st.success("Finance info saved.")
-            st.rerun()
+            rerun()
 
     # --- Retrieve finance info ---
     finance = database.get_finance(user["id"])
@@ -257,10 +408,10 @@ elif menu == "💰 Finance Tracker":
         if st.button("Add Payment"):
             database.add_payment(user["id"], payment_amt)
             st.success(f"Payment of {payment_amt} recorded!")
-            st.rerun()
+            rerun()
 
-        # --- Fetch total paid so far ---
-        total_paid = float(database.get_total_payments(user["id"]))
+        # --- Total paid so far (running balance kept on the finance row) ---
+        total_paid = float(finance["total_paid"])
 
         # --- Remaining debt ---
         remaining_debt = max(0, debt - total_paid)
@@ -278,9 +429,55 @@ elif menu == "💰 Finance Tracker":
             "Value": [salary, emi, debt, total_paid, remaining_debt, months_needed]
         })
 
+        # --- Payoff projection (closed-form, recomputed on every slider change) ---
+        st.subheader("📈 Payoff Projection")
+        if remaining_debt <= 0:
+            st.success("Debt cleared 🎉")
+        else:
+            pd = load_pandas()
+            c1, c2, c3 = st.columns(3)
+            rate_pct = c1.slider("Interest rate (% per year)", 0.0, 30.0, 0.0, step=0.5)
+            extra = c2.slider("Extra payment per month", 0.0, float(max(emi * 2, 1000.0)), 0.0, step=100.0)
+            salary_pct = c3.slider("Extra share of salary (%)", 0, 50, 0)
+            rate = rate_pct / 100
+
+            scenarios = {
+                "EMI only": (emi, rate),
+                "EMI + extra": (emi + extra, rate),
+                f"EMI + extra + {salary_pct}% of salary": (emi + extra + salary * salary_pct / 100, rate),
+            }
+            pace = database.get_average_monthly_payment(user["id"], months=6)
+            if pace > 0:
+                scenarios["Recent payments (6-month average)"] = (pace, rate)
+            result = projection.project(remaining_debt, scenarios)
+
+            chosen = result["summary"][f"EMI + extra + {salary_pct}% of salary"]
+            m1, m2, m3 = st.columns(3)
+            if chosen["months"] is None:
+                m1.metric("Months to clear", "never")
+                st.warning("At this payment the interest outgrows the installments.")
+            else:
+                m1.metric("Months to clear", chosen["months"])
+                m2.metric("Debt-free by", chosen["payoff_date"].strftime("%b %Y"))
+                m3.metric("Interest paid", f"{chosen['interest']:,.0f}")
+            st.line_chart(pd.DataFrame(result["schedule"], index=pd.to_datetime(result["dates"])))
+
+            with st.expander("What-if: months to clear by extra payment and interest rate"):
+                extras = [0.0, 0.25, 0.5, 1.0]           # × EMI on top of the EMI
+                rates = [0.0, 0.05, 0.10, 0.15, 0.20]
+                grid = projection.months_to_payoff(
+                    remaining_debt,
+                    [[emi * (1 + x)] for x in extras],
+                    [rates],
+                )
+                st.table(pd.DataFrame(
+                    [[("never" if m == float("inf") else int(m)) for m in row] for row in grid],
+                    index=[f"EMI + {x:.0%}" for x in extras],
+                    columns=[f"{r:.0%} interest" for r in rates],
+                ))
 
 
-
-
-
-
+# ===========================
+# --- DEVELOPER PANEL ---
+# ===========================
+finish_profile()
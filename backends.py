@@ -0,0 +1,273 @@
+# backends.py
+"""
+Storage backends for database.py.
+
+MySQLBackend talks to a MySQL server through pymysql. SQLiteBackend keeps
+everything in a local file in WAL mode: no network hop per query, which
+suits single-node deployments, tests and offline benchmarks.
+Choose with DUO_DB_BACKEND=mysql|sqlite (see from_env).
+
+Query functions write portable SQL with %s placeholders and pass dates and
+timestamps as parameters instead of calling CURDATE()/NOW(). The few
+dialect-specific fragments come from attributes on the backend
+(for_update, insert_ignore, ignore_duplicate, upsert_add, upsert_set).
+"""
+import datetime
+import decimal
+import functools
+import os
+import re
+import sqlite3
+
+
+class MySQLBackend:
+    name = "mysql"
+    for_update = "FOR UPDATE"
+    insert_ignore = "INSERT IGNORE"
+    ignore_duplicate = "ON DUPLICATE KEY UPDATE id = id"
+
+    def __init__(self, host="localhost", port=3306, user="root", password="1234", database="habit_tracker"):
+        self.connect_kwargs = {
+            "host": host,
+            "port": port,
+            "user": user,
+            "password": password,
+            "database": database,
+        }
+
+    def connect(self):
+        import pymysql
+        from pymysql.constants import CLIENT
+        return pymysql.connect(
+            autocommit=True,
+            cursorclass=pymysql.cursors.DictCursor,
+            client_flag=CLIENT.MULTI_STATEMENTS,  # lets run_batch send several SELECTs in one round trip
+            **self.connect_kwargs
+        )
+
+    @property
+    def disconnect_errors(self):
+        import pymysql
+        return (pymysql.OperationalError, pymysql.InterfaceError)
+
+    def is_open(self, conn):
+        return conn.open
+
+    def ping(self, conn):
+        import pymysql
+        try:
+            conn.ping(reconnect=True)
+            return True
+        except pymysql.Error:
+            return False
+
+    def upsert_add(self, keys, columns):
+        """Conflict clause that adds the inserted `columns` to the existing row's."""
+        return "ON DUPLICATE KEY UPDATE " + ", ".join(f"{c} = {c} + VALUES({c})" for c in columns)
+
+    def upsert_set(self, keys, columns):
+        """Conflict clause that overwrites the existing row's `columns` with the inserted ones."""
+        return "ON DUPLICATE KEY UPDATE " + ", ".join(f"{c} = VALUES({c})" for c in columns)
+
+    def stream_cursor(self, conn):
+        """Unbuffered cursor: rows stay on the server until fetched."""
+        import pymysql
+        return conn.cursor(pymysql.cursors.SSDictCursor)
+
+    def run_batch(self, cursor, statements):
+        sql = ";\n".join(cursor.mogrify(q, args) for q, args in statements)
+        cursor.execute(sql)
+        results = [list(cursor.fetchall())]
+        while cursor.nextset():
+            results.append(list(cursor.fetchall()))
+        return results
+
+    def explain(self, cursor, sql, args):
+        """EXPLAIN rows: table, type (ALL = full scan), key, possible_keys, rows."""
+        cursor.execute("EXPLAIN " + sql, args)
+        return cursor.fetchall()
+
+
+class SQLiteBackend:
+    """
+    Embedded SQLite database file in WAL mode.
+    Use a real path: every pooled connection opens the file separately,
+    so a plain ':memory:' database would not be shared between them.
+    """
+    name = "sqlite"
+    for_update = ""  # transactions start with BEGIN IMMEDIATE, which already serializes writers
+    insert_ignore = "INSERT OR IGNORE"
+    ignore_duplicate = "ON CONFLICT DO NOTHING"
+
+    def __init__(self, path="duo_tracker.db", busy_timeout_ms=5000):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+
+    def connect(self):
+        raw = sqlite3.connect(
+            self.path,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            isolation_level=None,       # autocommit unless begin() is called
+            check_same_thread=False,    # the pool hands connections between threads
+        )
+        raw.row_factory = _dict_row
+        raw.execute("PRAGMA journal_mode=WAL")
+        raw.execute("PRAGMA synchronous=NORMAL")
+        raw.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        return _SQLiteConnection(raw)
+
+    disconnect_errors = (sqlite3.OperationalError, sqlite3.ProgrammingError)
+
+    def is_open(self, conn):
+        return conn.open
+
+    def ping(self, conn):
+        return conn.open
+
+    def upsert_add(self, keys, columns):
+        return (f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET "
+                + ", ".join(f"{c} = {c} + excluded.{c}" for c in columns))
+
+    def upsert_set(self, keys, columns):
+        return (f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET "
+                + ", ".join(f"{c} = excluded.{c}" for c in columns))
+
+    def stream_cursor(self, conn):
+        return conn.cursor()  # sqlite3 already steps through results as they are fetched
+
+    def run_batch(self, cursor, statements):
+        # No round trips to save in-process: just run them in order
+        results = []
+        for q, args in statements:
+            cursor.execute(q, args)
+            results.append(cursor.fetchall())
+        return results
+
+    def explain(self, cursor, sql, args):
+        """EXPLAIN QUERY PLAN, normalized to the MySQL EXPLAIN columns we check."""
+        cursor.execute("EXPLAIN QUERY PLAN " + sql, args)
+        rows = []
+        for step in cursor.fetchall():
+            m = _SQLITE_PLAN.match(step["detail"])
+            if not m:
+                continue  # subquery headers, temp b-trees, ...
+            op, table, index = m.group(1), m.group(2), m.group(4)
+            uses_pk = "PRIMARY KEY" in step["detail"]
+            if op == "SCAN":
+                kind = "index" if index else "ALL"
+            else:
+                kind = "eq_ref" if uses_pk else "ref"
+            rows.append({
+                "table": table,
+                "type": kind,
+                "key": "PRIMARY" if uses_pk else index,
+                "possible_keys": None,  # SQLite scans only when no index applies
+                "rows": None,
+                "detail": step["detail"],
+            })
+        return rows
+
+
+_SQLITE_PLAN = re.compile(r"^(SCAN|SEARCH) (\S+)(?: AS \S+)?(?: USING (COVERING )?INDEX (\S+))?")
+
+
+def from_env():
+    """Backend chosen by DUO_DB_BACKEND (default mysql) and the DUO_DB_* settings."""
+    kind = os.environ.get("DUO_DB_BACKEND", "mysql").lower()
+    if kind == "mysql":
+        return MySQLBackend(
+            host=os.environ.get("DUO_DB_HOST", "localhost"),
+            port=int(os.environ.get("DUO_DB_PORT", "3306")),
+            user=os.environ.get("DUO_DB_USER", "root"),
+            password=os.environ.get("DUO_DB_PASSWORD", "1234"),
+            database=os.environ.get("DUO_DB_NAME", "habit_tracker"),
+        )
+    if kind == "sqlite":
+        return SQLiteBackend(os.environ.get("DUO_DB_PATH", "duo_tracker.db"))
+    raise ValueError(f"unknown DUO_DB_BACKEND {kind!r} (expected 'mysql' or 'sqlite')")
+
+
+# --- SQLite adapter: make sqlite3 look like the pymysql DictCursor API ---
+
+def _dict_row(cursor, row):
+    return {col[0]: value for col, value in zip(cursor.description, row)}
+
+
+@functools.lru_cache(maxsize=512)
+def _qmark(sql):
+    """pymysql paramstyle (%s, %% escapes) -> sqlite3 qmark style."""
+    return sql.replace("%%", "\0").replace("%s", "?").replace("\0", "%")
+
+
+def _params(args):
+    if args is None:
+        return ()
+    return args
+
+
+class _SQLiteConnection:
+    def __init__(self, raw):
+        self.raw = raw
+        self.open = True
+
+    def cursor(self):
+        return _SQLiteCursor(self.raw.cursor())
+
+    def begin(self):
+        self.raw.execute("BEGIN IMMEDIATE")
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def close(self):
+        self.open = False
+        self.raw.close()
+
+
+class _SQLiteCursor:
+    def __init__(self, raw):
+        self._raw = raw
+
+    def execute(self, sql, args=None):
+        self._raw.execute(_qmark(sql), _params(args))
+        return self._raw.rowcount
+
+    def executemany(self, sql, seq_of_args):
+        self._raw.executemany(_qmark(sql), seq_of_args)
+        return self._raw.rowcount
+
+    def fetchone(self):
+        return self._raw.fetchone()
+
+    def fetchmany(self, size):
+        return self._raw.fetchmany(size)
+
+    def fetchall(self):
+        return self._raw.fetchall()
+
+    @property
+    def rowcount(self):
+        return self._raw.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._raw.lastrowid
+
+    def close(self):
+        self._raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+sqlite3.register_adapter(datetime.date, lambda d: d.isoformat())
+sqlite3.register_adapter(datetime.datetime, lambda dt: dt.isoformat(" "))
+sqlite3.register_adapter(decimal.Decimal, float)
+sqlite3.register_converter("DATE", lambda b: datetime.date.fromisoformat(b.decode()))
+sqlite3.register_converter("DATETIME", lambda b: datetime.datetime.fromisoformat(b.decode()))
@@ -0,0 +1,259 @@
+# benchmarks/hotpaths.py
+"""
+Latency and throughput of the database.py / ai_module.py hot paths.
+
+Seeds a synthetic dataset (see seed.py) into a throwaway SQLite file
+unless --db points at an existing one, then:
+  1. times each query function on random users/habits,
+  2. replays the Habit Tracker page with N concurrent sessions.
+
+    python benchmarks/hotpaths.py --users 200 --years 2 --sessions 1,4,16
+    python benchmarks/hotpaths.py --save run.json
+    python benchmarks/hotpaths.py --compare run.json [--tolerance 0.25]
+
+The per-user cache is cleared before every call unless --cache is given,
+so by default the numbers are database cost. --compare exits non-zero
+when a p95 is worse than the baseline by more than the tolerance.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import ai_module
+import backends
+import database
+import seed as seeding
+
+
+class Context:
+    """Random picks of seeded users and habits for the benchmark cases."""
+
+    def __init__(self, rng_seed=7):
+        self.rng = random.Random(rng_seed)
+        with database.get_cursor() as cursor:
+            cursor.execute("SELECT id, user_id FROM habits")
+            rows = cursor.fetchall()
+        self.habits = [r["id"] for r in rows]
+        self.user_ids = sorted({r["user_id"] for r in rows})
+        self.habits_by_user = {}
+        for r in rows:
+            self.habits_by_user.setdefault(r["user_id"], []).append(r["id"])
+        self._unlogged = list(self.habits)  # habits with no entry today, for write cases
+        self.rng.shuffle(self._unlogged)
+        self._lock = threading.Lock()
+
+    def user(self):
+        return self.rng.choice(self.user_ids)
+
+    def habit(self):
+        return self.rng.choice(self.habits)
+
+    def unlogged_habit(self):
+        with self._lock:
+            return self._unlogged.pop() if self._unlogged else self.rng.choice(self.habits)
+
+
+def cases(ctx):
+    """(name, callable) for every function timed in isolation."""
+    return [
+        ("get_habit", lambda: database.get_habit(ctx.habit())),
+        ("get_progress", lambda: database.get_progress(ctx.habit())),
+        ("get_streak", lambda: database.get_streak(ctx.habit())),
+        ("get_leaderboard", lambda: database.get_leaderboard()),
+        ("get_user_rank", lambda: database.get_user_rank(ctx.user())),
+        ("get_daily_streak", lambda: database.get_daily_streak(ctx.user())),
+        ("get_user_progress_count", lambda: database.get_user_progress_count(ctx.user())),
+        ("get_user_progress_log", lambda: database.get_user_progress_log(ctx.user())),
+        ("get_user_dashboard", lambda: database.get_user_dashboard(ctx.user())),
+        ("get_habits", lambda: database.get_habits(ctx.user())),
+        ("get_progress_matrix", lambda: database.get_progress_matrix(ctx.user())),
+        ("get_habit_tracker_page", lambda: database.get_habit_tracker_page(ctx.user())),
+        ("get_finance", lambda: database.get_finance(ctx.user())),
+        ("get_total_payments", lambda: database.get_total_payments(ctx.user())),
+        ("get_streak_freeze_usage", lambda: database.get_streak_freeze_usage(ctx.user())),
+        ("ai.suggest_reminder_time", lambda: ai_module.suggest_reminder_time(ctx.habit())),
+        ("ai.predict_dropout_risk", lambda: ai_module.predict_dropout_risk(ctx.habit())),
+        ("mark_habit_done", lambda: database.mark_habit_done(ctx.unlogged_habit())),
+        ("mark_habit_skipped", lambda: database.mark_habit_skipped(ctx.unlogged_habit())),
+        ("add_payment", lambda: database.add_payment(ctx.user(), 100)),
+        ("buy_streak_freeze", lambda: database.buy_streak_freeze(ctx.user(), cost=1)),
+        ("add_habit", lambda: database.add_habit(ctx.user(), "bench habit")),
+    ]
+
+
+# The page as app.py renders it today, and the eight separate calls it used to make
+def page_snapshot(ctx, user_id):
+    database.get_habit_tracker_page(user_id)
+
+
+def page_separate(ctx, user_id):
+    habit_id = ctx.rng.choice(ctx.habits_by_user[user_id])
+    database.get_user_dashboard(user_id)
+    database.get_daily_streak(user_id)
+    database.get_user_progress_count(user_id)
+    database.get_habits(user_id)
+    database.get_progress(habit_id, days=30)
+    database.get_leaderboard()
+    database.get_user_progress_log(user_id, days=7)
+    database.get_user_dashboard(user_id)
+
+
+SEQUENCES = {"snapshot": page_snapshot, "separate": page_separate}
+
+
+def _reset_caches(enabled):
+    if not enabled:
+        database.user_cache.clear()
+        database.histories.invalidate()
+        database.leaderboard.invalidate()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[k]
+
+
+def summarize(samples_ms, wall_s=None):
+    total = sum(samples_ms) / 1000
+    return {
+        "n": len(samples_ms),
+        "p50_ms": percentile(samples_ms, 50),
+        "p95_ms": percentile(samples_ms, 95),
+        "p99_ms": percentile(samples_ms, 99),
+        "mean_ms": sum(samples_ms) / len(samples_ms) if samples_ms else 0.0,
+        "ops_per_s": len(samples_ms) / (wall_s or total) if samples_ms and (wall_s or total) else 0.0,
+    }
+
+
+def time_functions(ctx, iterations, use_cache):
+    results = {}
+    for name, call in cases(ctx):
+        samples = []
+        for _ in range(iterations):
+            _reset_caches(use_cache)
+            t = time.perf_counter()
+            call()
+            samples.append((time.perf_counter() - t) * 1000)
+        results[name] = summarize(samples)
+    return results
+
+
+def run_sessions(ctx, sessions, duration, sequence, use_cache, click_rate=0.1):
+    """
+    `sessions` threads replay the page for `duration` seconds. Each page view
+    is followed by a Done click with probability `click_rate`.
+    """
+    latencies = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    replay = SEQUENCES[sequence]
+
+    def session(seed):
+        rng = random.Random(seed)
+        user_id = rng.choice(ctx.user_ids)
+        mine = []
+        while time.perf_counter() < deadline:
+            _reset_caches(use_cache)
+            t = time.perf_counter()
+            replay(ctx, user_id)
+            mine.append((time.perf_counter() - t) * 1000)
+            if rng.random() < click_rate:
+                database.mark_habit_done(rng.choice(ctx.habits_by_user[user_id]))
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return summarize(latencies, wall_s=time.perf_counter() - start)
+
+
+def print_table(title, results, baseline, tolerance):
+    regressions = []
+    print(f"\n{title}")
+    print(f"{'name':32} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ops/s':>10} {'base p95':>9}")
+    for name, r in results.items():
+        base = baseline.get(name, {}).get("p95_ms")
+        flag = ""
+        if base is not None and r["p95_ms"] > base * (1 + tolerance):
+            regressions.append(name)
+            flag = "  REGRESSION"
+        base_txt = f"{base:9.2f}" if base is not None else f"{'-':>9}"
+        print(f"{name:32} {r['n']:6d} {r['p50_ms']:9.2f} {r['p95_ms']:9.2f} {r['p99_ms']:9.2f} "
+              f"{r['ops_per_s']:10.1f} {base_txt}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="existing SQLite file to benchmark (skips seeding)")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--habits", type=int, default=5)
+    parser.add_argument("--years", type=float, default=1.0)
+    parser.add_argument("--payments", type=int, default=50)
+    parser.add_argument("--iterations", type=int, default=200, help="calls per function")
+    parser.add_argument("--sessions", default="1,4,16", help="comma-separated concurrent session counts")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per concurrency level")
+    parser.add_argument("--sequence", choices=sorted(SEQUENCES), default="snapshot")
+    parser.add_argument("--cache", action="store_true", help="keep the in-process caches warm")
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON from an earlier --save")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    session_counts = [int(n) for n in args.sessions.split(",") if n]
+    pool_size = max(session_counts + [database.POOL_SIZE])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db or os.path.join(tmp, "bench.db")
+        if not args.db:
+            seeding.use_sqlite(path)
+        database.use_backend(backends.SQLiteBackend(path), size=pool_size)
+        if not args.db:
+            t = time.perf_counter()
+            seeding.seed(users=args.users, habits_per_user=args.habits, years=args.years,
+                         payments_per_user=args.payments)
+            print(f"Seeded {args.users} users x {args.habits} habits x {args.years} years "
+                  f"in {time.perf_counter() - t:.1f}s")
+
+        ctx = Context()
+        functions = time_functions(ctx, args.iterations, args.cache)
+        concurrency = {
+            f"{args.sequence} page x{n} sessions": run_sessions(ctx, n, args.duration, args.sequence, args.cache)
+            for n in session_counts
+        }
+        database.pool.close_all()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            saved = json.load(f)
+        baseline = {**saved.get("functions", {}), **saved.get("concurrency", {})}
+
+    regressions = print_table("Per-function latency", functions, baseline, args.tolerance)
+    regressions += print_table("Concurrent page sessions", concurrency, baseline, args.tolerance)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"functions": functions, "concurrency": concurrency}, f, indent=2)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+# benchmarks/scaling.py
+"""
+Throughput of the multi-worker mode (router.py) as workers are added.
+
+For 1, 2, 4, ... workers this starts the real router (with its cache
+broker) on a free port and drives HTTP traffic through it for --duration
+seconds, then reports page views per second. Streamlit's page protocol
+is a WebSocket session that is hard to script, so each worker is a small
+HTTP server in front of the same database.py calls the Habit Tracker
+page makes (`--serve`, below): GET /page?uid= answers
+get_habit_tracker_page() as JSON and POST /done?uid=&habit= is a Done
+click. Everything else is what production runs: the router picks the
+worker from ?uid=, proxies the bytes both ways, restarts dead workers,
+and the workers share cache changes through the broker.
+
+Load comes from --clients processes with --sessions threads each. A
+session visits a random user: it opens one keep-alive connection through
+the router, loads the page --views times (a Done click follows a view
+with probability --click-rate) and hangs up. Every user's page is loaded
+once through the router before the clock starts, as a running worker's
+caches would be warm.
+
+    python benchmarks/scaling.py --workers 1,2,4 --duration 10
+    python benchmarks/scaling.py --db bench.db --workers 1,2,4,8 --clients 4
+
+The router, the clients and the workers share this machine's cores, and
+the router is one asyncio process, so views stop scaling once workers
+plus clients outnumber the cores or the router saturates one core,
+whichever comes first. Done clicks do not scale at all, since SQLite
+takes one writer at a time.
+"""
+import argparse
+import asyncio
+import http.client
+import http.server
+import json
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database
+import router
+import seed as seeding
+from hotpaths import percentile
+
+
+def _free_port(count=1):
+    """A port with the `count` - 1 ports after it free too (the router puts its workers there)."""
+    while True:
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        if port + count < 65536 and all(_port_free(port + i) for i in range(1, count)):
+            return port
+
+
+def _port_free(port):
+    with socket.socket() as s:
+        try:
+            s.bind(("127.0.0.1", port))
+        except OSError:
+            return False
+        return True
+
+
+# --- Workers (run by the router) ---
+
+class PageHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, as the browser's connection to the router
+
+    def do_GET(self):
+        query = self._query()
+        self._reply(database.get_habit_tracker_page(int(query["uid"])))
+
+    def do_POST(self):
+        query = self._query()
+        self._reply(database.mark_habit_done(int(query["habit"])))
+
+    def _query(self):
+        return {k: v[0] for k, v in urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query).items()}
+
+    def _reply(self, payload):
+        body = json.dumps(payload, default=str).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port):
+    """One worker: answer page loads and Done clicks on 127.0.0.1:port until killed."""
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), PageHandler)
+    server.daemon_threads = True
+    server.serve_forever()
+
+
+# --- Router ---
+
+def route(workers, port, broker_port):
+    """The router with `workers` page servers behind it, until SIGTERM (which also stops the workers)."""
+    r = router.Router(workers, port, broker_port,
+                      command=[sys.executable, os.path.abspath(__file__), "--serve", "{port}"])
+
+    async def main():
+        task = asyncio.ensure_future(r.run())
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(main())
+
+
+def wait_until_serving(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"nothing listening on port {port} after {timeout}s")
+
+
+# --- Load ---
+
+def client(port, habits_by_user, sessions, views, click_rate, seed, barrier, duration, results):
+    """One load process: `sessions` threads visiting random users through the router."""
+    user_ids = sorted(habits_by_user)
+    latencies, clicks = [], [0]
+    lock = threading.Lock()
+
+    def session(seed, deadline):
+        rng = random.Random(seed)
+        mine, clicked = [], 0
+        while time.perf_counter() < deadline:
+            user_id = rng.choice(user_ids)
+            conn = http.client.HTTPConnection("127.0.0.1", port)
+            try:
+                for _ in range(views):
+                    t = time.perf_counter()
+                    conn.request("GET", f"/page?uid={user_id}")
+                    conn.getresponse().read()
+                    mine.append((time.perf_counter() - t) * 1000)
+                    if rng.random() < click_rate:
+                        habit_id = rng.choice(habits_by_user[user_id])
+                        conn.request("POST", f"/done?uid={user_id}&habit={habit_id}")
+                        conn.getresponse().read()
+                        clicked += 1
+                    if time.perf_counter() >= deadline:
+                        break
+            finally:
+                conn.close()
+        with lock:
+            latencies.extend(mine)
+            clicks[0] += clicked
+
+    barrier.wait()
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=session, args=(seed * 1000 + i, deadline)) for i in range(sessions)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    results.put((latencies, clicks[0]))
+
+
+def run(workers, habits_by_user, args):
+    """Page views/s and latency percentiles through the router with `workers` workers."""
+    mp = multiprocessing.get_context("spawn")  # fresh interpreters, like router.py's workers
+    port = _free_port(workers + 1)
+    broker_port = _free_port()
+    while port <= broker_port <= port + workers:
+        broker_port = _free_port()
+    routing = mp.Process(target=route, args=(workers, port, broker_port))
+    routing.start()
+    try:
+        for i in range(workers + 1):
+            wait_until_serving(port + i)
+        # Warm every worker's caches for the users pinned to it, through the router
+        for user_id in habits_by_user:
+            conn = http.client.HTTPConnection("127.0.0.1", port)
+            conn.request("GET", f"/page?uid={user_id}")
+            conn.getresponse().read()
+            conn.close()
+
+        barrier = mp.Barrier(args.clients)
+        results = mp.Queue()
+        clients = [
+            mp.Process(target=client, args=(port, habits_by_user, args.sessions, args.views, args.click_rate,
+                                            i, barrier, args.duration, results))
+            for i in range(args.clients)
+        ]
+        for c in clients:
+            c.start()
+        latencies, clicks = [], 0
+        for _ in clients:
+            mine, clicked = results.get()
+            latencies += mine
+            clicks += clicked
+        for c in clients:
+            c.join()
+    finally:
+        routing.terminate()  # the router stops its workers on the way out
+        routing.join()
+    return {
+        "workers": workers,
+        "views": len(latencies),
+        "clicks": clicks,
+        "views_per_s": len(latencies) / args.duration,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="existing SQLite file to benchmark (skips seeding)")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--habits", type=int, default=5)
+    parser.add_argument("--years", type=float, default=1.0)
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--clients", type=int, default=2, help="load generator processes")
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent sessions per load process")
+    parser.add_argument("--views", type=int, default=5, help="page loads per visit (one connection)")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per worker count")
+    parser.add_argument("--click-rate", type=float, default=0.1, help="Done clicks per page view")
+    parser.add_argument("--serve", type=int, metavar="PORT", help=argparse.SUPPRESS)  # a worker, started by route()
+    args = parser.parse_args(argv)
+    if args.serve:
+        return serve(args.serve)
+
+    worker_counts = [int(n) for n in args.workers.split(",") if n]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db or os.path.join(tmp, "bench.db")
+        if not args.db:
+            seeding.use_sqlite(path)
+            t = time.perf_counter()
+            seeding.seed(users=args.users, habits_per_user=args.habits, years=args.years)
+            print(f"Seeded {args.users} users x {args.habits} habits x {args.years} years "
+                  f"in {time.perf_counter() - t:.1f}s")
+        else:
+            seeding.use_sqlite(path)
+        with database.get_cursor() as cursor:
+            cursor.execute("SELECT id, user_id FROM habits")
+            rows = cursor.fetchall()
+        database.pool.close_all()
+        habits_by_user = {}
+        for r in rows:
+            habits_by_user.setdefault(r["user_id"], []).append(r["id"])
+
+        # The router and its workers read their configuration from the environment
+        os.environ.update(DUO_DB_BACKEND="sqlite", DUO_DB_PATH=path, DUO_WRITE_JOURNAL="",
+                          DUO_DB_POOL_SIZE=str(args.sessions * args.clients))
+
+        print(f"\n{'workers':>7} {'views':>8} {'clicks':>7} {'views/s':>9} {'speed-up':>9} {'p50 ms':>8} {'p95 ms':>8}"
+              f"   ({os.cpu_count()} cores, {args.clients}x{args.sessions} sessions, {args.duration:g}s each)")
+        base = None
+        for n in worker_counts:
+            r = run(n, habits_by_user, args)
+            base = base or r["views_per_s"]
+            print(f"{n:7d} {r['views']:8d} {r['clicks']:7d} {r['views_per_s']:9.1f} {r['views_per_s'] / base:8.2f}x "
+                  f"{r['p50_ms']:8.2f} {r['p95_ms']:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# benchmarks/seed.py
+"""
+Synthetic dataset for benchmarks: users with habits, years of daily
+progress, finance rows and payments. Writes through the configured
+database backend (point it at a scratch database).
+
+    python benchmarks/seed.py --db bench.db --users 1000 --habits 5 --years 2
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import backends
+import database
+import migrations
+
+
+def seed(users=100, habits_per_user=5, years=1.0, payments_per_user=50,
+         done_rate=0.7, skip_rate=0.1, rng_seed=42):
+    """
+    Populate an empty, migrated database. Each user is written in one
+    transaction with multi-row inserts. Returns the new user ids.
+    """
+    rng = random.Random(rng_seed)
+    today = datetime.date.today()
+    days = int(years * 365)
+    user_ids = []
+
+    for i in range(users):
+        with database.transaction() as cursor:
+            cursor.execute(
+                "INSERT INTO users (username, email, xp, streak_freeze) VALUES (%s, %s, 0, %s)",
+                (f"bench-{i:06d}", f"bench{i}@example.com", rng.randint(0, 3))
+            )
+            user_id = cursor.lastrowid
+            user_ids.append(user_id)
+
+            done_total = 0
+            for h in range(habits_per_user):
+                cursor.execute(
+                    "INSERT INTO habits (user_id, name, frequency, target_time) VALUES (%s, %s, %s, %s)",
+                    (user_id, f"habit {h}", "daily" if rng.random() < 0.8 else "weekly", f"{rng.randint(5, 22):02d}:00")
+                )
+                habit_id = cursor.lastrowid
+                usual_hour = rng.randint(6, 21)
+                rows = []
+                # Start yesterday: today stays free so write benchmarks can log it
+                for d in range(1, days + 1):
+                    r = rng.random()
+                    if r < done_rate:
+                        status = "done"
+                    elif r < done_rate + skip_rate:
+                        status = "skipped"
+                    else:
+                        continue
+                    day = today - datetime.timedelta(days=d)
+                    hour = min(23, max(0, int(rng.gauss(usual_hour, 1.5))))
+                    completed = datetime.datetime.combine(day, datetime.time(hour, rng.randint(0, 59)))
+                    rows.append((user_id, habit_id, status, completed, day))
+                done_total += sum(1 for row in rows if row[2] == "done")
+                cursor.executemany(
+                    "INSERT INTO progress (user_id, habit_id, status, completed_at, log_date) VALUES (%s, %s, %s, %s, %s)",
+                    rows
+                )
+
+            cursor.execute("UPDATE users SET xp=%s WHERE id=%s", (done_total * 10, user_id))
+            cursor.execute(
+                "INSERT INTO finance (user_id, salary, emi, debt) VALUES (%s, %s, %s, %s)",
+                (user_id, rng.randint(20, 200) * 1000, rng.randint(1, 20) * 1000, rng.randint(50, 2000) * 1000)
+            )
+            cursor.executemany(
+                "INSERT INTO finance_payments (user_id, amount, payment_date) VALUES (%s, %s, %s)",
+                [(user_id, rng.randint(1, 50) * 100, today - datetime.timedelta(days=rng.randint(1, days or 1)))
+                 for _ in range(payments_per_user)]
+            )
+
+    database.rebuild_rollups()
+    database.recompute_daily_streaks()
+    database.reconcile_finance(fix=True)
+    return user_ids
+
+
+def use_sqlite(path):
+    """Point database.py at a SQLite file and bring its schema up to date."""
+    database.use_backend(backends.SQLiteBackend(path))
+    migrations.migrate()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="SQLite file to create (default: the DUO_DB_* backend)")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--habits", type=int, default=5, help="habits per user")
+    parser.add_argument("--years", type=float, default=1.0, help="years of daily progress per habit")
+    parser.add_argument("--payments", type=int, default=50, help="finance_payments rows per user")
+    args = parser.parse_args(argv)
+
+    if args.db:
+        use_sqlite(args.db)
+    else:
+        migrations.migrate()
+    t = time.perf_counter()
+    ids = seed(users=args.users, habits_per_user=args.habits, years=args.years, payments_per_user=args.payments)
+    print(f"Seeded {len(ids)} users in {time.perf_counter() - t:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# benchmarks/startup.py
+"""
+Cold-start benchmark: import time of the app's modules and time to first
+render of each page, each measured in a fresh interpreter against a
+throwaway SQLite database.
+
+    python benchmarks/startup.py [--runs 5] [--save startup.json]
+    python benchmarks/startup.py --compare startup.json [--tolerance 0.5]
+
+With --compare, exits non-zero when any measurement is slower than the
+saved baseline by more than the tolerance (0.5 = 50%).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+IMPORTS = ["database", "ai_module", "streamlit", "pandas", "matplotlib.pyplot"]
+PAGES = ["🏠 Home", "✅ Habit Tracker", "💰 Finance Tracker"]
+
+IMPORT_SNIPPET = """
+import time
+t = time.perf_counter()
+import {module}
+print((time.perf_counter() - t) * 1000)
+"""
+
+# Streamlit itself is already loaded when a real server runs the script,
+# so only the script run (app imports + queries + rendering) is timed.
+RENDER_SNIPPET = """
+import json, time
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({app!r}, default_timeout=120)
+at.session_state["user"] = json.loads({user!r})
+at.session_state["nav"] = {page!r}
+t = time.perf_counter()
+at.run()
+elapsed = (time.perf_counter() - t) * 1000
+assert not at.exception, at.exception
+print(elapsed)
+"""
+
+
+def _child_ms(code, env):
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, env=env,
+        capture_output=True, text=True, check=True,
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def _seed(db_path):
+    """A user with a few habits and a month of history, so pages render real content."""
+    import datetime
+    import backends
+    import database
+    import migrations
+
+    database.use_backend(backends.SQLiteBackend(db_path))
+    migrations.migrate()
+    user = database.create_or_get_user("startup-bench")
+    today = datetime.date.today()
+    with database.get_cursor() as cursor:
+        for name in ("Run", "Read", "Meditate"):
+            cursor.execute("INSERT INTO habits (user_id, name) VALUES (%s, %s)", (user["id"], name))
+            habit_id = cursor.lastrowid
+            cursor.executemany(
+                "INSERT INTO progress (user_id, habit_id, status, completed_at, log_date) VALUES (%s, %s, 'done', %s, %s)",
+                [(user["id"], habit_id, datetime.datetime.combine(today - datetime.timedelta(days=d), datetime.time(8)),
+                  today - datetime.timedelta(days=d)) for d in range(1, 30, 2)]
+            )
+    database.rebuild_rollups(user["id"])
+    database.save_finance(user["id"], 50000, 5000, 120000)
+    return {"id": user["id"], "username": user["username"]}
+
+
+def measure(runs):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "startup.db")
+        user = _seed(db_path)
+        env = dict(os.environ, DUO_DB_BACKEND="sqlite", DUO_DB_PATH=db_path, PYTHONPATH=ROOT)
+
+        results = {}
+        for module in IMPORTS:
+            samples = [_child_ms(IMPORT_SNIPPET.format(module=module), env) for _ in range(runs)]
+            results[f"import {module}"] = samples
+        for page in PAGES:
+            code = RENDER_SNIPPET.format(app=os.path.join(ROOT, "app.py"), user=json.dumps(user), page=page)
+            samples = [_child_ms(code, env) for _ in range(runs)]
+            results[f"first render {page}"] = samples
+    return {name: {"median_ms": statistics.median(s), "min_ms": min(s)} for name, s in results.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per measurement")
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON from an earlier --save")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed slowdown vs baseline")
+    args = parser.parse_args(argv)
+
+    results = measure(args.runs)
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    regressions = []
+    print(f"{'measurement':40} {'median ms':>10} {'min ms':>10} {'baseline':>10}")
+    for name, r in results.items():
+        base = baseline.get(name, {}).get("median_ms")
+        note = f"{base:10.1f}" if base is not None else f"{'-':>10}"
+        if base is not None and r["median_ms"] > base * (1 + args.tolerance):
+            regressions.append(name)
+            note += "  REGRESSION"
+        print(f"{name:40} {r['median_ms']:10.1f} {r['min_ms']:10.1f} {note}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+# broker.py
+"""
+Cache changes shared between worker processes (see router.py).
+
+Every worker keeps its own caches (cache.py). A change one worker makes
+(an XP update, a progress write, an invalidation) is published here as a
+JSON line and forwarded to every other worker, which replays it on its
+own copy. A user pinned to worker 2 therefore sees an XP change that an
+admin job or another worker made without waiting for a TTL.
+
+The broker is a plain TCP fan-out on localhost and stores nothing. A
+worker that loses its connection clears its caches when it reconnects,
+since it may have missed changes in between; what it published while
+disconnected is kept and sent once it is back.
+
+    DUO_BROKER=127.0.0.1:8599    join this broker (unset: single process, nothing is published)
+
+    python broker.py [--port 8599]    run a broker on its own (router.py starts one itself)
+"""
+import argparse
+import asyncio
+import collections
+import json
+import logging
+import os
+import selectors
+import socket
+import threading
+import time
+
+DEFAULT_PORT = 8599
+MAX_BACKLOG = 8 * 1024 * 1024  # bytes queued for one slow worker before it is cut off
+
+log = logging.getLogger("duo.broker")
+
+
+# --- Broker ---
+
+async def serve(host="127.0.0.1", port=DEFAULT_PORT):
+    """Forward every line a client sends to all the other clients. Runs until cancelled."""
+    clients = set()
+
+    async def handle(reader, writer):
+        clients.add(writer)
+        try:
+            while line := await reader.readline():
+                for other in list(clients):
+                    if other is writer:
+                        continue
+                    if other.transport.get_write_buffer_size() > MAX_BACKLOG:
+                        # Hopelessly behind: it clears its caches when it reconnects
+                        log.warning("dropping a worker %d bytes behind", other.transport.get_write_buffer_size())
+                        clients.discard(other)
+                        other.close()
+                        continue
+                    other.write(line)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            clients.discard(writer)
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    async with server:
+        await server.serve_forever()
+
+
+# --- Workers ---
+
+class BrokerClient:
+    """
+    One worker's connection to the broker. publish() only queues; a
+    background thread sends the queue, receives the other workers'
+    changes and hands them to on_message(channel, op, args).
+    """
+
+    def __init__(self, address, on_message, on_reset=None, retry=1.0):
+        host, _, port = address.rpartition(":")
+        self.address = (host or "127.0.0.1", int(port))
+        self.on_message = on_message
+        self.on_reset = on_reset    # called after a reconnect: changes may have been missed
+        self.retry = retry
+        self._closing = False
+        self._resync = False        # clear the caches once connected (set after the first connection)
+        self._start()
+
+    def publish(self, channel, op, args):
+        line = json.dumps({"channel": channel, "op": op, "args": args}).encode() + b"\n"
+        with self._lock:
+            self._outbox.append(line)
+        self._wake()
+
+    def close(self, timeout=5):
+        """Send what is still queued (if connected), then stop."""
+        self._closing = True
+        self._wake()
+        self._thread.join(timeout)
+
+    def after_fork(self):
+        """In a forked child: the parent's socket and thread are not ours, so start over."""
+        self._resync = True  # what the parent cached may go stale before we are connected
+        self._start()
+
+    def _start(self):
+        self._lock = threading.Lock()
+        self._outbox = collections.deque()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._thread = threading.Thread(target=self._run, name="duo-broker", daemon=True)
+        self._thread.start()
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass  # a wake-up is already pending
+
+    def _run(self):
+        while not self._closing:
+            try:
+                sock = socket.create_connection(self.address, timeout=self.retry)
+            except OSError:
+                time.sleep(self.retry)
+                continue
+            if self._resync and self.on_reset:
+                self.on_reset()
+            self._resync = True
+            try:
+                self._serve(sock)
+            except OSError as e:
+                log.warning("lost the cache broker at %s:%s (%s), reconnecting", *self.address, e)
+            finally:
+                sock.close()
+
+    def _serve(self, sock):
+        sock.settimeout(None)
+        selector = selectors.DefaultSelector()
+        selector.register(sock, selectors.EVENT_READ, "broker")
+        selector.register(self._wake_r, selectors.EVENT_READ, "wake")
+        pending = b""
+        try:
+            while True:
+                self._send(sock)
+                if self._closing:
+                    return
+                for key, _ in selector.select():
+                    if key.data == "wake":
+                        try:
+                            self._wake_r.recv(4096)
+                        except BlockingIOError:
+                            pass
+                        continue
+                    data = sock.recv(65536)
+                    if not data:
+                        raise ConnectionResetError("broker closed the connection")
+                    *lines, pending = (pending + data).split(b"\n")
+                    for line in lines:
+                        self._dispatch(line)
+        finally:
+            selector.close()
+
+    def _send(self, sock):
+        while True:
+            with self._lock:
+                if not self._outbox:
+                    return
+                line = self._outbox[0]
+            sock.sendall(line)
+            with self._lock:
+                self._outbox.popleft()  # only once sent: a failed line goes out again after reconnecting
+
+    def _dispatch(self, line):
+        try:
+            message = json.loads(line)
+            self.on_message(message["channel"], message["op"], message["args"])
+        except Exception:
+            log.exception("could not apply a broker message: %r", line[:200])
+
+
+def join(address, caches, on_reset=None):
+    """
+    Share `caches` ({channel: cache with publish/apply}, see cache.py) with
+    every other worker on the broker at `address`. Returns the client.
+    """
+    client = BrokerClient(address, lambda channel, op, args: caches[channel].apply(op, args), on_reset)
+    for channel, c in caches.items():
+        c.publish = lambda op, args, channel=channel: client.publish(channel, op, args)
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=client.after_fork)
+    return client
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    log.info("cache broker listening on %s:%s", args.host, args.port)
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+# cache.py
+"""
+In-process caches shared by every Streamlit session in this process.
+
+With several worker processes (router.py) every cache also hands its
+changes to `publish(op, args)`, which broker.py points at the other
+workers; they replay them through apply(). apply() only changes the
+local copy, so a replayed change is never published again.
+"""
+import bisect
+import datetime
+import threading
+import time
+from collections import OrderedDict
+
+import history
+
+
+class Leaderboard:
+    """
+    Top-K XP standings kept in memory.
+    Reloaded from the database at most every `ttl` seconds and patched in
+    place whenever this process changes a user's XP, so rendering the
+    leaderboard is a list slice instead of an ORDER BY over all users.
+    """
+
+    def __init__(self, load_top, count_above, k=100, ttl=30):
+        self.load_top = load_top        # load_top(k) -> [{"id", "username", "xp"}], xp DESC
+        self.count_above = count_above  # count_above(user_id) -> users with more XP, or None
+        self.k = k
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._keys = []     # (-xp, -id), ascending = best first
+        self._rows = []     # {"username", "xp"}, parallel to _keys
+        self._xp = {}       # id -> xp for users currently in the top K
+        self._loaded_at = None
+        self._ranks = {}    # id -> (rank, expires_at) for users outside the top K
+        self.publish = None  # publish(op, args) -> other workers, see broker.py
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        if self._loaded_at is not None and now - self._loaded_at < self.ttl:
+            return
+        rows = self.load_top(self.k)
+        self._keys = [(-r["xp"], -r["id"]) for r in rows]
+        self._rows = [{"username": r["username"], "xp": r["xp"]} for r in rows]
+        self._xp = {r["id"]: r["xp"] for r in rows}
+        self._ranks = {}
+        self._loaded_at = now
+
+    def top(self, limit=10, offset=0):
+        """One page of standings: [{"username", "xp"}], best first."""
+        with self._lock:
+            self._ensure_fresh()
+            return [dict(r) for r in self._rows[offset:offset + limit]]
+
+    def rank(self, user_id):
+        """1-based rank of a user, or None if the user does not exist."""
+        with self._lock:
+            self._ensure_fresh()
+            if user_id in self._xp:
+                return bisect.bisect_left(self._keys, (-self._xp[user_id], -user_id)) + 1
+            cached = self._ranks.get(user_id)
+            if cached and cached[1] > time.monotonic():
+                return cached[0]
+        above = self.count_above(user_id)
+        if above is None:
+            return None
+        with self._lock:
+            self._ranks[user_id] = (above + 1, time.monotonic() + self.ttl)
+        return above + 1
+
+    def update_xp(self, user_id, username, xp):
+        """Apply an XP change made by this process without reloading."""
+        self._update_xp(user_id, username, xp)
+        _publish(self, "update_xp", user_id, username, xp)
+
+    def invalidate(self):
+        self._invalidate()
+        _publish(self, "invalidate")
+
+    def apply(self, op, args=()):
+        """Replay a change published by another worker."""
+        getattr(self, "_" + op)(*args)
+
+    def _update_xp(self, user_id, username, xp):
+        with self._lock:
+            if self._loaded_at is None:
+                return  # nothing loaded yet; the next read loads fresh data
+            self._ranks.pop(user_id, None)
+            key = (-xp, -user_id)
+            was_full = len(self._keys) >= self.k
+            if user_id in self._xp:
+                i = bisect.bisect_left(self._keys, (-self._xp.pop(user_id), -user_id))
+                del self._keys[i]
+                del self._rows[i]
+                if was_full and self._keys and key > self._keys[-1]:
+                    # Fell to the bottom of a full top K: who comes next isn't known here
+                    self._loaded_at = None
+                    return
+            elif was_full and key > self._keys[-1]:
+                return  # still outside the top K
+
+            i = bisect.bisect_left(self._keys, key)
+            self._keys.insert(i, key)
+            self._rows.insert(i, {"username": username, "xp": xp})
+            self._xp[user_id] = xp
+            if len(self._keys) > self.k:
+                dropped = self._keys.pop()
+                self._rows.pop()
+                del self._xp[-dropped[1]]
+
+    def _invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+
+class UserCache:
+    """
+    Read-through cache of per-user query results.
+    Each user gets a bucket of results keyed by (name, args). Buckets are
+    LRU-evicted past `max_users`, and each holds at most `max_entries`.
+    Mutations drop just the names they affect. A bucket also expires at
+    midnight, since streaks and date windows depend on today's date.
+    Cached values are shared between sessions: treat them as read-only.
+    """
+
+    def __init__(self, max_users=1000, max_entries=32):
+        self.max_users = max_users
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()  # user_id -> _Bucket, least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.publish = None
+
+    def get_or_load(self, user_id, name, args, load):
+        key = (name, args)
+        today = datetime.date.today()
+        with self._lock:
+            bucket = self._buckets.get(user_id)
+            if bucket is not None and bucket.day != today:
+                bucket.clear(today)
+            if bucket is not None and key in bucket.entries:
+                self._buckets.move_to_end(user_id)
+                self.hits += 1
+                return bucket.entries[key]
+            self.misses += 1
+            if bucket is None:
+                bucket = self._buckets[user_id] = _Bucket(today)
+                self._evict()
+            generation = bucket.generation
+
+        value = load()
+
+        with self._lock:
+            # Skip the store if the bucket was invalidated or evicted while loading
+            if self._buckets.get(user_id) is bucket and bucket.generation == generation:
+                bucket.entries[key] = value
+                if len(bucket.entries) > self.max_entries:
+                    bucket.entries.pop(next(iter(bucket.entries)))
+                self._buckets.move_to_end(user_id)
+        return value
+
+    def invalidate(self, user_id, *names):
+        """Drop the named results for a user (all of them if no names given)."""
+        self._invalidate(user_id, *names)
+        _publish(self, "invalidate", user_id, *names)
+
+    def clear(self):
+        self._clear()
+        _publish(self, "clear")
+
+    def apply(self, op, args=()):
+        """Replay a change published by another worker."""
+        getattr(self, "_" + op)(*args)
+
+    def _invalidate(self, user_id, *names):
+        with self._lock:
+            bucket = self._buckets.get(user_id)
+            if bucket is None:
+                return
+            self.invalidations += 1
+            bucket.generation += 1
+            if not names:
+                bucket.entries.clear()
+            else:
+                for key in [k for k in bucket.entries if k[0] in names]:
+                    del bucket.entries[key]
+
+    def _clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "users": len(self._buckets),
+                "entries": sum(len(b.entries) for b in self._buckets.values()),
+            }
+
+    def _evict(self):
+        while len(self._buckets) > self.max_users:
+            self._buckets.popitem(last=False)
+            self.evictions += 1
+
+
+class _Bucket:
+    __slots__ = ("day", "entries", "generation")
+
+    def __init__(self, day):
+        self.day = day
+        self.entries = {}
+        self.generation = 0
+
+    def clear(self, day):
+        self.day = day
+        self.entries.clear()
+        self.generation += 1
+
+
+class HistoryCache:
+    """
+    Per-user {habit_id: HabitHistory} (see history.py), loaded once and then
+    patched by this process's own writes instead of being reloaded.
+    Users are LRU-evicted past `max_users`. Patches replace the user's dict
+    rather than changing it, so sessions holding the old one never see it
+    move under them.
+    A user is also reloaded at midnight and `ttl` seconds after loading, so
+    writes this process never hears of (manage.py jobs, another app
+    instance without a broker) show up eventually.
+    """
+
+    def __init__(self, max_users=1000, ttl=300):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._users = OrderedDict()  # user_id -> {habit_id: HabitHistory}, least recently used first
+        self._loaded = {}            # user_id -> (day, time.monotonic()) of the load
+        self._generation = {}        # user_id -> bumped by every record/invalidate
+        self.publish = None
+
+    def get_or_load(self, user_id, load):
+        today = datetime.date.today()
+        with self._lock:
+            histories = self._users.get(user_id)
+            if histories is not None:
+                day, loaded_at = self._loaded[user_id]
+                if day == today and time.monotonic() - loaded_at < self.ttl:
+                    self._users.move_to_end(user_id)
+                    return histories
+                del self._users[user_id]
+            generation = self._generation.get(user_id, 0)
+            started = time.monotonic()
+
+        histories = load()
+
+        with self._lock:
+            # A write that landed while loading may be missing from what was read
+            if self._generation.get(user_id, 0) == generation:
+                self._users[user_id] = histories
+                self._loaded[user_id] = (today, started)
+                self._users.move_to_end(user_id)
+                while len(self._users) > self.max_users:
+                    evicted, _ = self._users.popitem(last=False)
+                    self._loaded.pop(evicted, None)
+                    self._generation.pop(evicted, None)
+        return histories
+
+    def record(self, user_id, habit_id, status, day):
+        """Set one day's bit for a habit, if the user is loaded."""
+        self._record(user_id, habit_id, status, day)
+        _publish(self, "record", user_id, habit_id, status, str(day))
+
+    def invalidate(self, user_id=None):
+        """Forget one user's histories, or everyone's."""
+        self._invalidate(user_id)
+        _publish(self, "invalidate", user_id)
+
+    def apply(self, op, args=()):
+        """Replay a change published by another worker."""
+        getattr(self, "_" + op)(*args)
+
+    def _record(self, user_id, habit_id, status, day):
+        with self._lock:
+            self._generation[user_id] = self._generation.get(user_id, 0) + 1
+            histories = self._users.get(user_id)
+            if histories is None:
+                return
+            updated = dict(histories)
+            updated[habit_id] = updated.get(habit_id, history.EMPTY).marked(day, status)
+            self._users[user_id] = updated
+
+    def _invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._users.clear()
+                self._loaded.clear()
+                self._generation.clear()
+            else:
+                self._users.pop(user_id, None)
+                self._loaded.pop(user_id, None)
+                self._generation[user_id] = self._generation.get(user_id, 0) + 1
+
+
+def _publish(cache, op, *args):
+    # Outside the cache lock: publishing only queues the message
+    if cache.publish is not None:
+        cache.publish(op, list(args))
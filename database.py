@@ -1,286 +1,1434 @@
-import pymysql
+import atexit
 import datetime
+import functools
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
 from datetime import date
 
-# --- DB Connection ---
-conn = pymysql.connect(
-    host="localhost",
-    user="root",
-    password="1234",
-    database="habit_tracker",
-    autocommit=True,
-    cursorclass=pymysql.cursors.DictCursor
+import backends
+import broker
+import cache
+import history
+import instrumentation
+
+# --- Storage backend + connection pool ---
+# DUO_DB_BACKEND=mysql (default, DUO_DB_HOST/PORT/USER/PASSWORD/NAME)
+#             or sqlite (DUO_DB_PATH) — see backends.py
+POOL_SIZE = int(os.environ.get("DUO_DB_POOL_SIZE", "8"))
+POOL_TIMEOUT = float(os.environ.get("DUO_DB_POOL_TIMEOUT", "10"))
+PING_AFTER = float(os.environ.get("DUO_DB_PING_AFTER", "30"))  # seconds idle before a health check
+LEADERBOARD_SIZE = int(os.environ.get("DUO_LEADERBOARD_K", "100"))  # standings kept in memory
+LEADERBOARD_TTL = float(os.environ.get("DUO_LEADERBOARD_TTL", "30"))  # seconds before a reload
+CACHE_USERS = int(os.environ.get("DUO_CACHE_USERS", "1000"))  # users kept in the read-through cache
+CACHE_ENTRIES = int(os.environ.get("DUO_CACHE_ENTRIES", "32"))  # cached results per user
+HISTORY_TTL = float(os.environ.get("DUO_HISTORY_TTL", "300"))  # seconds before a user's histories are reloaded
+STREAM_BATCH = int(os.environ.get("DUO_STREAM_BATCH", "5000"))  # rows per fetch for batch jobs
+ID_CHUNK = 1000  # ids per IN (...) list
+LOG_PAGE_SIZE = int(os.environ.get("DUO_LOG_PAGE_SIZE", "50"))  # activity log rows per page
+HOT_DAYS = max(31, int(os.environ.get("DUO_HOT_DAYS", "90")))  # progress kept row by row before archiving
+BROKER = os.environ.get("DUO_BROKER")  # host:port shared with the other workers (router.py), unset = one process
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection frees up within the timeout."""
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of backend connections.
+    Connections are opened on demand (up to `size`), health-checked with a
+    ping when they have sat idle for a while, and replaced when the server drops them.
+    Each process gets its own connections: a forked child starts with an empty pool.
+    """
+
+    def __init__(self, backend, size=POOL_SIZE, timeout=POOL_TIMEOUT, ping_after=PING_AFTER):
+        self.backend = backend
+        self.size = size
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()   # (conn, last_used) — LIFO keeps hot connections hot
+        self._slots = threading.BoundedSemaphore(self.size)
+
+    def _check_fork(self):
+        # The parent's sockets were inherited: forget them, don't close them (that would hang up on the parent)
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _connect(self):
+        return self.backend.connect()
+
+    def _healthy(self, conn, last_used):
+        if not self.backend.is_open(conn):
+            return False
+        if time.monotonic() - last_used < self.ping_after:
+            return True
+        return self.backend.ping(conn)
+
+    def acquire(self):
+        self._check_fork()
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f"no database connection free after {self.timeout}s (pool size {self.size})")
+        try:
+            while True:
+                try:
+                    conn, last_used = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._connect()
+                if self._healthy(conn, last_used):
+                    return conn
+                _close_quietly(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn, broken=False):
+        if self._pid != os.getpid():
+            return  # checked out before a fork: the connection belongs to the parent
+        try:
+            if broken or not self.backend.is_open(conn):
+                _close_quietly(conn)
+            else:
+                self._idle.put((conn, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except self.backend.disconnect_errors:
+            # Lost connection / server gone away — drop it so the next checkout reconnects
+            broken = True
+            raise
+        finally:
+            self.release(conn, broken)
+
+    def close_all(self):
+        self._check_fork()
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            _close_quietly(conn)
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+backend = backends.from_env()
+pool = ConnectionPool(backend)
+
+
+def use_backend(new_backend, **pool_kwargs):
+    """Switch this process to another backend (tests, benchmarks, tooling)."""
+    global backend, pool
+    old = pool
+    backend = new_backend
+    pool = ConnectionPool(new_backend, **pool_kwargs)
+    old.close_all()
+    user_cache.clear()
+    histories.invalidate()
+    leaderboard.invalidate()
+
+
+@contextmanager
+def get_cursor():
+    """Check out a pooled connection and yield a fresh DictCursor on it."""
+    with pool.connection() as conn:
+        with conn.cursor() as cursor:
+            yield _wrap(cursor)
+
+
+@contextmanager
+def transaction():
+    """
+    Like get_cursor, but everything run on the cursor commits as one unit
+    (or rolls back if the block raises).
+    """
+    with pool.connection() as conn:
+        conn.begin()
+        try:
+            with conn.cursor() as cursor:
+                yield _wrap(cursor)
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+
+@contextmanager
+def stream_cursor():
+    """
+    Like get_cursor, but result rows are streamed from the server as they
+    are fetched instead of buffered client-side. Read with fetchmany.
+    """
+    with pool.connection() as conn:
+        with backend.stream_cursor(conn) as cursor:
+            yield _wrap(cursor)
+
+
+def run_batch(cursor, statements):
+    """
+    Run several (sql, args) SELECTs as one multi-statement round trip
+    (SQLite has no round trips to save and runs them one after another).
+    Returns one list of rows per statement, in order.
+    """
+    if isinstance(cursor, _ExplainingCursor):
+        # EXPLAIN takes one statement at a time
+        results = []
+        for q, args in statements:
+            cursor.execute(q, args)
+            results.append(list(cursor.fetchall()))
+        return results
+    return backend.run_batch(cursor, statements)
+
+
+# --- Query plan capture (used by `manage.py explain`) ---
+_capture = threading.local()
+
+
+class _ExplainingCursor:
+    """
+    Cursor proxy that records EXPLAIN output for every statement.
+    SELECTs still run so callers get real rows; writes are only explained.
+    """
+
+    def __init__(self, cursor, plans):
+        self._cursor = cursor
+        self._plans = plans
+        self._fake_rowcount = None
+
+    def execute(self, sql, args=None):
+        verb = sql.lstrip().split(None, 1)[0].upper()
+        self._fake_rowcount = None
+        if verb not in ("SELECT", "INSERT", "UPDATE", "DELETE"):
+            return self._cursor.execute(sql, args)
+        plan = backend.explain(self._cursor, sql, args)
+        self._plans.append({"verb": verb, "sql": " ".join(sql.split()), "plan": plan})
+        if verb == "SELECT":
+            return self._cursor.execute(sql, args)
+        self._fake_rowcount = 1  # pretend the write hit one row so callers carry on
+        return 1
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount if self._fake_rowcount is None else self._fake_rowcount
+
+    def executemany(self, sql, seq_of_args):
+        seq_of_args = list(seq_of_args)
+        if seq_of_args:
+            self.execute(sql, seq_of_args[0])
+        return len(seq_of_args)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+def _wrap(cursor):
+    """Cursor hook for get_cursor/transaction: plan capture, else query instrumentation."""
+    plans = getattr(_capture, "plans", None)
+    if plans is not None:
+        return _ExplainingCursor(cursor, plans)
+    return instrumentation.wrap(cursor)
+
+
+@contextmanager
+def capture_query_plans():
+    """
+    Within this block, database functions on the current thread EXPLAIN each
+    statement they send and skip the writes. Yields the list of plans.
+    """
+    plans = []
+    _capture.plans = plans
+    try:
+        yield plans
+    finally:
+        _capture.plans = None
+
+
+def _capturing():
+    """Whether writes on this thread are only being explained (so caches must not hear of them)."""
+    return getattr(_capture, "plans", None) is not None
+
+
+# --- Per-user read-through cache ---
+user_cache = cache.UserCache(max_users=CACHE_USERS, max_entries=CACHE_ENTRIES)
+histories = cache.HistoryCache(max_users=CACHE_USERS, ttl=HISTORY_TTL)
+
+# What each kind of write makes stale
+_HABIT_LIST = ("habits", "dashboard", "progress", "page")
+_PROGRESS_VIEWS = (
+    "habits", "dashboard", "streak", "progress_count", "progress", "log", "log_page", "page", "freezes",
 )
-cursor = conn.cursor()
+_FREEZE_VIEWS = ("dashboard", "streak", "page", "freezes")
+_PAYMENT_VIEWS = ("payments", "payment_average", "finance")
+
+_ROLLUP_COUNTS = ("done_count", "skipped_count")
+
+
+def _cached(name):
+    """
+    Serve a getter whose first argument is user_id through user_cache under
+    `name` (what mutations invalidate). Getters sharing a name never share
+    entries: the key starts with the getter itself.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(user_id, *args, **kwargs):
+            key = (fn.__qualname__, args, tuple(sorted(kwargs.items())))
+            return user_cache.get_or_load(user_id, name, key, lambda: fn(user_id, *args, **kwargs))
+        return wrapper
+    return decorator
+
+
+def cache_stats():
+    """Hit/miss counters for the per-user cache."""
+    return user_cache.stats()
+
 
 def create_or_get_user(username, email=None):
-    cursor.execute("SELECT * FROM users WHERE username=%s", (username,))
-    user = cursor.fetchone()
-    if user:
-        return user
-    cursor.execute("INSERT INTO users (username, email) VALUES (%s, %s)", (username, email))
-    cursor.execute("SELECT * FROM users WHERE username=%s", (username,))
-    return cursor.fetchone()
+    with get_cursor() as cursor:
+        cursor.execute("SELECT * FROM users WHERE username=%s", (username,))
+        user = cursor.fetchone()
+        if user:
+            return user
+        cursor.execute("INSERT INTO users (username, email) VALUES (%s, %s)", (username, email))
+        cursor.execute("SELECT * FROM users WHERE username=%s", (username,))
+        return cursor.fetchone()
 
 def add_habit(user_id, name, frequency="daily", target=1, target_time=None):
-    cursor.execute(
-        "INSERT INTO habits (user_id, name, frequency, target, target_time) VALUES (%s,%s,%s,%s,%s)",
-        (user_id, name, frequency, target, target_time)
-    )
+    with get_cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO habits (user_id, name, frequency, target, target_time) VALUES (%s,%s,%s,%s,%s)",
+            (user_id, name, frequency, target, target_time)
+        )
+    if not _capturing():
+        user_cache.invalidate(user_id, *_HABIT_LIST)
 
 def get_habit(habit_id):
     """Fetch a single habit by its ID"""
-    cursor.execute("SELECT * FROM habits WHERE id=%s", (habit_id,))
-    return cursor.fetchone()
+    with get_cursor() as cursor:
+        cursor.execute("SELECT * FROM habits WHERE id=%s", (habit_id,))
+        return cursor.fetchone()
 
-def mark_habit_done(habit_id):
-    cursor.execute("SELECT * FROM habits WHERE id=%s", (habit_id,))
+def mark_habit_done(habit_id, log_date=None):
+    """
+    Log the habit as done for log_date (default today): progress row, habit
+    streak, XP and daily streak in one transaction. Replaying the same
+    (habit_id, log_date) is a no-op, so queued writes can be retried safely.
+    """
+    return mark_progress_batch([(habit_id, "done", log_date)])[0]
+
+def mark_habit_skipped(habit_id, log_date=None):
+    return mark_progress_batch([(habit_id, "skipped", log_date)])[0]
+
+def mark_progress_batch(events):
+    """
+    Apply (habit_id, status, log_date) events in order in one transaction,
+    one commit for the lot. If the batch fails it is rolled back and every
+    event is retried in its own transaction, so one bad event cannot sink
+    the others. Returns one result dict per event.
+    """
+    events = [(habit_id, status, log_date or datetime.date.today()) for habit_id, status, log_date in events]
+    try:
+        with transaction() as cursor:
+            outcomes = [_mark(cursor, *e) for e in events]
+    except Exception:
+        if len(events) == 1:
+            raise
+        return [_mark_alone(e) for e in events]
+    return [_after_mark(result, effects) for result, effects in outcomes]
+
+def _mark_alone(event):
+    try:
+        with transaction() as cursor:
+            result, effects = _mark(cursor, *event)
+    except Exception as e:
+        return {"ok": False, "msg": f"Could not save: {e}"}
+    return _after_mark(result, effects)
+
+def _after_mark(result, effects):
+    """
+    Post-commit bookkeeping: drop stale cached views, patch the histories and
+    leaderboard. Skipped while capturing query plans: nothing was written,
+    and with DUO_BROKER set the patches would reach every worker.
+    """
+    if effects and not _capturing():
+        user_cache.invalidate(effects["user_id"], *_PROGRESS_VIEWS)
+        histories.record(effects["user_id"], effects["habit_id"], effects["status"], effects["day"])
+        if "xp" in effects:
+            leaderboard.update_xp(effects["user_id"], effects["username"], effects["xp"])
+    return result
+
+def _mark(cursor, habit_id, status, log_date):
+    if status == "done":
+        return _mark_done(cursor, habit_id, log_date)
+    if status == "skipped":
+        return _mark_skipped(cursor, habit_id, log_date)
+    raise ValueError(f"unknown progress status {status!r}")
+
+def _mark_done(cursor, habit_id, today):
+    """Returns (result, effects to apply once committed)."""
+    today_str = today.strftime("%Y-%m-%d")  # convert to string
+
+    # Lock the habit and its user so concurrent clicks serialize here
+    cursor.execute(f"""
+        SELECT h.*, u.username, u.xp, u.daily_streak, u.daily_last_date, u.streak_freeze
+        FROM habits h
+        JOIN users u ON u.id = h.user_id
+        WHERE h.id=%s
+        {backend.for_update}
+    """, (habit_id,))
     habit = cursor.fetchone()
     if not habit:
-        return {"ok": False, "msg": "Habit not found"}
+        return {"ok": False, "msg": "Habit not found"}, None
 
     user_id = habit["user_id"]
-    today = datetime.date.today()
-    today_str = today.strftime("%Y-%m-%d")  # convert to string
 
-    # Prevent duplicate progress entry for today
-    cursor.execute("""
-        SELECT * FROM progress
-        WHERE user_id=%s AND habit_id=%s AND log_date=%s
-    """, (user_id, habit_id, today_str))
-    if cursor.fetchone():
-        return {"ok": False, "msg": "Already marked done today"}
+    # Prevent duplicate progress entry for today (unique habit_id + log_date)
+    if not _insert_progress(cursor, user_id, habit_id, "done", today_str):
+        return {"ok": False, "msg": _already_logged_msg(cursor, habit_id, today_str)}, None
 
     # Get current streak and longest streak
     streak = habit.get("streak") or 0
     longest = habit.get("longest_streak") or 0
-    last_done = habit.get("last_done_date")
-
-    # Convert last_done to date
-    if last_done:
-        if isinstance(last_done, str):
-            last_done = datetime.datetime.strptime(last_done, "%Y-%m-%d").date()
-
-    # Calculate streak
-    if last_done is None:
-        streak = 1
-    elif last_done == today - datetime.timedelta(days=1):
-        streak += 1
-    else:
-        streak = 1
+    last_done = _as_date(habit.get("last_done_date"))
 
-    longest = max(longest, streak)
-
-    cursor.execute("""
-        UPDATE habits
-        SET streak=%s, longest_streak=%s, last_done_date=%s
-        WHERE id=%s
-    """, (streak, longest, today_str, habit_id))
-
-    # Insert progress for today
-    cursor.execute("""
-        INSERT INTO progress (user_id, habit_id, status, completed_at, log_date)
-        VALUES (%s, %s, 'done', NOW(), %s)
-    """, (user_id, habit_id, today_str))
+    # Calculate streak. A queued click can land after a later day's (journal
+    # replay, another worker): the row and XP still count, but the streak
+    # dates only ever move forward.
+    if last_done is None or today > last_done:
+        if last_done == today - datetime.timedelta(days=1):
+            streak += 1
+        else:
+            streak = 1
+        longest = max(longest, streak)
+        cursor.execute("""
+            UPDATE habits
+            SET streak=%s, longest_streak=%s, last_done_date=%s
+            WHERE id=%s
+        """, (streak, longest, today_str, habit_id))
 
-    # Add XP to user
+    # Add XP and advance the user's daily streak in the same write
     xp_gain = 10
-    cursor.execute("UPDATE users SET xp=xp+%s WHERE id=%s", (xp_gain, user_id))
+    _settle_streak_freezes(cursor, user_id, habit, today)
+    daily_last = _as_date(habit["daily_last_date"])
+    if daily_last is None or today > daily_last:
+        cursor.execute("""
+            UPDATE users
+            SET xp=xp+%s, daily_streak=%s, daily_last_date=%s
+            WHERE id=%s
+        """, (xp_gain, _next_daily_streak(habit, today), today_str, user_id))
+    else:
+        cursor.execute("UPDATE users SET xp=xp+%s WHERE id=%s", (xp_gain, user_id))
 
-    return {"ok": True, "streak": streak, "xp_gain": xp_gain}
+    effects = {
+        "user_id": user_id, "habit_id": habit_id, "status": "done", "day": today,
+        "username": habit["username"], "xp": habit["xp"] + xp_gain,
+    }
+    return {"ok": True, "streak": streak, "xp_gain": xp_gain}, effects
 
-def mark_habit_skipped(habit_id):
-    cursor.execute("SELECT user_id FROM habits WHERE id=%s", (habit_id,))
+def _mark_skipped(cursor, habit_id, today):
+    today_str = today.strftime("%Y-%m-%d")
+    cursor.execute(f"""
+        SELECT h.user_id, u.daily_streak, u.daily_last_date, u.streak_freeze
+        FROM habits h
+        JOIN users u ON u.id = h.user_id
+        WHERE h.id=%s
+        {backend.for_update}
+    """, (habit_id,))
     h = cursor.fetchone()
-    if not h: return {"ok": False}
+    if not h: return {"ok": False}, None
     user_id = h["user_id"]
-    today_str = datetime.date.today().strftime("%Y-%m-%d")
-    cursor.execute(
-        "INSERT INTO progress (user_id, habit_id, status, completed_at, log_date) VALUES (%s,%s,'skipped', NOW(), %s)",
-        (user_id, habit_id, today_str)
-    )
-    return {"ok": True}
+    if not _insert_progress(cursor, user_id, habit_id, "skipped", today_str):
+        return {"ok": False, "msg": _already_logged_msg(cursor, habit_id, today_str)}, None
+    # A skip never extends the daily streak, but it settles any gap before today
+    _settle_streak_freezes(cursor, user_id, h, today)
+    return {"ok": True}, {"user_id": user_id, "habit_id": habit_id, "status": "skipped", "day": today}
+
+def _insert_progress(cursor, user_id, habit_id, status, log_date):
+    """
+    Insert the day's progress row and count it in the rollups.
+    False if the habit already has one for that day.
+    """
+    if _reaches_archive(log_date) and _archived_status(cursor, habit_id, log_date):
+        return False
+    cursor.execute(f"""
+        INSERT INTO progress (user_id, habit_id, status, completed_at, log_date)
+        VALUES (%s, %s, %s, %s, %s)
+        {backend.ignore_duplicate}
+    """, (user_id, habit_id, status, datetime.datetime.now(), log_date))
+    if cursor.rowcount != 1:
+        return False
+    done, skipped = (1, 0) if status == "done" else (0, 1)
+    cursor.execute(f"""
+        INSERT INTO user_progress_daily (user_id, log_date, done_count, skipped_count)
+        VALUES (%s, %s, %s, %s)
+        {backend.upsert_add(("user_id", "log_date"), _ROLLUP_COUNTS)}
+    """, (user_id, log_date, done, skipped))
+    cursor.execute(f"""
+        INSERT INTO habit_progress_totals (habit_id, user_id, done_count, skipped_count)
+        VALUES (%s, %s, %s, %s)
+        {backend.upsert_add(("habit_id",), _ROLLUP_COUNTS)}
+    """, (habit_id, user_id, done, skipped))
+    return True
+
+def _already_logged_msg(cursor, habit_id, log_date):
+    cursor.execute("SELECT status FROM progress WHERE habit_id=%s AND log_date=%s", (habit_id, log_date))
+    row = cursor.fetchone()
+    status = row["status"] if row else _archived_status(cursor, habit_id, log_date)
+    return already_marked_msg(status or "done", log_date)
+
+def already_marked_msg(status, log_date):
+    """Why a second mark for the same habit and day was refused."""
+    log_date = _as_date(log_date)
+    when = "today" if log_date == date.today() else f"for {log_date.isoformat()}"
+    return f"Already marked {status} {when}"
 
 def get_progress(habit_id, days=30):
     """
     Return recent progress for a habit.
     Dates are returned as strings for easier plotting.
+    Windows reaching past the hot range also read the archive
+    (completed_at is None for archived days).
     """
-    cursor.execute("""
-        SELECT DATE_FORMAT(log_date, '%%Y-%%m-%%d') AS date, status, completed_at
-        FROM progress
-        WHERE habit_id=%s
-          AND log_date >= CURDATE() - INTERVAL %s DAY
-        ORDER BY log_date DESC
-    """, (habit_id, days))
-    return cursor.fetchall()
+    since = _days_ago(days)
+    with get_cursor() as cursor:
+        cursor.execute("""
+            SELECT CAST(log_date AS CHAR) AS date, status, completed_at
+            FROM progress
+            WHERE habit_id=%s
+              AND log_date >= %s
+            ORDER BY log_date DESC
+        """, (habit_id, since))
+        rows = list(cursor.fetchall())  # pymysql returns a tuple
+        if _reaches_archive(since):
+            rows += _archived_progress(cursor, habit_id, since)
+        return rows
 
-def get_user_dashboard(user_id):
-    cursor.execute("SELECT COUNT(*) AS habit_count FROM habits WHERE user_id=%s", (user_id,))
-    hc = cursor.fetchone()["habit_count"]
-    cursor.execute("SELECT xp FROM users WHERE id=%s", (user_id,))
-    xp = cursor.fetchone()["xp"]
-    return {"habit_count": hc, "xp": xp}
+def get_leaderboard(limit=10, offset=0):
+    """One page of the XP leaderboard, served from the in-process top-K cache."""
+    return leaderboard.top(limit, offset)
+
+def get_user_rank(user_id):
+    """1-based leaderboard position of a user (None if unknown)."""
+    return leaderboard.rank(user_id)
+
+def _load_leaderboard(k):
+    with get_cursor() as cursor:
+        # xp DESC, id DESC walks idx_users_xp backwards — no filesort
+        cursor.execute("SELECT id, username, xp FROM users ORDER BY xp DESC, id DESC LIMIT %s", (k,))
+        return cursor.fetchall()
+
+def _count_users_above(user_id):
+    with get_cursor() as cursor:
+        cursor.execute("""
+            SELECT
+                (SELECT COUNT(*) FROM users o
+                 WHERE o.xp > u.xp OR (o.xp = u.xp AND o.id > u.id)) AS above
+            FROM users u
+            WHERE u.id = %s
+        """, (user_id,))
+        row = cursor.fetchone()
+    return row["above"] if row else None
+
+leaderboard = cache.Leaderboard(_load_leaderboard, _count_users_above, k=LEADERBOARD_SIZE, ttl=LEADERBOARD_TTL)
+
+
+# --- Cache sharing between worker processes (see router.py, broker.py) ---
+def _forget_cached():
+    """Drop every cached result in this process only (apply() does not publish)."""
+    user_cache.apply("clear")
+    histories.apply("invalidate")
+    leaderboard.apply("invalidate")
+
+
+broker_client = None
+if BROKER:
+    broker_client = broker.join(BROKER, {
+        "user_cache": user_cache, "histories": histories, "leaderboard": leaderboard,
+    }, on_reset=_forget_cached)
+    atexit.register(broker_client.close)  # batch jobs (manage.py) exit right after their last change
 
-def get_leaderboard():
-    cursor.execute("SELECT username, xp FROM users ORDER BY xp DESC LIMIT 10")
-    return cursor.fetchall()
 
 def get_streak(habit_id):
-    cursor.execute("SELECT COUNT(*) AS cnt FROM progress WHERE habit_id=%s AND status='done'", (habit_id,))
-    return cursor.fetchone()["cnt"]
+    """Total done days for a habit (from the rollup)."""
+    with get_cursor() as cursor:
+        cursor.execute("SELECT done_count FROM habit_progress_totals WHERE habit_id=%s", (habit_id,))
+        row = cursor.fetchone()
+        return row["done_count"] if row else 0
 
+@_cached("streak")
 def get_daily_streak(user_id):
-    cursor.execute("""
-        SELECT DISTINCT log_date
-        FROM progress
-        WHERE user_id = %s AND status = 'done'
-        ORDER BY log_date DESC
-    """, (user_id,))
-    rows = cursor.fetchall()
-
-    if not rows:
+    """
+    Current daily streak, read from the materialized state on users.
+    Pure read — freezes are only ever spent by settle_streak_freezes.
+    """
+    with get_cursor() as cursor:
+        cursor.execute(
+            "SELECT daily_streak, daily_last_date, streak_freeze FROM users WHERE id=%s",
+            (user_id,)
+        )
+        row = cursor.fetchone()
+    if not row:
         return 0
+    return _current_daily_streak(row, datetime.date.today())
 
-    streak = 0
-    today = datetime.date.today()
 
-    for i, row in enumerate(rows):
-        log_date = row["log_date"]
-        if isinstance(log_date, datetime.datetime):
-            log_date = log_date.date()
+# --- Materialized daily streak ---
+# users.daily_streak counts consecutive days (ending at users.daily_last_date)
+# on which the user marked at least one habit done. Missed days are bridged
+# by streak freezes when there are enough to cover the whole gap; that
+# happens in an explicit settlement step which records every covered date
+# in streak_freeze_usage.
 
-        expected_date = today - datetime.timedelta(days=i)
+def _days_ago(days):
+    """Start of an N-day window, as CURDATE() - INTERVAL N DAY would give."""
+    return datetime.date.today() - datetime.timedelta(days=days)
 
-        if log_date == expected_date:
-            streak += 1
+
+def _as_date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, str):
+        return datetime.datetime.strptime(value[:10], "%Y-%m-%d").date()
+    return value
+
+
+def _missed_days(row, today):
+    """Days strictly between the last counted day and today (-1 if today is already counted)."""
+    return (today - _as_date(row["daily_last_date"])).days - 1
+
+
+def _current_daily_streak(row, today):
+    """
+    Streak as of today, without writing. A gap that pending settlement will
+    bridge with freezes is counted as if it already had been.
+    """
+    streak = row["daily_streak"] or 0
+    if not streak or not row["daily_last_date"]:
+        return 0  # a broken streak is not revived by freezes (see _settle_streak_freezes)
+    missed = _missed_days(row, today)
+    if missed <= 0:
+        return streak
+    if missed <= (row["streak_freeze"] or 0):
+        return streak + missed
+    return 0
+
+
+def _next_daily_streak(row, today):
+    """New daily_streak after a habit is marked done today (row must be settled)."""
+    if not row["daily_last_date"]:
+        return 1
+    missed = _missed_days(row, today)
+    streak = row["daily_streak"] or 0
+    if missed < 0:
+        return streak  # today already counted
+    if missed == 0:
+        return streak + 1
+    return 1
+
+
+def _settle_streak_freezes(cursor, user_id, row, today):
+    """
+    Settle the user's daily streak up to yesterday. If there are enough
+    freezes to cover every missed day they are spent and each covered date
+    is recorded in streak_freeze_usage; otherwise the streak is broken.
+    Idempotent: once settled for `today` further calls are no-ops.
+    `row` (daily_streak, daily_last_date, streak_freeze) is updated in place.
+    """
+    if not row["daily_streak"] or not row["daily_last_date"]:
+        return row
+    missed = _missed_days(row, today)
+    if missed <= 0:
+        return row
+
+    last = _as_date(row["daily_last_date"])
+    if missed <= (row["streak_freeze"] or 0):
+        yesterday = today - datetime.timedelta(days=1)
+        # Guarded on the state we read, so concurrent settlements spend freezes once
+        cursor.execute("""
+            UPDATE users
+            SET daily_streak = daily_streak + %s,
+                daily_last_date = %s,
+                streak_freeze = streak_freeze - %s
+            WHERE id = %s AND daily_last_date = %s AND streak_freeze >= %s
+        """, (missed, yesterday, missed, user_id, last, missed))
+        if cursor.rowcount:
+            cursor.executemany(
+                f"{backend.insert_ignore} INTO streak_freeze_usage (user_id, covered_date) VALUES (%s, %s)",
+                [(user_id, last + datetime.timedelta(days=i)) for i in range(1, missed + 1)]
+            )
+    else:
+        cursor.execute(
+            "UPDATE users SET daily_streak = 0 WHERE id = %s AND daily_last_date = %s",
+            (user_id, last)
+        )
+
+    cursor.execute(
+        "SELECT daily_streak, daily_last_date, streak_freeze FROM users WHERE id=%s",
+        (user_id,)
+    )
+    row.update(cursor.fetchone())
+    return row
+
+
+def settle_streak_freezes(user_id=None, today=None):
+    """
+    Daily settlement step (`python manage.py settle-freezes`, run nightly).
+    Settles every user (or one) whose streak has a gap before today.
+    Returns the number of users settled.
+    """
+    today = today or datetime.date.today()
+    yesterday = today - datetime.timedelta(days=1)
+    with get_cursor() as cursor:
+        sql = """
+            SELECT id, daily_streak, daily_last_date, streak_freeze
+            FROM users
+            WHERE daily_streak > 0 AND daily_last_date < %s
+        """
+        if user_id is None:
+            cursor.execute(sql, (yesterday,))
+        else:
+            cursor.execute(sql + " AND id = %s", (yesterday, user_id))
+        rows = cursor.fetchall()
+        for row in rows:
+            _settle_streak_freezes(cursor, row["id"], row, today)
+    if not _capturing():
+        for row in rows:
+            user_cache.invalidate(row["id"], *_FREEZE_VIEWS)
+    return len(rows)
+
+
+@_cached("freezes")
+def get_streak_freeze_usage(user_id, limit=30):
+    """Most recent dates a streak freeze covered for this user."""
+    with get_cursor() as cursor:
+        cursor.execute("""
+            SELECT covered_date, used_at
+            FROM streak_freeze_usage
+            WHERE user_id = %s
+            ORDER BY covered_date DESC
+            LIMIT %s
+        """, (user_id, limit))
+        return cursor.fetchall()
+
+
+def recompute_daily_streaks(user_id=None):
+    """
+    Backfill users.daily_streak / daily_last_date from the progress history.
+    One-off maintenance for existing data: walks every done day (from the
+    daily rollup, so run rebuild_rollups first after bulk loads) and every
+    freeze-covered day of the selected user, or all users.
+    Returns the number of users updated.
+    """
+    with get_cursor() as cursor:
+        if user_id is None:
+            cursor.execute("SELECT id FROM users")
+        else:
+            cursor.execute("SELECT id FROM users WHERE id=%s", (user_id,))
+        user_ids = [r["id"] for r in cursor.fetchall()]
+
+        for uid in user_ids:
+            cursor.execute("""
+                SELECT log_date FROM user_progress_daily WHERE user_id = %s AND done_count > 0
+                UNION
+                SELECT covered_date FROM streak_freeze_usage WHERE user_id = %s
+            """, (uid, uid))
+            # Days with a habit done or a freeze spent; the streak is the run ending on the last one
+            days = history.HabitHistory.from_days(row["log_date"] for row in cursor.fetchall())
+            last_date = days.last_done()
+            streak = days.run_ending(last_date) if last_date else 0
+            cursor.execute(
+                "UPDATE users SET daily_streak=%s, daily_last_date=%s WHERE id=%s",
+                (streak, last_date, uid)
+            )
+    if not _capturing():
+        for uid in user_ids:
+            user_cache.invalidate(uid)
+    return len(user_ids)
+
+
+def rebuild_rollups(user_id=None):
+    """
+    Recompute user_progress_daily and habit_progress_totals from progress for
+    one user or everyone (after bulk loads or if they ever drift).
+    Returns (daily rows, habit rows) written.
+    """
+    where, args = ("WHERE user_id = %s", (user_id,)) if user_id is not None else ("", ())
+    with transaction() as cursor:
+        cursor.execute(f"DELETE FROM user_progress_daily {where}", args)
+        cursor.execute(f"DELETE FROM habit_progress_totals {where}", args)
+        cursor.execute(f"""
+            INSERT INTO user_progress_daily (user_id, log_date, done_count, skipped_count)
+            SELECT user_id, log_date, SUM(status = 'done'), SUM(status = 'skipped')
+            FROM progress {where}
+            GROUP BY user_id, log_date
+        """, args)
+        days = cursor.rowcount + _rollup_archived_days(cursor, user_id)
+        cursor.execute(f"""
+            INSERT INTO habit_progress_totals (habit_id, user_id, done_count, skipped_count)
+            SELECT habit_id, MIN(user_id), SUM(done_count), SUM(skipped_count)
+            FROM (
+                SELECT habit_id, user_id, status = 'done' AS done_count, status = 'skipped' AS skipped_count
+                FROM progress {where}
+                UNION ALL
+                SELECT habit_id, user_id, done_count, skipped_count
+                FROM progress_archive {where}
+            ) AS counted
+            GROUP BY habit_id
+        """, args + args)
+        habits = cursor.rowcount
+    if not _capturing():
+        if user_id is None:
+            user_cache.clear()
         else:
-            # 🔥 Auto-use freeze
-            if use_streak_freeze(user_id):
-                streak += 1
-                continue
+            user_cache.invalidate(user_id)
+        histories.invalidate(user_id)
+    return days, habits
+
+def _rollup_archived_days(cursor, user_id):
+    """Add the archive's days to user_progress_daily (one user, or everyone in keyset batches)."""
+    columns = "SELECT habit_id, month, user_id, done_mask, skipped_mask FROM progress_archive"
+    if user_id is not None:
+        cursor.execute(columns + " WHERE user_id = %s", (user_id,))
+        return _add_archived_days(cursor, cursor.fetchall())
+    n, after = 0, (0, date.min)
+    while True:
+        cursor.execute(columns + """
+            WHERE habit_id > %s OR (habit_id = %s AND month > %s)
+            ORDER BY habit_id, month
+            LIMIT %s
+        """, (after[0], after[0], after[1], STREAM_BATCH))
+        rows = cursor.fetchall()
+        if not rows:
+            return n
+        n += _add_archived_days(cursor, rows)
+        after = (rows[-1]["habit_id"], rows[-1]["month"])
+
+def _add_archived_days(cursor, rows):
+    counts = {}  # (user_id, day) -> [done, skipped]
+    for r in rows:
+        for i, mask in enumerate((r["done_mask"], r["skipped_mask"])):
+            for day in history.month_days(r["month"], mask):
+                counts.setdefault((r["user_id"], day), [0, 0])[i] += 1
+    if counts:
+        cursor.executemany(f"""
+            INSERT INTO user_progress_daily (user_id, log_date, done_count, skipped_count)
+            VALUES (%s, %s, %s, %s)
+            {backend.upsert_add(("user_id", "log_date"), _ROLLUP_COUNTS)}
+        """, [(uid, day, done, skipped) for (uid, day), (done, skipped) in counts.items()])
+    return len(counts)
+
+
+# --- Hot/cold progress ---
+# progress keeps one row per habit per day for the last HOT_DAYS (rounded
+# back to the start of a month). archive_progress compacts everything older
+# into progress_archive: one row per habit per month with a done and a
+# skipped day mask (bit d-1 = day d) and their counts; completed_at is not
+# kept. The rollups already count archived days, so counts and streaks never
+# read the archive; windowed reads add it only when the window starts before
+# archive_cutoff(), so the usual 7/14/30-day reads touch progress alone.
+
+def archive_cutoff(today=None):
+    """First day that is never archived: the first of the month HOT_DAYS ago."""
+    day = (today or date.today()) - datetime.timedelta(days=HOT_DAYS)
+    return day.replace(day=1)
+
+def _reaches_archive(since):
+    """Whether a window starting at `since` may include archived days."""
+    return _as_date(since) < archive_cutoff()
+
+def _archived_status(cursor, habit_id, day):
+    """"done"/"skipped" if the archive has this habit's day, else None."""
+    day = _as_date(day)
+    cursor.execute(
+        "SELECT done_mask, skipped_mask FROM progress_archive WHERE habit_id=%s AND month=%s",
+        (habit_id, day.replace(day=1))
+    )
+    row = cursor.fetchone()
+    bit = 1 << (day.day - 1)
+    if row and row["done_mask"] & bit:
+        return "done"
+    if row and row["skipped_mask"] & bit:
+        return "skipped"
+    return None
+
+def _archived_progress(cursor, habit_id, since):
+    """Archived days of one habit from `since` on, newest first, shaped like get_progress rows."""
+    cursor.execute("""
+        SELECT month, done_mask, skipped_mask
+        FROM progress_archive
+        WHERE habit_id=%s AND month >= %s
+    """, (habit_id, since.replace(day=1)))
+    rows = []
+    for r in cursor.fetchall():
+        for status, mask in (("done", r["done_mask"]), ("skipped", r["skipped_mask"])):
+            rows += [
+                {"date": day.isoformat(), "status": status, "completed_at": None}
+                for day in history.month_days(r["month"], mask) if day >= since
+            ]
+    rows.sort(key=lambda r: r["date"], reverse=True)
+    return rows
+
+def archive_progress(today=None, batch_size=STREAM_BATCH):
+    """
+    Move progress rows from before archive_cutoff() into progress_archive,
+    oldest first, one transaction per `batch_size` rows (run nightly:
+    `python manage.py archive-progress`). A row for a day the archive
+    already has (old history imported twice) is dropped and uncounted from
+    the rollups. Returns the number of progress rows archived.
+    """
+    cutoff = archive_cutoff(today)
+    moved, users = 0, set()
+    while True:
+        rows = _archive_batch(cutoff, batch_size)
+        if not rows:
             break
+        moved += len(rows)
+        users.update(r["user_id"] for r in rows)
+    if not _capturing():
+        for uid in users:
+            user_cache.invalidate(uid)
+            histories.invalidate(uid)
+    return moved
+
+def _archive_batch(cutoff, batch_size):
+    """Archive the oldest `batch_size` rows before cutoff in one transaction. Returns them."""
+    with transaction() as cursor:
+        cursor.execute(f"""
+            SELECT id, user_id, habit_id, status, log_date
+            FROM progress
+            WHERE log_date < %s
+            ORDER BY log_date
+            LIMIT %s
+            {backend.for_update}
+        """, (cutoff, batch_size))
+        rows = cursor.fetchall()
+        if rows:
+            _archive_rows(cursor, rows)
+    return rows
+
+def _archive_rows(cursor, rows):
+    packed = history.month_masks(rows)
+    habit_ids = sorted({habit_id for habit_id, _ in packed})
+    first, last = min(m for _, m in packed), max(m for _, m in packed)
+    existing = {}
+    for chunk in _id_chunks(habit_ids):
+        cursor.execute(f"""
+            SELECT habit_id, month, done_mask, skipped_mask
+            FROM progress_archive
+            WHERE {_in_list("habit_id", chunk)} AND month >= %s AND month <= %s
+        """, chunk + [first, last])
+        for r in cursor.fetchall():
+            existing[(r["habit_id"], _as_date(r["month"]))] = (r["done_mask"], r["skipped_mask"])
+
+    # Days the archive already holds were counted twice: take the copies back out of the rollups
+    duplicates = []
+    for r in rows:
+        day = _as_date(r["log_date"])
+        old_done, old_skipped = existing.get((r["habit_id"], day.replace(day=1)), (0, 0))
+        if (old_done | old_skipped) >> (day.day - 1) & 1:
+            duplicates.append((r["status"] == "done", r["status"] == "skipped", r))
+    if duplicates:
+        cursor.executemany(
+            "UPDATE user_progress_daily SET done_count = done_count - %s, skipped_count = skipped_count - %s"
+            " WHERE user_id = %s AND log_date = %s",
+            [(int(d), int(s), r["user_id"], r["log_date"]) for d, s, r in duplicates]
+        )
+        cursor.executemany(
+            "UPDATE habit_progress_totals SET done_count = done_count - %s, skipped_count = skipped_count - %s"
+            " WHERE habit_id = %s",
+            [(int(d), int(s), r["habit_id"]) for d, s, r in duplicates]
+        )
+
+    values = []
+    for (habit_id, month), (user_id, done, skipped) in packed.items():
+        old_done, old_skipped = existing.get((habit_id, month), (0, 0))
+        done = (done & ~old_skipped) | old_done  # the archived entry wins a day both logged
+        skipped = (skipped & ~old_done) | old_skipped
+        values.append((habit_id, month, user_id, done, skipped, done.bit_count(), skipped.bit_count()))
+    cursor.executemany(f"""
+        INSERT INTO progress_archive (habit_id, month, user_id, done_mask, skipped_mask, done_count, skipped_count)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        {backend.upsert_set(("habit_id", "month"), ("done_mask", "skipped_mask", "done_count", "skipped_count"))}
+    """, values)
+    ids = [r["id"] for r in rows]
+    for chunk in _id_chunks(ids):
+        cursor.execute(f"DELETE FROM progress WHERE {_in_list('id', chunk)}", chunk)
 
-    return streak
 
 
+# Sums one totals row per habit instead of the user's whole progress history
+PROGRESS_COUNT_SQL = """
+    SELECT
+        SUM(done_count)    AS done_count,
+        SUM(skipped_count) AS skipped_count,
+        COALESCE(SUM(done_count + skipped_count), 0) AS total_count
+    FROM habit_progress_totals
+    WHERE user_id = %s
+"""
 
+
+@_cached("progress_count")
 def get_user_progress_count(user_id):
     """
     Returns the number of completed and skipped progress entries for a user.
     """
-    cursor.execute("""
-        SELECT 
-            SUM(status = 'done')   AS done_count,
-            SUM(status = 'skipped') AS skipped_count,
-            COUNT(*) AS total_count
-        FROM progress
-        WHERE user_id = %s
-    """, (user_id,))
-    return cursor.fetchone()
+    with get_cursor() as cursor:
+        cursor.execute(PROGRESS_COUNT_SQL, (user_id,))
+        return cursor.fetchone()
 
+@_cached("log")
 def get_user_progress_log(user_id, days=7):
     """
     Returns a detailed log of habits (done/skipped) with time for the last N days.
     """
-    cursor.execute("""
-        SELECT 
+    with get_cursor() as cursor:
+        cursor.execute("""
+            SELECT 
+                h.name AS habit_name,
+                p.log_date AS date,
+                p.status,
+                p.completed_at
+            FROM progress p
+            JOIN habits h ON p.habit_id = h.id
+            WHERE p.user_id = %s
+              AND p.log_date >= %s
+            ORDER BY p.log_date DESC, p.completed_at DESC
+        """, (user_id, _days_ago(days)))
+        return cursor.fetchall()
+
+@_cached("log_page")
+def get_progress_log_page(user_id, limit=LOG_PAGE_SIZE, after=None):
+    """
+    One page of the activity log, newest first: {"rows": [{"id", "habit_name",
+    "date", "status", "completed_at"}], "next": key or None}. Pass after=next
+    for the following page; "next" is None on the last one. Keyed on
+    (log_date, completed_at, id), so every page is a short range read of
+    idx_progress_user_day however long the history is. The log ends where
+    the archive starts: archived days have no time or row to show.
+    """
+    with get_cursor() as cursor:
+        cursor.execute(*_log_page_query(user_id, limit, after))
+        return _log_page(cursor.fetchall(), limit)
+
+def _log_page_query(user_id, limit, after):
+    where, args = "p.user_id = %s", [user_id]
+    if after is not None:
+        log_date, completed_at, row_id = after
+        # Rows without a time sort last within their day (NULL is lowest in both backends)
+        if completed_at is None:
+            where += " AND (p.log_date < %s OR (p.log_date = %s AND p.completed_at IS NULL AND p.id < %s))"
+            args += [log_date, log_date, row_id]
+        else:
+            where += """ AND (p.log_date < %s OR (p.log_date = %s AND (
+                p.completed_at < %s OR p.completed_at IS NULL OR (p.completed_at = %s AND p.id < %s))))"""
+            args += [log_date, log_date, completed_at, completed_at, row_id]
+    sql = f"""
+        SELECT
+            p.id,
             h.name AS habit_name,
             p.log_date AS date,
             p.status,
             p.completed_at
         FROM progress p
         JOIN habits h ON p.habit_id = h.id
-        WHERE p.user_id = %s
-          AND p.log_date >= CURDATE() - INTERVAL %s DAY
-        ORDER BY p.log_date DESC, p.completed_at DESC
-    """, (user_id, days))
-    return cursor.fetchall()
+        WHERE {where}
+        ORDER BY p.log_date DESC, p.completed_at DESC, p.id DESC
+        LIMIT %s
+    """
+    return sql, tuple(args) + (limit + 1,)  # one extra row says whether there is a next page
+
+def _log_page(rows, limit):
+    if len(rows) <= limit:
+        return {"rows": rows, "next": None}
+    rows = rows[:limit]
+    last = rows[-1]
+    return {"rows": rows, "next": (last["date"], last["completed_at"], last["id"])}
 
+@_cached("dashboard")
 def get_user_dashboard(user_id):
-    cursor.execute("""
-        SELECT 
-            (SELECT COUNT(*) FROM habits WHERE user_id=%s) AS habit_count,
-            xp,
-            streak_freeze
-        FROM users 
-        WHERE id=%s
-    """, (user_id, user_id))
-    return cursor.fetchone()
+    with get_cursor() as cursor:
+        cursor.execute("""
+            SELECT 
+                (SELECT COUNT(*) FROM habits WHERE user_id=%s) AS habit_count,
+                xp,
+                streak_freeze
+            FROM users 
+            WHERE id=%s
+        """, (user_id, user_id))
+        return cursor.fetchone()
 
 def buy_streak_freeze(user_id, cost=50):
-    cursor.execute("""
-        UPDATE users 
-        SET xp = xp - %s, streak_freeze = streak_freeze + 1
-        WHERE id=%s AND xp >= %s
-    """, (cost, user_id, cost))
-    conn.commit()   # 🔥 make sure changes are saved
-
+    with transaction() as cursor:
+        cursor.execute("""
+            UPDATE users 
+            SET xp = xp - %s, streak_freeze = streak_freeze + 1
+            WHERE id=%s AND xp >= %s
+        """, (cost, user_id, cost))
+        if not cursor.rowcount:
+            return False
+        cursor.execute("SELECT username, xp FROM users WHERE id=%s", (user_id,))
+        user = cursor.fetchone()
+    if not _capturing():
+        user_cache.invalidate(user_id, *_FREEZE_VIEWS)
+        leaderboard.update_xp(user_id, user["username"], user["xp"])
+    return True
 
-def use_streak_freeze(user_id):
-    """Consume one streak freeze if available"""
-    cursor.execute("SELECT streak_freeze FROM users WHERE id=%s", (user_id,))
-    sf = cursor.fetchone()["streak_freeze"]
 
-    if sf > 0:
+@_cached("habits")
+def get_habits(user_id):
+    with get_cursor() as cursor:
         cursor.execute("""
-            UPDATE users
-            SET streak_freeze = streak_freeze - 1
-            WHERE id = %s
+            SELECT id, name, frequency, streak, longest_streak, last_done_date
+            FROM habits
+            WHERE user_id = %s
         """, (user_id,))
-        return True
-    return False
+        return cursor.fetchall()
 
-def get_habits(user_id):
-    cursor.execute("""
-        SELECT id, name, frequency, streak, longest_streak, last_done_date
-        FROM habits
-        WHERE user_id = %s
-    """, (user_id,))
-    return cursor.fetchall()
+
+# --- Habit histories (day bitmaps, see history.py) ---
+
+def get_histories(user_id):
+    """
+    {habit_id: HabitHistory} for all of a user's habits, over their whole
+    history. Loaded once per user and patched in place by mark_* in this
+    process, so clicks never reload it.
+    """
+    return histories.get_or_load(user_id, lambda: _load_histories(user_id))
+
+def _load_histories(user_id):
+    with get_cursor() as cursor:
+        habits, rows, archived = run_batch(cursor, [
+            ("SELECT id FROM habits WHERE user_id=%s", (user_id,)),
+            ("SELECT habit_id, log_date, status FROM progress WHERE user_id=%s", (user_id,)),
+            (
+                "SELECT habit_id, month, done_mask, skipped_mask FROM progress_archive WHERE user_id=%s",
+                (user_id,)
+            ),
+        ])
+    return history.build(rows, [h["id"] for h in habits], archived)
+
+def iter_histories(days, habit_ids=None, user_ids=None):
+    """
+    Histories of the last `days` days for many habits (default: all), as
+    {habit_id: HabitHistory} dicts, one per ID_CHUNK ids. Habits without
+    rows in the window are absent. The archive is read only for windows
+    that reach past archive_cutoff().
+    """
+    column, ids = ("habit_id", habit_ids) if habit_ids is not None else ("user_id", user_ids)
+    since = _days_ago(days)
+    for chunk in _id_chunks(ids):
+        sql = "SELECT habit_id, log_date, status FROM progress WHERE log_date >= %s"
+        if chunk is not None:
+            sql += " AND " + _in_list(column, chunk)
+        with stream_cursor() as cursor:
+            cursor.execute(sql, [since] + (chunk or []))
+            rows = []
+            while True:
+                batch = cursor.fetchmany(STREAM_BATCH)
+                if not batch:
+                    break
+                rows.extend(batch)
+        archived = []
+        if _reaches_archive(since):
+            sql = "SELECT habit_id, month, done_mask, skipped_mask FROM progress_archive WHERE month >= %s"
+            if chunk is not None:
+                sql += " AND " + _in_list(column, chunk)
+            with get_cursor() as cursor:
+                cursor.execute(sql, [since.replace(day=1)] + (chunk or []))
+                archived = cursor.fetchall()
+        yield history.build(rows, archived=archived)
+
+
+@_cached("progress")
+def get_progress_matrix(user_id, days=30):
+    """
+    Progress for all of a user's habits over the last N days, from their
+    histories. See build_progress_matrix for the shape of the result.
+    """
+    with get_cursor() as cursor:
+        cursor.execute("SELECT id FROM habits WHERE user_id=%s", (user_id,))
+        habit_ids = [h["id"] for h in cursor.fetchall()]
+    return build_progress_matrix(habit_ids, get_histories(user_id), days)
+
+
+def build_progress_matrix(habit_ids, habit_histories, days=30):
+    """
+    Dense habits × days DataFrame (1 = done, 0 = missed or skipped).
+    Index is habit_id, columns are the last `days` dates ('YYYY-MM-DD')
+    ending today, oldest first. Each row is one habit's done bits for the
+    window, unpacked by NumPy.
+    """
+    import numpy as np
+    import pandas as pd
+
+    today = date.today()
+    start = today - datetime.timedelta(days=days - 1)
+    dates = pd.date_range(end=today, periods=days).strftime("%Y-%m-%d")
+    matrix = np.zeros((len(habit_ids), days), dtype=np.int8)
+    for i, habit_id in enumerate(habit_ids):
+        matrix[i] = habit_histories.get(habit_id, history.EMPTY).days(start, days)
+    return pd.DataFrame(matrix, index=pd.Index(habit_ids, name="habit_id"), columns=dates)
+
+
+def get_habit_tracker_page(user_id, progress_days=30, log_limit=LOG_PAGE_SIZE):
+    """
+    Everything the Habit Tracker page renders, fetched in one round trip
+    (or none, when the user's snapshot is cached; the leaderboard comes
+    from the shared in-process cache).
+    `progress_matrix` covers all of the user's habits for the last
+    `progress_days`, so switching the chart's habit needs no extra query.
+    It and each habit's current streak come from the cached histories.
+    `log` is the first page of get_progress_log_page().
+    """
+    page = dict(_load_habit_tracker_page(user_id, log_limit))
+    habit_histories = get_histories(user_id)
+    today = date.today()
+    # The stored streak only changes on a click; the bitmap knows when it broke since
+    page["habits"] = [
+        dict(h, streak=habit_histories.get(h["id"], history.EMPTY).current_streak(today))
+        for h in page["habits"]
+    ]
+    page["progress_matrix"] = build_progress_matrix([h["id"] for h in page["habits"]], habit_histories, progress_days)
+    page["leaderboard"] = get_leaderboard()
+    page["rank"] = get_user_rank(user_id)
+    return page
+
+
+@_cached("page")
+def _load_habit_tracker_page(user_id, log_limit):
+    with get_cursor() as cursor:
+        dash, counts, habits, log = run_batch(cursor, [
+            ("""
+                SELECT
+                    (SELECT COUNT(*) FROM habits WHERE user_id=%s) AS habit_count,
+                    xp,
+                    streak_freeze,
+                    daily_streak,
+                    daily_last_date
+                FROM users
+                WHERE id=%s
+            """, (user_id, user_id)),
+            (PROGRESS_COUNT_SQL, (user_id,)),
+            ("""
+                SELECT id, name, frequency, streak, longest_streak, last_done_date
+                FROM habits
+                WHERE user_id = %s
+            """, (user_id,)),
+            _log_page_query(user_id, log_limit, None),
+        ])
+
+    return {
+        "dashboard": dash[0] if dash else None,
+        "daily_streak": _current_daily_streak(dash[0], datetime.date.today()) if dash else 0,
+        "progress_count": counts[0],
+        "habits": habits,
+        "log": _log_page(log, log_limit),
+    }
+
+
+# --- Batch reads for nightly jobs (ai_module batch analytics) ---
+
+def _id_chunks(ids):
+    """None (no filter) once, or the ids in IN-list sized chunks."""
+    if ids is None:
+        yield None
+        return
+    ids = list(ids)
+    for i in range(0, len(ids), ID_CHUNK):
+        yield ids[i:i + ID_CHUNK]
+
+
+def _in_list(column, chunk):
+    return f"{column} IN ({', '.join(['%s'] * len(chunk))})"
+
+
+def get_habit_settings(habit_ids=None, user_ids=None):
+    """id, user_id, frequency, target_time for the given habits or users' habits (default: all)."""
+    column, ids = ("id", habit_ids) if habit_ids is not None else ("user_id", user_ids)
+    rows = []
+    with get_cursor() as cursor:
+        for chunk in _id_chunks(ids):
+            sql = "SELECT id, user_id, frequency, target_time FROM habits"
+            if chunk is not None:
+                sql += " WHERE " + _in_list(column, chunk)
+            cursor.execute(sql, chunk)
+            rows.extend(cursor.fetchall())
+    return rows
+
+
+def iter_progress_window(days, habit_ids=None, user_ids=None, batch_size=STREAM_BATCH):
+    """
+    Progress of the last `days` days for many habits (default: all), as
+    lists of {"habit_id", "status", "completed_at"} of up to `batch_size`
+    rows. One streaming query per ID_CHUNK ids, so memory stays flat no
+    matter how many habits are read. Reads progress only (completion times
+    are not archived), so keep `days` within HOT_DAYS.
+    """
+    column, ids = ("habit_id", habit_ids) if habit_ids is not None else ("user_id", user_ids)
+    since = _days_ago(days)
+    for chunk in _id_chunks(ids):
+        sql = "SELECT habit_id, status, completed_at FROM progress WHERE log_date >= %s"
+        if chunk is not None:
+            sql += " AND " + _in_list(column, chunk)
+        with stream_cursor() as cursor:
+            cursor.execute(sql, [since] + (chunk or []))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
 
 
 ### FINANCE-TRACKER
 
 def save_finance(user_id, salary, emi, debt):
-    cursor.execute("SELECT id FROM finance WHERE user_id=%s", (user_id,))
-    if cursor.fetchone():
-        cursor.execute(
-            "UPDATE finance SET salary=%s, emi=%s, debt=%s WHERE user_id=%s",
-            (salary, emi, debt, user_id)
-        )
-    else:
-        cursor.execute(
-            "INSERT INTO finance (user_id, salary, emi, debt) VALUES (%s, %s, %s, %s)",
-            (user_id, salary, emi, debt)
-        )
-    conn.commit()
+    with get_cursor() as cursor:
+        cursor.execute("SELECT id FROM finance WHERE user_id=%s", (user_id,))
+        if cursor.fetchone():
+            cursor.execute(
+                "UPDATE finance SET salary=%s, emi=%s, debt=%s WHERE user_id=%s",
+                (salary, emi, debt, user_id)
+            )
+        else:
+            cursor.execute(
+                "INSERT INTO finance (user_id, salary, emi, debt) VALUES (%s, %s, %s, %s)",
+                (user_id, salary, emi, debt)
+            )
+    if not _capturing():
+        user_cache.invalidate(user_id, "finance")
 
 
+@_cached("finance")
 def get_finance(user_id):
-    cursor.execute("SELECT salary, emi, debt FROM finance WHERE user_id=%s", (user_id,))
-    row = cursor.fetchone()
+    """salary, emi, debt and the running total_paid (kept up to date by add_payment)."""
+    with get_cursor() as cursor:
+        cursor.execute("SELECT salary, emi, debt, total_paid FROM finance WHERE user_id=%s", (user_id,))
+        row = cursor.fetchone()
     if row:
         return row
     return None
 
 def add_payment(user_id, amount):
-    cursor.execute(
-        "INSERT INTO finance_payments (user_id, amount, payment_date) VALUES (%s, %s, %s)",
-        (user_id, amount, date.today().isoformat())
-    )
-    conn.commit()
+    # Ledger row and running balance commit together
+    with transaction() as cursor:
+        cursor.execute(
+            "INSERT INTO finance_payments (user_id, amount, payment_date) VALUES (%s, %s, %s)",
+            (user_id, amount, date.today().isoformat())
+        )
+        cursor.execute(f"""
+            INSERT INTO finance (user_id, total_paid) VALUES (%s, %s)
+            {backend.upsert_add(("user_id",), ("total_paid",))}
+        """, (user_id, amount))
+    if not _capturing():
+        user_cache.invalidate(user_id, *_PAYMENT_VIEWS)
 
+@_cached("payments")
 def get_total_payments(user_id):
-    # Use a dict cursor for safety
-    cursor = conn.cursor(pymysql.cursors.DictCursor)
-    cursor.execute("SELECT SUM(amount) AS total FROM finance_payments WHERE user_id = %s", (user_id,))
-    result = cursor.fetchone()
-    if result is None or result["total"] is None:
+    with get_cursor() as cursor:
+        cursor.execute("SELECT total_paid FROM finance WHERE user_id = %s", (user_id,))
+        result = cursor.fetchone()
+    if result is None or result["total_paid"] is None:
         return 0.0
-    return float(result["total"])
-
+    return float(result["total_paid"])
 
+@_cached("payments")
+def get_payment_history(user_id, limit=20, before=None):
+    """
+    One page of payments, newest first: [{"id", "amount", "payment_date"}].
+    For the next page pass before=(payment_date, id) of the last row; each
+    page is an index range read, however long the history is.
+    """
+    with get_cursor() as cursor:
+        if before is None:
+            cursor.execute("""
+                SELECT id, amount, payment_date
+                FROM finance_payments
+                WHERE user_id = %s
+                ORDER BY payment_date DESC, id DESC
+                LIMIT %s
+            """, (user_id, limit))
+        else:
+            before_date, before_id = before
+            cursor.execute("""
+                SELECT id, amount, payment_date
+                FROM finance_payments
+                WHERE user_id = %s
+                  AND (payment_date < %s OR (payment_date = %s AND id < %s))
+                ORDER BY payment_date DESC, id DESC
+                LIMIT %s
+            """, (user_id, before_date, before_date, before_id, limit))
+        return cursor.fetchall()
 
+@_cached("payment_average")
+def get_average_monthly_payment(user_id, months=6):
+    """Paid per month on average over the last `months` months (30-day months)."""
+    with get_cursor() as cursor:
+        cursor.execute(
+            "SELECT SUM(amount) AS total FROM finance_payments WHERE user_id = %s AND payment_date >= %s",
+            (user_id, _days_ago(months * 30))
+        )
+        row = cursor.fetchone()
+    return float(row["total"] or 0) / months if row else 0.0
 
+def reconcile_finance(user_id=None, fix=False):
+    """
+    Compare finance.total_paid with SUM(amount) of the ledger for one user
+    or everyone. Returns the mismatches as [{"user_id", "total_paid", "ledger"}]
+    (total_paid is None when the user has payments but no finance row).
+    With fix=True each one is reset from the ledger in a single statement,
+    so payments landing meanwhile are not lost.
+    """
+    args = (user_id,) if user_id is not None else ()
+    ledger_filter = "WHERE user_id = %s" if args else ""
+    balance_filter = "AND f.user_id = %s" if args else ""
+    with get_cursor() as cursor:
+        cursor.execute(f"""
+            SELECT l.user_id, f.total_paid, l.ledger
+            FROM (
+                SELECT user_id, SUM(amount) AS ledger
+                FROM finance_payments
+                {ledger_filter}
+                GROUP BY user_id
+            ) l
+            LEFT JOIN finance f ON f.user_id = l.user_id
+            WHERE f.user_id IS NULL OR ABS(f.total_paid - l.ledger) >= 0.005
+        """, args)
+        mismatches = list(cursor.fetchall())  # pymysql returns a tuple
+        # Balances with no ledger rows at all
+        cursor.execute(f"""
+            SELECT f.user_id, f.total_paid, 0 AS ledger
+            FROM finance f
+            WHERE f.total_paid <> 0 {balance_filter}
+              AND NOT EXISTS (SELECT 1 FROM finance_payments p WHERE p.user_id = f.user_id)
+        """, args)
+        mismatches += cursor.fetchall()
 
+        if fix:
+            for m in mismatches:
+                cursor.execute(f"{backend.insert_ignore} INTO finance (user_id) VALUES (%s)", (m["user_id"],))
+                cursor.execute("""
+                    UPDATE finance
+                    SET total_paid = (SELECT COALESCE(SUM(amount), 0) FROM finance_payments WHERE user_id = %s)
+                    WHERE user_id = %s
+                """, (m["user_id"], m["user_id"]))
+    if fix and not _capturing():
+        for m in mismatches:
+            user_cache.invalidate(m["user_id"], *_PAYMENT_VIEWS)
+    return mismatches
@@ -0,0 +1,204 @@
+# history.py
+"""
+Habit history as day bitmaps.
+
+A HabitHistory keeps two Python ints, `done` and `skipped`, where bit i
+stands for the day `origin + i` (origin being the first logged day).
+A year of history is about 46 bytes per mask, and the questions the app
+keeps asking become bit arithmetic on those ints:
+
+    current streak    run of set bits ending today (or yesterday)
+    longest streak    longest run of set bits
+    window counts     popcount of a shifted, masked slice
+    gaps              distance to the highest set bit below a day
+
+The same structure holds any set of days, e.g. the days a user did at
+least one habit (recompute_daily_streaks in database.py).
+"""
+import datetime
+
+
+class HabitHistory:
+    """Done/skipped days of one habit. Immutable: marked() returns a new history."""
+
+    __slots__ = ("origin", "done", "skipped")
+
+    def __init__(self, origin=None, done=0, skipped=0):
+        self.origin = origin    # ordinal of bit 0, None while empty
+        self.done = done
+        self.skipped = skipped
+
+    @classmethod
+    def from_days(cls, days):
+        """History whose done days are `days` (dates or 'YYYY-MM-DD' strings)."""
+        ordinals = [_ordinal(d) for d in days]
+        if not ordinals:
+            return cls()
+        origin = min(ordinals)
+        return cls(origin, _mask(ordinals, origin))
+
+    def marked(self, day, status):
+        """A copy with `day` set in the done or skipped mask."""
+        o = _ordinal(day)
+        origin, done, skipped = self.origin, self.done, self.skipped
+        if origin is None:
+            origin = o
+        elif o < origin:
+            # Earlier than anything logged so far: move bit 0 back
+            done <<= origin - o
+            skipped <<= origin - o
+            origin = o
+        bit = 1 << (o - origin)
+        if status == "done":
+            done |= bit
+        else:
+            skipped |= bit
+        return HabitHistory(origin, done, skipped)
+
+    def _index(self, day):
+        return _ordinal(day) - self.origin
+
+    def window(self, start, days, status="done"):
+        """The `days` bits starting at `start` as an int (bit 0 = start)."""
+        if self.origin is None:
+            return 0
+        mask = self.done if status == "done" else self.skipped
+        i = self._index(start)
+        bits = mask >> i if i >= 0 else mask << -i
+        return bits & ((1 << days) - 1)
+
+    def count(self, start, end, status="done"):
+        """Days from start to end (inclusive) with that status."""
+        days = _ordinal(end) - _ordinal(start) + 1
+        return self.window(start, days, status).bit_count() if days > 0 else 0
+
+    def is_done(self, day):
+        if self.origin is None:
+            return False
+        i = self._index(day)
+        return i >= 0 and bool(self.done >> i & 1)
+
+    def run_ending(self, day):
+        """Consecutive done days ending on `day` (0 if `day` is not done)."""
+        if not self.is_done(day):
+            return 0
+        top = self._index(day) + 1
+        span = (1 << top) - 1
+        gaps = ~self.done & span
+        return top if not gaps else top - gaps.bit_length()
+
+    def current_streak(self, today):
+        """Streak still alive today: the run ending today, or yesterday if today is not logged yet."""
+        if self.is_done(today):
+            return self.run_ending(today)
+        return self.run_ending(today - datetime.timedelta(days=1))
+
+    def longest_streak(self):
+        # bin() and split() walk the mask in C, one pass however long the history
+        return max(map(len, bin(self.done)[2:].split("0"))) if self.done else 0
+
+    def last_done(self, before=None):
+        """Latest done day (strictly before `before` if given), or None."""
+        if self.origin is None:
+            return None
+        mask = self.done
+        if before is not None:
+            i = self._index(before)
+            mask &= (1 << i) - 1 if i > 0 else 0
+        if not mask:
+            return None
+        return datetime.date.fromordinal(self.origin + mask.bit_length() - 1)
+
+    def gap_before(self, day):
+        """Days missed between the last done day and `day` (None if nothing was done before)."""
+        last = self.last_done(before=day)
+        return None if last is None else (_ordinal(day) - last.toordinal() - 1)
+
+    def days(self, start, days, status="done"):
+        """0/1 per day from `start`, oldest first, as a NumPy int8 array."""
+        import numpy as np
+        bits = self.window(start, days, status)
+        raw = np.frombuffer(bits.to_bytes((days + 7) // 8, "little"), dtype=np.uint8)
+        return np.unpackbits(raw, bitorder="little")[:days].astype(np.int8)
+
+    def __repr__(self):
+        return f"HabitHistory(origin={self.origin}, done={self.done:#x}, skipped={self.skipped:#x})"
+
+
+EMPTY = HabitHistory()
+
+
+def build(rows, habit_ids=(), archived=()):
+    """
+    {habit_id: HabitHistory} from progress rows with habit_id, log_date and
+    status, plus progress_archive rows (habit_id, month, done_mask,
+    skipped_mask: bit d-1 = day d of the month). Every id in `habit_ids`
+    gets an entry, even with no rows.
+    """
+    days = {habit_id: ([], []) for habit_id in habit_ids}
+    for r in rows:
+        done, skipped = days.setdefault(r["habit_id"], ([], []))
+        (done if r["status"] == "done" else skipped).append(_ordinal(r["log_date"]))
+    months = {}
+    for r in archived:
+        months.setdefault(r["habit_id"], []).append((_ordinal(r["month"]), r["done_mask"], r["skipped_mask"]))
+        days.setdefault(r["habit_id"], ([], []))
+
+    histories = {}
+    for habit_id, (done_days, skipped_days) in days.items():
+        packed = months.get(habit_id, ())
+        if not done_days and not skipped_days and not packed:
+            histories[habit_id] = EMPTY
+            continue
+        origin = min(done_days + skipped_days + [month for month, _, _ in packed])
+        done, skipped = _mask(done_days, origin), _mask(skipped_days, origin)
+        for month, done_mask, skipped_mask in packed:
+            done |= done_mask << (month - origin)
+            skipped |= skipped_mask << (month - origin)
+        histories[habit_id] = HabitHistory(origin, done, skipped)
+    return histories
+
+
+def month_masks(rows):
+    """
+    Pack progress rows into {(habit_id, first of month): [user_id, done_mask,
+    skipped_mask]}, the progress_archive layout.
+    """
+    packed = {}
+    for r in rows:
+        day = _date(r["log_date"])
+        entry = packed.setdefault((r["habit_id"], day.replace(day=1)), [r["user_id"], 0, 0])
+        entry[1 if r["status"] == "done" else 2] |= 1 << (day.day - 1)
+    return packed
+
+
+def month_days(month, mask):
+    """The dates whose bits are set in a month mask."""
+    month = _date(month)
+    days = []
+    while mask:
+        low = mask & -mask
+        days.append(month + datetime.timedelta(days=low.bit_length() - 1))
+        mask ^= low
+    return days
+
+
+def _mask(ordinals, origin):
+    mask = 0
+    for o in ordinals:
+        mask |= 1 << (o - origin)
+    return mask
+
+
+def _date(value):
+    return datetime.date.fromordinal(_ordinal(value))
+
+
+def _ordinal(value):
+    if isinstance(value, int):
+        return value
+    if isinstance(value, datetime.datetime):
+        return value.date().toordinal()
+    if isinstance(value, str):
+        return datetime.date.fromisoformat(value[:10]).toordinal()
+    return value.toordinal()
@@ -0,0 +1,324 @@
+# instrumentation.py
+"""
+Query instrumentation: what each Streamlit rerun asked the database.
+
+Every statement run through database.get_cursor()/transaction() while a
+profile is active is recorded with its SQL, parameter shape (types only,
+never values), row count, wall time and the database.py function that
+sent it. Finished profiles are folded into per-page aggregates that can
+be exported as JSON log lines or Prometheus text.
+
+    DUO_QUERY_STATS=1         profile every rerun in app.py
+    DUO_QUERY_LOG_EVERY=60    log the aggregates at most every N seconds ("duo.queries" logger)
+    DUO_QUERY_PROM_FILE=path  rewrite Prometheus text there on the same schedule
+"""
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+ENABLED = os.environ.get("DUO_QUERY_STATS", "") not in ("", "0")
+LOG_EVERY = float(os.environ.get("DUO_QUERY_LOG_EVERY", "60"))
+PROM_FILE = os.environ.get("DUO_QUERY_PROM_FILE")
+
+log = logging.getLogger("duo.queries")
+
+# Frames skipped when looking for the function that sent a statement
+_PLUMBING_FILES = ("instrumentation.py", "backends.py", "contextlib.py")
+_PLUMBING_FUNCS = ("run_batch", "get_cursor", "transaction", "wrapper", "get_or_load", "<lambda>")
+
+
+class Profile:
+    """Statements recorded during one rerun (or any other block of work)."""
+
+    def __init__(self, page):
+        self.page = page
+        self.queries = []
+        self.started = time.perf_counter()
+        self.elapsed_ms = None
+        self.aborted = False    # cut short before finish() (its elapsed time is unknown)
+
+    @property
+    def query_ms(self):
+        return sum(q["ms"] for q in self.queries)
+
+    def slowest(self, n=5):
+        return sorted(self.queries, key=lambda q: q["ms"], reverse=True)[:n]
+
+    def summary(self):
+        return {
+            "page": self.page,
+            "queries": len(self.queries),
+            "query_ms": round(self.query_ms, 3),
+            "elapsed_ms": round(self.elapsed_ms or 0, 3),
+            "aborted": self.aborted,
+            "slowest": [
+                {k: q[k] for k in ("caller", "sql", "shape", "rows", "ms")}
+                for q in self.slowest(3)
+            ],
+        }
+
+
+class Aggregates:
+    """Running totals per (page, caller, statement), shared by every session."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._statements = {}   # (page, caller, sql) -> {"count", "ms", "max_ms", "rows"}
+        self._reruns = {}       # page -> {"count", "queries", "ms"}
+        self._last_export = time.monotonic()
+
+    def add(self, profile):
+        with self._lock:
+            run = self._reruns.setdefault(profile.page, {"count": 0, "aborted": 0, "queries": 0, "ms": 0.0})
+            run["count"] += 1
+            run["aborted"] += profile.aborted
+            run["queries"] += len(profile.queries)
+            run["ms"] += profile.elapsed_ms or 0
+            for q in profile.queries:
+                key = (profile.page, q["caller"], q["sql"])
+                s = self._statements.setdefault(key, {"count": 0, "ms": 0.0, "max_ms": 0.0, "rows": 0})
+                s["count"] += 1
+                s["ms"] += q["ms"]
+                s["max_ms"] = max(s["max_ms"], q["ms"])
+                s["rows"] += q["rows"]
+
+    def snapshot(self):
+        with self._lock:
+            statements = [
+                {"page": page, "caller": caller, "sql": sql, **dict(s)}
+                for (page, caller, sql), s in self._statements.items()
+            ]
+            reruns = {page: dict(r) for page, r in self._reruns.items()}
+        statements.sort(key=lambda s: s["ms"], reverse=True)
+        return {"reruns": reruns, "statements": statements}
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+            self._reruns.clear()
+
+    def due_for_export(self):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_export < LOG_EVERY:
+                return False
+            self._last_export = now
+            return True
+
+
+aggregates = Aggregates()
+_current = contextvars.ContextVar("duo_query_profile", default=None)
+
+
+# --- Recording ---
+
+def start(page):
+    """
+    Begin profiling the current rerun. A profile an aborted rerun left open
+    (an exception, or a widget interrupting the script) is counted as aborted.
+    """
+    left_open = _current.get()
+    if left_open is not None:
+        finish(left_open, aborted=True)
+    profile = Profile(page)
+    _current.set(profile)
+    return profile
+
+
+def finish(profile=None, aborted=False):
+    """Close the current profile, fold it into the aggregates and export if due."""
+    profile = profile or _current.get()
+    if profile is None:
+        return None
+    _current.set(None)
+    profile.aborted = aborted
+    if not aborted:
+        profile.elapsed_ms = (time.perf_counter() - profile.started) * 1000
+    aggregates.add(profile)
+    log.debug(json.dumps({"event": "rerun", **profile.summary()}, default=str))
+    if aggregates.due_for_export():
+        export()
+    return profile
+
+
+@contextmanager
+def profile(page):
+    """`with profile("manage nightly"):` — same as start()/finish() around a block."""
+    p = start(page)
+    try:
+        yield p
+    finally:
+        finish(p)
+
+
+def current():
+    return _current.get()
+
+
+def wrap(cursor):
+    """Cursor hook used by database._wrap: record statements while a profile is active."""
+    p = _current.get()
+    return cursor if p is None else _RecordingCursor(cursor, p)
+
+
+class _RecordingCursor:
+    def __init__(self, cursor, profile):
+        self._cursor = cursor
+        self._profile = profile
+        self._last = None
+        self._count_fetches = False
+
+    def execute(self, sql, args=None):
+        t = time.perf_counter()
+        try:
+            return self._cursor.execute(sql, args)
+        finally:
+            self._record(sql, _shape(args), t)
+
+    def executemany(self, sql, seq_of_args):
+        seq_of_args = list(seq_of_args)
+        t = time.perf_counter()
+        try:
+            return self._cursor.executemany(sql, seq_of_args)
+        finally:
+            first = _shape(seq_of_args[0]) if seq_of_args else "()"
+            self._record(sql, f"{len(seq_of_args)} x {first}", t)
+
+    def _record(self, sql, shape, started):
+        ms = (time.perf_counter() - started) * 1000
+        rows = self._cursor.rowcount
+        if rows is None or rows >= 2 ** 63:
+            rows = -1  # unbuffered pymysql cursors report 2**64 - 1 until drained
+        self._last = {
+            "sql": " ".join(sql.split()),
+            "shape": shape,
+            "rows": max(rows, 0),
+            "ms": ms,
+            "caller": _caller(),
+        }
+        # sqlite3 reports rowcount -1 for SELECTs, so count what is fetched instead
+        self._count_fetches = rows < 0
+        self._profile.queries.append(self._last)
+
+    def _fetched(self, n):
+        if self._count_fetches:
+            self._last["rows"] += n
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        self._fetched(row is not None)
+        return row
+
+    def fetchmany(self, size):
+        rows = self._cursor.fetchmany(size)
+        self._fetched(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._fetched(len(rows))
+        return rows
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+def _shape(args):
+    if args is None:
+        return "()"
+    if isinstance(args, dict):
+        return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in args.items()) + "}"
+    if not isinstance(args, (tuple, list)):
+        args = (args,)
+    return "(" + ", ".join(type(a).__name__ for a in args) + ")"
+
+
+def _caller():
+    """Name of the first frame outside the cursor/pool/cache plumbing, e.g. 'database.get_habits'."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        code = frame.f_code
+        filename = os.path.basename(code.co_filename)
+        if filename not in _PLUMBING_FILES and code.co_name not in _PLUMBING_FUNCS:
+            module = frame.f_globals.get("__name__", filename)
+            return f"{module}.{code.co_name}"
+        frame = frame.f_back
+    return "?"
+
+
+# --- Export ---
+
+def log_records():
+    """The aggregates as a list of flat dicts, one per rerun page and per statement."""
+    snap = aggregates.snapshot()
+    records = [{"event": "page", "page": page, **r} for page, r in snap["reruns"].items()]
+    records += [{"event": "statement", **s} for s in snap["statements"]]
+    return records
+
+
+def prometheus_text():
+    """Prometheus exposition format, labelled by page and calling function."""
+    snap = aggregates.snapshot()
+    lines = [
+        "# HELP duo_reruns_total Profiled Streamlit reruns.",
+        "# TYPE duo_reruns_total counter",
+    ]
+    for page, r in snap["reruns"].items():
+        lines.append(f'duo_reruns_total{{page="{_label(page)}"}} {r["count"]}')
+    lines += [
+        "# HELP duo_reruns_aborted_total Profiled reruns cut short before they finished.",
+        "# TYPE duo_reruns_aborted_total counter",
+    ]
+    for page, r in snap["reruns"].items():
+        lines.append(f'duo_reruns_aborted_total{{page="{_label(page)}"}} {r["aborted"]}')
+    lines += [
+        "# HELP duo_rerun_queries_total Statements sent during profiled reruns.",
+        "# TYPE duo_rerun_queries_total counter",
+    ]
+    for page, r in snap["reruns"].items():
+        lines.append(f'duo_rerun_queries_total{{page="{_label(page)}"}} {r["queries"]}')
+    lines += [
+        "# HELP duo_rerun_seconds_total Wall time of profiled reruns.",
+        "# TYPE duo_rerun_seconds_total counter",
+    ]
+    for page, r in snap["reruns"].items():
+        lines.append(f'duo_rerun_seconds_total{{page="{_label(page)}"}} {r["ms"] / 1000:.6f}')
+
+    by_caller = {}
+    for s in snap["statements"]:
+        c = by_caller.setdefault((s["page"], s["caller"]), {"count": 0, "ms": 0.0, "max_ms": 0.0, "rows": 0})
+        c["count"] += s["count"]
+        c["ms"] += s["ms"]
+        c["max_ms"] = max(c["max_ms"], s["max_ms"])
+        c["rows"] += s["rows"]
+    metrics = [
+        ("duo_queries_total", "counter", "Statements sent.", lambda c: c["count"]),
+        ("duo_query_seconds_total", "counter", "Time spent in statements.", lambda c: f'{c["ms"] / 1000:.6f}'),
+        ("duo_query_seconds_max", "gauge", "Slowest single statement.", lambda c: f'{c["max_ms"] / 1000:.6f}'),
+        ("duo_query_rows_total", "counter", "Rows returned or affected.", lambda c: c["rows"]),
+    ]
+    for name, kind, help_text, value in metrics:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        for (page, caller), c in by_caller.items():
+            lines.append(f'{name}{{page="{_label(page)}",caller="{_label(caller)}"}} {value(c)}')
+    return "\n".join(lines) + "\n"
+
+
+def export():
+    """Emit the aggregates to the "duo.queries" log and DUO_QUERY_PROM_FILE (if set)."""
+    for record in log_records():
+        log.info(json.dumps(record, default=str))
+    if PROM_FILE:
+        tmp = PROM_FILE + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(prometheus_text())
+        os.replace(tmp, PROM_FILE)  # scrapers never see a half-written file
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
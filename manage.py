@@ -0,0 +1,180 @@
+# manage.py
+"""
+Maintenance commands for Duo Tracker.
+
+    python manage.py migrate [--to VERSION]
+    python manage.py recompute-streaks [--user ID]
+    python manage.py settle-freezes [--user ID]
+    python manage.py explain [--user ID] [--habit ID]
+    python manage.py rebuild-rollups [--user ID]
+    python manage.py archive-progress
+    python manage.py nightly-risk [--user ID] [--window 14] [--out risk.csv]
+    python manage.py reconcile-finance [--user ID] [--fix]
+    python manage.py export DIR [--format csv|parquet] [--user ID]
+    python manage.py import DIR
+"""
+import argparse
+import csv
+import sys
+import time
+import ai_module
+import database
+import migrations
+import transfer
+
+
+def cmd_migrate(args):
+    applied = migrations.migrate(target=args.to)
+    if not applied:
+        print("Schema is up to date.")
+    for version, description in applied:
+        print(f"Applied {version:03d}: {description}")
+
+
+def cmd_recompute_streaks(args):
+    n = database.recompute_daily_streaks(user_id=args.user)
+    print(f"Recomputed daily streaks for {n} user(s).")
+
+
+def cmd_settle_freezes(args):
+    n = database.settle_streak_freezes(user_id=args.user)
+    print(f"Settled streak freezes for {n} user(s).")
+
+
+def cmd_rebuild_rollups(args):
+    days, habits = database.rebuild_rollups(user_id=args.user)
+    print(f"Rebuilt {days} daily rollup row(s) and {habits} habit total(s).")
+
+
+def cmd_archive_progress(args):
+    t = time.perf_counter()
+    n = database.archive_progress()
+    print(f"Archived {n} progress row(s) from before {database.archive_cutoff()} "
+          f"in {time.perf_counter() - t:.1f}s.")
+
+
+def cmd_explain(args):
+    report, failures = migrations.check_query_plans(user_id=args.user, habit_id=args.habit)
+    for e in report:
+        flag = "FAIL" if e in failures else ("scan" if e.get("full_scan") else "ok")
+        print(f"{flag:4}  {e['function']:24} {str(e['table']):18} {str(e['type']):7} key={e['key']}  rows={e['rows']}")
+    if failures:
+        print(f"\n{len(failures)} full table scan(s) with no usable index:")
+        for e in failures:
+            print(f"  {e['function']}: {e['sql']}")
+        sys.exit(1)
+
+
+def cmd_nightly_risk(args):
+    t = time.perf_counter()
+    users = [args.user] if args.user is not None else None
+    habits = database.get_habit_settings(user_ids=users)
+    risks = ai_module.predict_dropout_risks(user_ids=users, window_days=args.window)
+    reminders = ai_module.suggest_reminder_times(user_ids=users, window_days=args.reminder_window)
+
+    counts = {"HIGH": 0, "MEDIUM": 0, "LOW": 0}
+    for risk, label in risks.values():
+        counts[label] += 1
+    print(f"Scored {len(risks)} habit(s) in {time.perf_counter() - t:.1f}s: "
+          + ", ".join(f"{n} {label}" for label, n in counts.items()))
+
+    if args.out:
+        with open(args.out, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["user_id", "habit_id", "risk", "label", "reminder_time"])
+            for h in habits:
+                if h["id"] not in risks:
+                    continue  # added while the job ran
+                risk, label = risks[h["id"]]
+                writer.writerow([h["user_id"], h["id"], f"{risk:.3f}", label, reminders[h["id"]]])
+        print(f"Wrote {args.out}")
+
+
+def cmd_reconcile_finance(args):
+    mismatches = database.reconcile_finance(user_id=args.user, fix=args.fix)
+    for m in mismatches:
+        print(f"user {m['user_id']}: total_paid={m['total_paid']} ledger={m['ledger']}")
+    if not mismatches:
+        print("All balances match the payment ledger.")
+    elif args.fix:
+        print(f"Fixed {len(mismatches)} balance(s).")
+    else:
+        print(f"{len(mismatches)} balance(s) differ from the ledger (rerun with --fix to reset them).")
+        sys.exit(1)
+
+
+def cmd_export(args):
+    t = time.perf_counter()
+    counts = transfer.export(args.dir, fmt=args.format, user_id=args.user)
+    for table, n in counts.items():
+        print(f"{table:18} {n:10d} row(s)")
+    print(f"Exported to {args.dir} in {time.perf_counter() - t:.1f}s")
+
+
+def cmd_import(args):
+    t = time.perf_counter()
+    try:
+        counts = transfer.import_dir(args.dir)
+    except transfer.TransferError as e:
+        sys.exit(f"Import failed, nothing was written: {e}")
+    for table, n in counts.items():
+        print(f"{table:18} {n:10d} row(s)")
+    print(f"Imported from {args.dir} in {time.perf_counter() - t:.1f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="manage.py", description="Duo Tracker maintenance commands")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("migrate", help="apply pending schema migrations")
+    p.add_argument("--to", type=int, default=None, help="stop at this migration version")
+    p.set_defaults(func=cmd_migrate)
+
+    p = sub.add_parser("recompute-streaks", help="backfill users.daily_streak from progress history")
+    p.add_argument("--user", type=int, default=None, help="only this user id")
+    p.set_defaults(func=cmd_recompute_streaks)
+
+    p = sub.add_parser("settle-freezes", help="daily settlement: spend freezes on missed days (run nightly)")
+    p.add_argument("--user", type=int, default=None, help="only this user id")
+    p.set_defaults(func=cmd_settle_freezes)
+
+    p = sub.add_parser("rebuild-rollups", help="recompute the progress rollup tables from progress")
+    p.add_argument("--user", type=int, default=None, help="only this user id")
+    p.set_defaults(func=cmd_rebuild_rollups)
+
+    p = sub.add_parser("archive-progress", help="compact progress older than DUO_HOT_DAYS into monthly masks")
+    p.set_defaults(func=cmd_archive_progress)
+
+    p = sub.add_parser("explain", help="EXPLAIN every query function; fail on full table scans")
+    p.add_argument("--user", type=int, default=None, help="explain against this user id")
+    p.add_argument("--habit", type=int, default=None, help="explain against this habit id")
+    p.set_defaults(func=cmd_explain)
+
+    p = sub.add_parser("nightly-risk", help="dropout risk + reminder time for every habit (notification job)")
+    p.add_argument("--user", type=int, default=None, help="only this user id")
+    p.add_argument("--window", type=int, default=14, help="days of history for the risk score")
+    p.add_argument("--reminder-window", type=int, default=30, help="days of history for reminder times")
+    p.add_argument("--out", help="write user_id, habit_id, risk, label, reminder_time to this CSV")
+    p.set_defaults(func=cmd_nightly_risk)
+
+    p = sub.add_parser("reconcile-finance", help="check finance.total_paid against the payment ledger")
+    p.add_argument("--user", type=int, default=None, help="only this user id")
+    p.add_argument("--fix", action="store_true", help="reset mismatched balances from the ledger")
+    p.set_defaults(func=cmd_reconcile_finance)
+
+    p = sub.add_parser("export", help="stream tables to CSV or Parquet files in a directory")
+    p.add_argument("dir", help="output directory (one file per table)")
+    p.add_argument("--format", choices=transfer.FORMATS, default="csv")
+    p.add_argument("--user", type=int, default=None, help="only this user id")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("import", help="bulk load a directory written by export")
+    p.add_argument("dir", help="directory with users.csv/.parquet and friends")
+    p.set_defaults(func=cmd_import)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,417 @@
+# migrations.py
+"""
+Versioned schema migrations for the tables database.py expects.
+Each migration runs once; applied versions are recorded in schema_migrations.
+Run with `python manage.py migrate`.
+
+A migration's statements are either one list for every backend or a dict
+of lists keyed by backend name ("mysql", "sqlite") where the DDL differs.
+"""
+import datetime
+import database
+
+MIGRATIONS = [
+    (1, "baseline tables", {
+        "mysql": [
+            """
+            CREATE TABLE IF NOT EXISTS users (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                username VARCHAR(100) NOT NULL UNIQUE,
+                email VARCHAR(255) NULL,
+                xp INT NOT NULL DEFAULT 0,
+                streak_freeze INT NOT NULL DEFAULT 0,
+                created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS habits (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                user_id INT NOT NULL,
+                name VARCHAR(255) NOT NULL,
+                frequency VARCHAR(20) NOT NULL DEFAULT 'daily',
+                target INT NOT NULL DEFAULT 1,
+                target_time VARCHAR(5) NULL,
+                streak INT NOT NULL DEFAULT 0,
+                longest_streak INT NOT NULL DEFAULT 0,
+                last_done_date DATE NULL,
+                KEY idx_habits_user (user_id)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS progress (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                user_id INT NOT NULL,
+                habit_id INT NOT NULL,
+                status VARCHAR(10) NOT NULL,
+                completed_at DATETIME NULL,
+                log_date DATE NOT NULL
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS finance (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                user_id INT NOT NULL UNIQUE,
+                salary DECIMAL(12, 2) NOT NULL DEFAULT 0,
+                emi DECIMAL(12, 2) NOT NULL DEFAULT 0,
+                debt DECIMAL(12, 2) NOT NULL DEFAULT 0
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS finance_payments (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                user_id INT NOT NULL,
+                amount DECIMAL(12, 2) NOT NULL,
+                payment_date DATE NOT NULL
+            )
+            """,
+        ],
+        "sqlite": [
+            """
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY,
+                username VARCHAR(100) NOT NULL UNIQUE,
+                email VARCHAR(255) NULL,
+                xp INT NOT NULL DEFAULT 0,
+                streak_freeze INT NOT NULL DEFAULT 0,
+                created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS habits (
+                id INTEGER PRIMARY KEY,
+                user_id INT NOT NULL,
+                name VARCHAR(255) NOT NULL,
+                frequency VARCHAR(20) NOT NULL DEFAULT 'daily',
+                target INT NOT NULL DEFAULT 1,
+                target_time VARCHAR(5) NULL,
+                streak INT NOT NULL DEFAULT 0,
+                longest_streak INT NOT NULL DEFAULT 0,
+                last_done_date DATE NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_habits_user ON habits (user_id)",
+            """
+            CREATE TABLE IF NOT EXISTS progress (
+                id INTEGER PRIMARY KEY,
+                user_id INT NOT NULL,
+                habit_id INT NOT NULL,
+                status VARCHAR(10) NOT NULL,
+                completed_at DATETIME NULL,
+                log_date DATE NOT NULL
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS finance (
+                id INTEGER PRIMARY KEY,
+                user_id INT NOT NULL UNIQUE,
+                salary DECIMAL(12, 2) NOT NULL DEFAULT 0,
+                emi DECIMAL(12, 2) NOT NULL DEFAULT 0,
+                debt DECIMAL(12, 2) NOT NULL DEFAULT 0
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS finance_payments (
+                id INTEGER PRIMARY KEY,
+                user_id INT NOT NULL,
+                amount DECIMAL(12, 2) NOT NULL,
+                payment_date DATE NOT NULL
+            )
+            """,
+        ],
+    }),
+    (2, "materialized daily streak on users", {
+        "mysql": [
+            """
+            ALTER TABLE users
+                ADD COLUMN daily_streak INT NOT NULL DEFAULT 0,
+                ADD COLUMN daily_last_date DATE NULL
+            """,
+        ],
+        "sqlite": [
+            "ALTER TABLE users ADD COLUMN daily_streak INT NOT NULL DEFAULT 0",
+            "ALTER TABLE users ADD COLUMN daily_last_date DATE NULL",
+        ],
+    }),
+    (3, "streak freeze usage ledger", [
+        """
+        CREATE TABLE IF NOT EXISTS streak_freeze_usage (
+            user_id INT NOT NULL,
+            covered_date DATE NOT NULL,
+            used_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, covered_date)
+        )
+        """,
+    ]),
+    (4, "one progress row per habit per day", {
+        # Keep the earliest entry where double clicks already logged a day twice
+        "mysql": [
+            """
+            DELETE p1 FROM progress p1
+            JOIN progress p2
+              ON p1.habit_id = p2.habit_id AND p1.log_date = p2.log_date AND p1.id > p2.id
+            """,
+            "ALTER TABLE progress ADD UNIQUE KEY uq_progress_habit_day (habit_id, log_date)",
+        ],
+        "sqlite": [
+            "DELETE FROM progress WHERE id NOT IN (SELECT MIN(id) FROM progress GROUP BY habit_id, log_date)",
+            "CREATE UNIQUE INDEX uq_progress_habit_day ON progress (habit_id, log_date)",
+        ],
+    }),
+    (5, "indexes for the hot query paths", [
+        # get_user_progress_count, recompute_daily_streaks: user's done days
+        "CREATE INDEX idx_progress_user_status_day ON progress (user_id, status, log_date)",
+        # page snapshot progress window, activity log
+        "CREATE INDEX idx_progress_user_day ON progress (user_id, log_date, completed_at)",
+        # leaderboard: ORDER BY xp DESC LIMIT 10 reads the top of the index
+        "CREATE INDEX idx_users_xp ON users (xp)",
+        # nightly settle-freezes: users whose streak has a gap
+        "CREATE INDEX idx_users_daily_last ON users (daily_last_date)",
+        "CREATE INDEX idx_payments_user_day ON finance_payments (user_id, payment_date)",
+    ]),
+    (6, "index for the nightly progress window scan", [
+        # iter_progress_window over every habit: range on log_date instead of a full scan
+        "CREATE INDEX idx_progress_day_habit ON progress (log_date, habit_id)",
+    ]),
+    (7, "progress rollups", {
+        "mysql": [
+            """
+            CREATE TABLE IF NOT EXISTS user_progress_daily (
+                user_id INT NOT NULL,
+                log_date DATE NOT NULL,
+                done_count INT NOT NULL DEFAULT 0,
+                skipped_count INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, log_date)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS habit_progress_totals (
+                habit_id INT NOT NULL PRIMARY KEY,
+                user_id INT NOT NULL,
+                done_count INT NOT NULL DEFAULT 0,
+                skipped_count INT NOT NULL DEFAULT 0,
+                KEY idx_habit_totals_user (user_id)
+            )
+            """,
+            """
+            INSERT INTO user_progress_daily (user_id, log_date, done_count, skipped_count)
+            SELECT user_id, log_date, SUM(status = 'done'), SUM(status = 'skipped')
+            FROM progress GROUP BY user_id, log_date
+            """,
+            """
+            INSERT INTO habit_progress_totals (habit_id, user_id, done_count, skipped_count)
+            SELECT habit_id, MIN(user_id), SUM(status = 'done'), SUM(status = 'skipped')
+            FROM progress GROUP BY habit_id
+            """,
+            # Its only readers (progress counts, streak backfill) now use the rollups
+            "DROP INDEX idx_progress_user_status_day ON progress",
+        ],
+        "sqlite": [
+            """
+            CREATE TABLE IF NOT EXISTS user_progress_daily (
+                user_id INT NOT NULL,
+                log_date DATE NOT NULL,
+                done_count INT NOT NULL DEFAULT 0,
+                skipped_count INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, log_date)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS habit_progress_totals (
+                habit_id INT NOT NULL PRIMARY KEY,
+                user_id INT NOT NULL,
+                done_count INT NOT NULL DEFAULT 0,
+                skipped_count INT NOT NULL DEFAULT 0
+            )
+            """,
+            "CREATE INDEX idx_habit_totals_user ON habit_progress_totals (user_id)",
+            """
+            INSERT INTO user_progress_daily (user_id, log_date, done_count, skipped_count)
+            SELECT user_id, log_date, SUM(status = 'done'), SUM(status = 'skipped')
+            FROM progress GROUP BY user_id, log_date
+            """,
+            """
+            INSERT INTO habit_progress_totals (habit_id, user_id, done_count, skipped_count)
+            SELECT habit_id, MIN(user_id), SUM(status = 'done'), SUM(status = 'skipped')
+            FROM progress GROUP BY habit_id
+            """,
+            "DROP INDEX idx_progress_user_status_day",
+        ],
+    }),
+    (8, "running total_paid on finance", [
+        "ALTER TABLE finance ADD COLUMN total_paid DECIMAL(12, 2) NOT NULL DEFAULT 0",
+        # Payments recorded before any salary/debt was saved still need a balance row
+        """
+        INSERT INTO finance (user_id)
+        SELECT DISTINCT p.user_id FROM finance_payments p
+        WHERE NOT EXISTS (SELECT 1 FROM finance f WHERE f.user_id = p.user_id)
+        """,
+        """
+        UPDATE finance
+        SET total_paid = COALESCE((SELECT SUM(amount) FROM finance_payments p WHERE p.user_id = finance.user_id), 0)
+        """,
+    ]),
+    (9, "cold progress archive", {
+        # One row per habit per month, filled by database.archive_progress
+        "mysql": [
+            """
+            CREATE TABLE IF NOT EXISTS progress_archive (
+                habit_id INT NOT NULL,
+                month DATE NOT NULL,
+                user_id INT NOT NULL,
+                done_mask INT NOT NULL DEFAULT 0,
+                skipped_mask INT NOT NULL DEFAULT 0,
+                done_count SMALLINT NOT NULL DEFAULT 0,
+                skipped_count SMALLINT NOT NULL DEFAULT 0,
+                PRIMARY KEY (habit_id, month),
+                KEY idx_archive_user_month (user_id, month),
+                KEY idx_archive_month (month)
+            )
+            """,
+        ],
+        "sqlite": [
+            """
+            CREATE TABLE IF NOT EXISTS progress_archive (
+                habit_id INT NOT NULL,
+                month DATE NOT NULL,
+                user_id INT NOT NULL,
+                done_mask INT NOT NULL DEFAULT 0,
+                skipped_mask INT NOT NULL DEFAULT 0,
+                done_count SMALLINT NOT NULL DEFAULT 0,
+                skipped_count SMALLINT NOT NULL DEFAULT 0,
+                PRIMARY KEY (habit_id, month)
+            )
+            """,
+            "CREATE INDEX idx_archive_user_month ON progress_archive (user_id, month)",
+            "CREATE INDEX idx_archive_month ON progress_archive (month)",
+        ],
+    }),
+]
+
+
+def current_version(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("SELECT MAX(version) AS v FROM schema_migrations")
+    row = cursor.fetchone()
+    return (row["v"] if row else None) or 0
+
+
+def migrate(target=None):
+    """
+    Apply pending migrations up to `target` (default: latest).
+    Returns the list of (version, description) applied.
+    """
+    applied = []
+    with database.get_cursor() as cursor:
+        version = current_version(cursor)
+        for number, description, statements in MIGRATIONS:
+            if number <= version or (target is not None and number > target):
+                continue
+            if isinstance(statements, dict):
+                statements = statements[database.backend.name]
+            for sql in statements:
+                cursor.execute(sql)
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                (number, description)
+            )
+            applied.append((number, description))
+    return applied
+
+
+# --- Query plan check ---
+
+def _plan_checks(user, habit_id):
+    uid = user["id"]
+    return [
+        ("create_or_get_user", lambda: database.create_or_get_user(user["username"])),
+        ("add_habit", lambda: database.add_habit(uid, "explain")),
+        ("get_habit", lambda: database.get_habit(habit_id)),
+        ("mark_habit_done", lambda: database.mark_habit_done(habit_id)),
+        ("mark_habit_skipped", lambda: database.mark_habit_skipped(habit_id)),
+        ("get_progress", lambda: database.get_progress(habit_id)),
+        ("get_leaderboard", lambda: database._load_leaderboard(database.LEADERBOARD_SIZE)),
+        ("get_user_rank", lambda: database._count_users_above(uid)),
+        ("get_streak", lambda: database.get_streak(habit_id)),
+        ("get_daily_streak", lambda: database.get_daily_streak(uid)),
+        ("settle_streak_freezes", lambda: database.settle_streak_freezes()),
+        ("get_streak_freeze_usage", lambda: database.get_streak_freeze_usage(uid)),
+        ("get_user_progress_count", lambda: database.get_user_progress_count(uid)),
+        ("get_user_progress_log", lambda: database.get_user_progress_log(uid)),
+        ("get_progress_log_page", lambda: database.get_progress_log_page(uid)),
+        ("get_progress_log_page(next)", lambda: database.get_progress_log_page(
+            uid, after=(datetime.date.today(), datetime.datetime.now(), 1))),
+        ("get_user_dashboard", lambda: database.get_user_dashboard(uid)),
+        ("buy_streak_freeze", lambda: database.buy_streak_freeze(uid)),
+        ("get_habits", lambda: database.get_habits(uid)),
+        ("get_progress_matrix", lambda: database.get_progress_matrix(uid)),
+        ("get_histories", lambda: database._load_histories(uid)),
+        ("get_habit_tracker_page", lambda: database.get_habit_tracker_page(uid)),
+        ("save_finance", lambda: database.save_finance(uid, 0, 0, 0)),
+        ("get_finance", lambda: database.get_finance(uid)),
+        ("add_payment", lambda: database.add_payment(uid, 0)),
+        ("get_total_payments", lambda: database.get_total_payments(uid)),
+        ("get_payment_history", lambda: database.get_payment_history(uid)),
+        ("get_average_monthly_payment", lambda: database.get_average_monthly_payment(uid)),
+        ("get_payment_history(next)", lambda: database.get_payment_history(uid, before=(datetime.date.today(), 1))),
+        ("get_habit_settings", lambda: database.get_habit_settings(user_ids=[uid])),
+        ("iter_progress_window", lambda: list(database.iter_progress_window(14))),
+        ("iter_progress_window(user)", lambda: list(database.iter_progress_window(14, user_ids=[uid]))),
+        ("iter_histories", lambda: list(database.iter_histories(14, habit_ids=[habit_id]))),
+        ("iter_histories(archive)", lambda: list(database.iter_histories(database.HOT_DAYS + 31))),
+        ("get_progress(archive)", lambda: database.get_progress(habit_id, days=database.HOT_DAYS + 31)),
+        ("archive_progress", lambda: database._archive_batch(database.archive_cutoff(), 1000)),
+    ]
+
+
+def check_query_plans(user_id=None, habit_id=None):
+    """
+    EXPLAIN every statement each query function sends (writes are explained,
+    not executed) and collect table accesses that are full scans.
+
+    Returns (report, failures). A scan with no usable index is a failure; a
+    scan the optimizer chose although an index exists (typical on small dev
+    tables) is reported but does not fail.
+    """
+    with database.get_cursor() as cursor:
+        if habit_id is not None:
+            cursor.execute("SELECT user_id, id FROM habits WHERE id=%s", (habit_id,))
+        elif user_id is not None:
+            cursor.execute("SELECT user_id, id FROM habits WHERE user_id=%s LIMIT 1", (user_id,))
+        else:
+            cursor.execute("SELECT user_id, id FROM habits LIMIT 1")
+        row = cursor.fetchone()
+        if not row:
+            raise ValueError("need at least one user with a habit to explain queries against")
+        cursor.execute("SELECT id, username FROM users WHERE id=%s", (row["user_id"],))
+        user = cursor.fetchone()
+
+    report, failures = [], []
+    for name, call in _plan_checks(user, row["id"]):
+        database.user_cache.apply("clear")  # make every getter actually query (this process only)
+        with database.capture_query_plans() as plans:
+            call()
+        for p in plans:
+            if p["verb"] == "INSERT":
+                continue
+            for step in p["plan"]:
+                entry = {
+                    "function": name,
+                    "table": step.get("table"),
+                    "type": step.get("type"),
+                    "key": step.get("key"),
+                    "rows": step.get("rows"),
+                    "sql": p["sql"],
+                }
+                report.append(entry)
+                if step.get("type") == "ALL" and step.get("table") and not step.get("table").startswith("<"):
+                    entry["full_scan"] = True
+                    if not step.get("possible_keys"):
+                        failures.append(entry)
+    database.leaderboard.apply("invalidate")  # drop what the checks loaded, in this process only
+    return report, failures
@@ -0,0 +1,117 @@
+# projection.py
+"""
+Debt payoff projections for the Finance Tracker.
+
+Every scenario is a (monthly payment, annual interest rate) pair and is
+amortized in closed form: with monthly rate r and payment P, the balance
+after n months is
+
+    B(n) = B0 * (1 + r)^n - P * ((1 + r)^n - 1) / r      (B0 - P * n when r = 0)
+
+so a whole batch of scenarios × months is one NumPy broadcast instead of
+a Python loop per month, cheap enough to rerun on every slider change.
+"""
+import datetime
+
+MAX_MONTHS = 600  # 50 years: anything slower is reported as "never"
+
+
+def months_to_payoff(balance, payments, annual_rates):
+    """
+    Months until each scenario's balance reaches zero (array, inf where the
+    payment never covers the interest or takes over MAX_MONTHS). Arguments
+    broadcast against each other.
+    """
+    import numpy as np
+    balance = np.asarray(balance, dtype=float)
+    payment = np.asarray(payments, dtype=float)
+    r = np.asarray(annual_rates, dtype=float) / 12
+    balance, payment, r = np.broadcast_arrays(balance, payment, r)
+
+    months = np.full(balance.shape, np.inf)
+    months[balance <= 0] = 0
+    owing = (balance > 0) & (payment > 0)
+    no_interest = owing & (r == 0)
+    months[no_interest] = np.ceil(balance[no_interest] / payment[no_interest])
+    # n = -log(1 - r*B0/P) / log(1 + r), defined only when P outpaces the interest
+    pays_down = owing & (r > 0) & (payment > r * balance)
+    ratio = r[pays_down] * balance[pays_down] / payment[pays_down]
+    months[pays_down] = np.ceil(-np.log1p(-ratio) / np.log1p(r[pays_down]) - 1e-9)
+    months[months > MAX_MONTHS] = np.inf
+    return months
+
+
+def balance_schedule(balance, payments, annual_rates, horizon=None):
+    """
+    Remaining balance at the start of each month: array of shape
+    (scenarios, horizon + 1), column 0 being today. Clipped at zero once a
+    scenario is paid off. horizon defaults to the slowest finite payoff.
+    """
+    import numpy as np
+    payment = np.atleast_1d(np.asarray(payments, dtype=float))
+    r = np.atleast_1d(np.asarray(annual_rates, dtype=float)) / 12
+    payment, r = np.broadcast_arrays(payment, r)
+    if horizon is None:
+        months = months_to_payoff(balance, payment, r * 12)
+        finite = months[np.isfinite(months)]
+        horizon = int(min(finite.max(), MAX_MONTHS)) if finite.size else MAX_MONTHS
+
+    n = np.arange(horizon + 1)
+    growth = (1 + r[:, None]) ** n                      # scenarios × months
+    with np.errstate(divide="ignore", invalid="ignore"):
+        annuity = np.where(r[:, None] > 0, (growth - 1) / np.where(r > 0, r, 1)[:, None], n)
+    return np.clip(balance * growth - payment[:, None] * annuity, 0, None)
+
+
+def project(balance, scenarios, start=None, horizon=None):
+    """
+    Payoff projection for named scenarios {name: (monthly_payment, annual_rate)}.
+    Returns {"schedule": {name: [balance per month]}, "dates": [first of each month],
+    "summary": {name: {"months", "payoff_date", "total_paid", "interest"}}}.
+    months/payoff_date are None for scenarios that never pay off.
+    """
+    import numpy as np
+    names = list(scenarios)
+    payments = np.array([scenarios[n][0] for n in names], dtype=float)
+    rates = np.array([scenarios[n][1] for n in names], dtype=float)
+
+    months = months_to_payoff(balance, payments, rates)
+    schedule = balance_schedule(balance, payments, rates, horizon)
+    start = start or datetime.date.today().replace(day=1)
+    dates = [_add_months(start, i) for i in range(schedule.shape[1])]
+
+    # Interest = everything paid minus the principal; the last payment is only what was left
+    finite = np.isfinite(months)
+    paid = np.where(finite, _total_paid(balance, payments, rates, np.where(finite, months, 0)), np.nan)
+
+    summary = {}
+    for i, name in enumerate(names):
+        done = bool(finite[i])
+        summary[name] = {
+            "months": int(months[i]) if done else None,
+            "payoff_date": _add_months(start, int(months[i])) if done else None,
+            "total_paid": float(paid[i]) if done else None,
+            "interest": float(paid[i] - balance) if done and balance > 0 else (0.0 if done else None),
+        }
+    return {
+        "schedule": {name: schedule[i].tolist() for i, name in enumerate(names)},
+        "dates": dates,
+        "summary": summary,
+    }
+
+
+def _total_paid(balance, payments, rates, months):
+    """Full payments for months - 1, then whatever balance is left in the last month."""
+    import numpy as np
+    r = rates / 12
+    m = np.maximum(months - 1, 0)
+    growth = (1 + r) ** m
+    with np.errstate(divide="ignore", invalid="ignore"):
+        annuity = np.where(r > 0, (growth - 1) / np.where(r > 0, r, 1), m)
+    left = np.clip(balance * growth - payments * annuity, 0, None) * (1 + r)
+    return np.where(months > 0, payments * m + left, 0.0)
+
+
+def _add_months(d, n):
+    month = d.month - 1 + n
+    return d.replace(year=d.year + month // 12, month=month % 12 + 1)
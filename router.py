@@ -0,0 +1,224 @@
+# router.py
+"""
+Multi-worker mode: several Streamlit workers behind one port.
+
+    python router.py --workers 4 [--port 8501] [-- extra streamlit args]
+
+Starts the cache broker (broker.py) and N `streamlit run app.py` workers
+on the ports after --port, then proxies HTTP and WebSocket traffic from
+--port to them. Each worker is its own process with its own connection
+pool (DUO_DB_POOL_SIZE connections each), caches and write queue; it is
+told DUO_BROKER and DUO_WORKER_ID, and gets its own write journal
+file (DUO_WRITE_JOURNAL.<worker id>) unless the journal is turned off.
+
+A user stays on one worker, so their cached results stay warm there:
+  * `?uid=<user id>` (the app adds it after login) picks worker uid % N;
+  * otherwise the `duo_worker` cookie picks the worker seen last time;
+  * otherwise the least busy worker is picked.
+The router sets the cookie on the first response of every connection it
+did not route by cookie, so the page's WebSocket follows the page.
+Changes one worker makes reach the other workers' caches through the
+broker. A worker that dies is restarted; its users move to another worker
+meanwhile.
+"""
+import argparse
+import asyncio
+import http.cookies
+import logging
+import os
+import sys
+import urllib.parse
+
+import broker
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+COOKIE = "duo_worker"
+JOURNAL = os.environ.get("DUO_WRITE_JOURNAL", "duo_writes.journal")  # writer.py's default
+RESTART_DELAY = 2.0  # seconds before restarting a worker that exited
+
+log = logging.getLogger("duo.router")
+
+
+def worker_for(user_id, workers):
+    """The worker a user is pinned to."""
+    return user_id % workers
+
+
+class Worker:
+    __slots__ = ("index", "port", "process", "active")
+
+    def __init__(self, index, port):
+        self.index = index
+        self.port = port
+        self.process = None
+        self.active = 0     # open proxied connections
+
+
+class Router:
+    """
+    `command`, if given, is run for each worker instead of `streamlit run
+    app.py` ("{port}" in it becomes the worker's port; benchmarks/scaling.py
+    uses this to put plain HTTP workers behind the router).
+    """
+
+    def __init__(self, workers, port, broker_port, streamlit_args=(), command=None):
+        self.port = port
+        self.broker_port = broker_port
+        self.streamlit_args = list(streamlit_args)
+        self.command = list(command) if command else None
+        self.workers = [Worker(i, port + 1 + i) for i in range(workers)]
+        self._stopping = False
+
+    # --- Workers ---
+
+    def _env(self, worker):
+        env = dict(os.environ)
+        env["DUO_BROKER"] = f"127.0.0.1:{self.broker_port}"
+        env["DUO_WORKER_ID"] = str(worker.index)
+        if JOURNAL:
+            env["DUO_WRITE_JOURNAL"] = f"{JOURNAL}.{worker.index}"
+        return env
+
+    def _argv(self, worker):
+        if self.command:
+            return [arg.format(port=worker.port) for arg in self.command]
+        return [
+            sys.executable, "-m", "streamlit", "run", os.path.join(ROOT, "app.py"),
+            "--server.port", str(worker.port), "--server.address", "127.0.0.1",
+            "--server.headless", "true", *self.streamlit_args,
+        ]
+
+    async def _supervise(self, worker):
+        """Run one worker, restarting it whenever it exits."""
+        while not self._stopping:
+            worker.process = await asyncio.create_subprocess_exec(
+                *self._argv(worker), cwd=ROOT, env=self._env(worker),
+            )
+            log.info("worker %d started on port %d (pid %d)", worker.index, worker.port, worker.process.pid)
+            code = await worker.process.wait()
+            if not self._stopping:
+                log.warning("worker %d exited with %s, restarting", worker.index, code)
+                await asyncio.sleep(RESTART_DELAY)
+
+    def stop(self):
+        self._stopping = True
+        for w in self.workers:
+            if w.process and w.process.returncode is None:
+                w.process.terminate()
+
+    # --- Routing ---
+
+    def choose(self, target, cookie_header):
+        """(worker, routed_by_cookie) for a request target and Cookie header."""
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(target).query)
+        uid = query.get("uid", [""])[0]
+        if uid.isdigit():
+            return self.workers[worker_for(int(uid), len(self.workers))], False
+        if cookie_header:
+            cookies = http.cookies.SimpleCookie()
+            try:
+                cookies.load(cookie_header)
+            except http.cookies.CookieError:
+                cookies = {}
+            pinned = cookies.get(COOKIE)
+            if pinned is not None and pinned.value.isdigit() and int(pinned.value) < len(self.workers):
+                return self.workers[int(pinned.value)], True
+        return min(self.workers, key=lambda w: w.active), False
+
+    async def _open(self, first):
+        """Connect to `first`, or to the least busy worker that answers. (worker, reader, writer) or None."""
+        for worker in [first] + sorted((w for w in self.workers if w is not first), key=lambda w: w.active):
+            try:
+                reader, writer = await asyncio.open_connection("127.0.0.1", worker.port)
+            except OSError:
+                continue
+            return worker, reader, writer
+        return None
+
+    async def handle(self, client_reader, client_writer):
+        try:
+            head = await client_reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            client_writer.close()
+            return
+        target, cookie_header = _parse_head(head)
+        chosen, by_cookie = self.choose(target, cookie_header)
+        opened = await self._open(chosen)
+        if opened is None:
+            client_writer.write(b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            client_writer.close()
+            return
+        worker, upstream_reader, upstream_writer = opened
+        set_cookie = None
+        if not by_cookie or worker is not chosen:
+            set_cookie = f"Set-Cookie: {COOKIE}={worker.index}; Path=/; SameSite=Lax\r\n".encode()
+
+        worker.active += 1
+        upstream_writer.write(head)
+        tasks = [
+            asyncio.ensure_future(_pipe(client_reader, upstream_writer)),
+            asyncio.ensure_future(_pipe(upstream_reader, client_writer, set_cookie)),
+        ]
+        try:
+            # Either side hanging up ends the exchange
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            worker.active -= 1
+            for t in tasks:
+                t.cancel()
+            upstream_writer.close()
+            client_writer.close()
+
+    async def run(self):
+        broker_task = asyncio.ensure_future(broker.serve("127.0.0.1", self.broker_port))
+        supervisors = [asyncio.ensure_future(self._supervise(w)) for w in self.workers]
+        server = await asyncio.start_server(self.handle, "0.0.0.0", self.port)
+        log.info("routing port %d to %d workers (cache broker on %d)", self.port, len(self.workers), self.broker_port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.stop()
+            await asyncio.gather(*supervisors, return_exceptions=True)
+            broker_task.cancel()
+
+
+def _parse_head(head):
+    """Request target and Cookie header of a raw HTTP request head."""
+    lines = head.decode("latin-1").split("\r\n")
+    parts = lines[0].split(" ")
+    target = parts[1] if len(parts) > 1 else "/"
+    cookies = "; ".join(line.split(":", 1)[1].strip() for line in lines[1:] if line.lower().startswith("cookie:"))
+    return target, cookies
+
+
+async def _pipe(reader, writer, set_cookie=None):
+    """Copy bytes until EOF, adding `set_cookie` to the headers of the first response."""
+    try:
+        if set_cookie:
+            head = await reader.readuntil(b"\r\n\r\n")
+            writer.write(head[:-2] + set_cookie + b"\r\n")
+        while data := await reader.read(65536):
+            writer.write(data)
+            await writer.drain()
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--port", type=int, default=8501, help="public port; workers use the next --workers ports")
+    parser.add_argument("--broker-port", type=int, default=broker.DEFAULT_PORT)
+    parser.add_argument("streamlit_args", nargs="*", help="passed to every `streamlit run` (after --)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    router = Router(args.workers, args.port, args.broker_port, args.streamlit_args)
+    try:
+        asyncio.run(router.run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# tests/conftest.py
+"""
+Fixtures for the test suite: every test that touches the database gets a
+fresh, migrated SQLite file (see backends.SQLiteBackend).
+
+    python -m pytest -q
+"""
+import datetime
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backends
+import database
+import migrations
+
+
+@pytest.fixture
+def db(tmp_path):
+    """database.py pointed at an empty, migrated SQLite file, with cold caches."""
+    database.use_backend(backends.SQLiteBackend(str(tmp_path / "duo.db")))
+    migrations.migrate()
+    yield database
+    database.pool.close_all()
+
+
+@pytest.fixture
+def make_user(db):
+    """make_user(name, habits=1, freezes=0) -> (user_id, [habit_id, ...])."""
+    def make(name="alice", habits=1, freezes=0):
+        user = db.create_or_get_user(name)
+        for i in range(habits):
+            db.add_habit(user["id"], f"habit {i}")
+        with db.get_cursor() as cursor:
+            cursor.execute("UPDATE users SET streak_freeze=%s WHERE id=%s", (freezes, user["id"]))
+            cursor.execute("SELECT id FROM habits WHERE user_id=%s ORDER BY id", (user["id"],))
+            return user["id"], [r["id"] for r in cursor.fetchall()]
+    return make
+
+
+@pytest.fixture
+def tuple_rows(db, monkeypatch):
+    """Cursors whose fetchall() returns () when there are no rows, as pymysql's DictCursor does."""
+    wrap = db._wrap
+
+    class TupleCursor:
+        def __init__(self, cursor):
+            self._cursor = cursor
+
+        def fetchall(self):
+            return self._cursor.fetchall() or ()
+
+        def __getattr__(self, name):
+            return getattr(self._cursor, name)
+
+    monkeypatch.setattr(db, "_wrap", lambda cursor: TupleCursor(wrap(cursor)))
+
+
+@pytest.fixture
+def today():
+    return datetime.date.today()
+
+
+def days_ago(n):
+    return datetime.date.today() - datetime.timedelta(days=n)
@@ -0,0 +1,34 @@
+# tests/test_ai.py
+import datetime
+
+import pytest
+
+import ai_module
+from conftest import days_ago
+
+
+def test_one_habit_agrees_with_the_batch(db, make_user):
+    pytest.importorskip("pandas")
+    user_id, habits = make_user(habits=3)
+    daily, weekly, idle = habits
+    with db.get_cursor() as cursor:
+        cursor.execute("UPDATE habits SET frequency='weekly', target_time='21:00' WHERE id=%s", (weekly,))
+    for n in range(1, 10):
+        db.mark_habit_done(daily, days_ago(n))
+    db.mark_habit_done(weekly, days_ago(2))
+    with db.get_cursor() as cursor:
+        cursor.execute("UPDATE progress SET completed_at=%s WHERE habit_id=%s",
+                       (datetime.datetime.combine(days_ago(1), datetime.time(7, 30)), daily))
+
+    risks = ai_module.predict_dropout_risks(user_ids=[user_id])
+    times = ai_module.suggest_reminder_times(user_ids=[user_id])
+    for habit_id in habits:
+        assert ai_module.predict_dropout_risk(habit_id) == pytest.approx(risks[habit_id])
+        assert ai_module.suggest_reminder_time(habit_id) == times[habit_id]
+    assert times[daily] == "07:00" and times[idle] == "08:00"
+    assert risks[idle] == (1.0, "HIGH")
+
+
+def test_unknown_habit(db):
+    assert ai_module.predict_dropout_risk(999) == (0.0, "unknown")
+    assert ai_module.suggest_reminder_time(999) == "08:00"
@@ -0,0 +1,69 @@
+# tests/test_archive.py
+from conftest import days_ago
+
+
+def _snapshot(db, user_id, habit_id):
+    db.user_cache.clear()
+    db.histories.invalidate()
+    h = db.get_histories(user_id)[habit_id]
+    return {
+        "counts": db.get_user_progress_count(user_id),
+        "progress": sorted((r["date"], r["status"]) for r in db.get_progress(habit_id, days=400)),
+        "done": h.count(days_ago(400), days_ago(0)),
+        "skipped": h.count(days_ago(400), days_ago(0), "skipped"),
+    }
+
+
+def _count(db, table):
+    with db.get_cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*) AS n FROM {table}")
+        return cursor.fetchone()["n"]
+
+
+def test_archive_round_trip(db, make_user):
+    user_id, (habit_id,) = make_user()
+    old = [200, 199, 198, 150, 120]
+    for n in old:
+        db.mark_habit_done(habit_id, days_ago(n))
+    db.mark_habit_skipped(habit_id, days_ago(197))
+    db.mark_habit_done(habit_id, days_ago(1))
+    before = _snapshot(db, user_id, habit_id)
+    assert (before["done"], before["skipped"]) == (6, 1)
+
+    assert db.archive_progress() == 6
+    assert _count(db, "progress") == 1
+    assert _count(db, "progress_archive") >= 2
+    assert _snapshot(db, user_id, habit_id) == before
+
+    # The rollups rebuilt from scratch agree with the ones kept up to date
+    db.rebuild_rollups()
+    assert _snapshot(db, user_id, habit_id) == before
+
+    # Archived days still count as logged, and archiving again moves nothing
+    assert not db.mark_habit_done(habit_id, days_ago(200))["ok"]
+    assert db.archive_progress() == 0
+
+
+def test_progress_window_reaching_the_archive_on_tuple_rows(db, make_user, tuple_rows):
+    _, (habit_id,) = make_user()
+    db.mark_habit_done(habit_id, days_ago(200))
+    db.archive_progress()
+    # Nothing left in the hot range: the driver hands back ()
+    assert [r["date"] for r in db.get_progress(habit_id, days=400)] == [days_ago(200).isoformat()]
+
+
+def test_archiving_a_day_twice_uncounts_the_copy(db, make_user):
+    user_id, (habit_id,) = make_user()
+    db.mark_habit_done(habit_id, days_ago(200))
+    db.archive_progress()
+    # The same old day loaded again behind the archive's back (e.g. an import)
+    with db.get_cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO progress (user_id, habit_id, status, log_date) VALUES (%s, %s, 'skipped', %s)",
+            (user_id, habit_id, days_ago(200))
+        )
+    db.rebuild_rollups()
+    assert db.archive_progress() == 1
+    after = _snapshot(db, user_id, habit_id)
+    assert (after["done"], after["skipped"]) == (1, 0)
+    assert (after["counts"]["done_count"], after["counts"]["skipped_count"]) == (1, 0)
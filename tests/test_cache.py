@@ -0,0 +1,61 @@
+# tests/test_cache.py
+import datetime
+import types
+
+import cache
+
+
+def test_getters_sharing_a_cache_name_keep_their_own_results(db, make_user):
+    user_id, _ = make_user()
+    db.add_payment(user_id, 500.5)
+
+    assert db.get_total_payments(user_id) == 500.5
+    history = db.get_payment_history(user_id)
+    assert [float(p["amount"]) for p in history] == [500.5]
+
+    db.user_cache.clear()
+    assert isinstance(db.get_payment_history(user_id), list)
+    assert db.get_total_payments(user_id) == 500.5
+
+
+def test_writes_invalidate_cached_payments(db, make_user):
+    user_id, _ = make_user()
+    assert db.get_total_payments(user_id) == 0.0
+    assert db.get_payment_history(user_id) == []
+    db.add_payment(user_id, 100)
+    assert db.get_total_payments(user_id) == 100.0
+    assert len(db.get_payment_history(user_id)) == 1
+
+
+def test_average_monthly_payment_has_its_own_entry(db, make_user):
+    user_id, _ = make_user()
+    db.add_payment(user_id, 600)
+    assert db.get_total_payments(user_id) == 600.0
+    assert db.get_average_monthly_payment(user_id) == 100.0
+    assert db.get_total_payments(user_id) == 600.0
+    db.add_payment(user_id, 600)
+    assert db.get_average_monthly_payment(user_id) == 200.0
+    assert db.reconcile_finance(user_id, fix=True) == []
+
+
+def test_histories_are_reloaded_after_the_ttl_and_at_midnight(monkeypatch):
+    clock = [1000.0]
+    today = [datetime.date(2024, 5, 1)]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(cache, "datetime", types.SimpleNamespace(date=types.SimpleNamespace(today=lambda: today[0])))
+    loads = []
+    histories = cache.HistoryCache(ttl=60)
+
+    def get():
+        return histories.get_or_load(1, lambda: loads.append(1) or {})
+
+    get()
+    clock[0] += 59
+    get()
+    assert len(loads) == 1
+    clock[0] += 1
+    get()
+    assert len(loads) == 2
+    today[0] += datetime.timedelta(days=1)
+    get()
+    assert len(loads) == 3
@@ -0,0 +1,56 @@
+# tests/test_charts.py
+"""The Habit Tracker page's progress chart, run through Streamlit's AppTest."""
+import os
+
+import pytest
+
+pytest.importorskip("streamlit")
+matplotlib = pytest.importorskip("matplotlib")
+
+import matplotlib.pyplot as plt
+import streamlit as st
+from matplotlib.figure import Figure
+from streamlit.testing.v1 import AppTest
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+
+@pytest.fixture
+def habit_page(db, make_user, monkeypatch):
+    """(AppTest on a user's Habit Tracker page, their habit id, the figures saved as PNG so far)."""
+    user_id, (habit_id,) = make_user()
+    st.cache_data.clear()
+    drawn = []
+    savefig = Figure.savefig
+
+    def counting_savefig(fig, *args, **kwargs):
+        drawn.append(fig)
+        return savefig(fig, *args, **kwargs)
+
+    monkeypatch.setattr(Figure, "savefig", counting_savefig)
+    at = AppTest.from_file(APP, default_timeout=60)
+    at.session_state["user"] = db.create_or_get_user("alice")
+    at.session_state["nav"] = "\u2705 Habit Tracker"
+    return at, habit_id, drawn
+
+
+def test_chart_image_is_drawn_once_per_progress_state(db, habit_page):
+    at, habit_id, drawn = habit_page
+    at.run()
+    assert not at.exception
+    assert len(at.get("image")) == 1 and len(drawn) == 1
+    at.run()
+    assert len(drawn) == 1      # same progress: the cached PNG
+    db.mark_habit_done(habit_id)
+    at.run()
+    assert len(drawn) == 2      # new data, new key
+    assert plt.get_fignums() == []   # bare Figures: nothing left in pyplot's registry
+
+
+def test_native_charts_skip_matplotlib(habit_page, monkeypatch):
+    monkeypatch.setenv("DUO_NATIVE_CHARTS", "1")
+    at, _, drawn = habit_page
+    at.run()
+    assert not at.exception
+    assert len(at.get("vega_lite_chart")) == 1
+    assert len(at.get("image")) == 0 and drawn == []
@@ -0,0 +1,21 @@
+# tests/test_explain.py
+import migrations
+
+
+def test_explaining_writes_patches_and_publishes_nothing(db, make_user):
+    user_id, (habit_id,) = make_user()
+    db.get_histories(user_id)
+    db.get_leaderboard()
+    published = []
+    for c in (db.user_cache, db.histories, db.leaderboard):
+        c.publish = lambda op, args, c=c: published.append((type(c).__name__, op, args))
+    try:
+        migrations.check_query_plans(user_id=user_id)
+    finally:
+        for c in (db.user_cache, db.histories, db.leaderboard):
+            c.publish = None
+
+    # Explained writes change nothing, so nothing may claim they did
+    assert published == []
+    assert not db.get_histories(user_id)[habit_id].is_done(db.date.today())
+    assert db.get_progress(habit_id) == []
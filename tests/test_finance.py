@@ -0,0 +1,43 @@
+# tests/test_finance.py
+import pytest
+
+
+def _corrupt(db, user_id, total_paid):
+    with db.get_cursor() as cursor:
+        cursor.execute("UPDATE finance SET total_paid=%s WHERE user_id=%s", (total_paid, user_id))
+    db.user_cache.clear()
+
+
+def test_payments_keep_the_balance(db, make_user):
+    user_id, _ = make_user()
+    db.save_finance(user_id, 5000, 500, 10000)
+    db.add_payment(user_id, 100)
+    db.add_payment(user_id, 50.5)
+    assert db.get_total_payments(user_id) == pytest.approx(150.5)
+    assert db.get_finance(user_id)["debt"] == 10000
+    assert db.reconcile_finance() == []
+
+
+def test_reconcile_finds_and_fixes_a_drifted_balance(db, make_user, tuple_rows):
+    user_id, _ = make_user()
+    other, _ = make_user("bob")
+    db.add_payment(user_id, 100)
+    db.add_payment(other, 20)
+    assert db.get_total_payments(user_id) == 100
+    _corrupt(db, user_id, 70)
+
+    mismatches = db.reconcile_finance(fix=True)
+    assert [(m["user_id"], float(m["total_paid"]), float(m["ledger"])) for m in mismatches] == [(user_id, 70, 100)]
+    assert db.get_total_payments(user_id) == 100
+    assert db.reconcile_finance() == []
+
+
+def test_reconcile_resets_a_balance_without_payments(db, make_user, tuple_rows):
+    user_id, _ = make_user()
+    db.save_finance(user_id, 5000, 500, 10000)
+    _corrupt(db, user_id, 40)
+
+    assert [m["user_id"] for m in db.reconcile_finance(user_id)] == [user_id]
+    db.reconcile_finance(user_id, fix=True)
+    assert db.get_total_payments(user_id) == 0
+    assert db.reconcile_finance(user_id) == []
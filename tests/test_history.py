@@ -0,0 +1,59 @@
+# tests/test_history.py
+import datetime
+
+import history
+from history import HabitHistory
+
+D = datetime.date(2026, 3, 10)
+
+
+def day(n):
+    return D + datetime.timedelta(days=n)
+
+
+def test_streaks():
+    h = HabitHistory.from_days([day(0), day(1), day(2), day(5), day(6)])
+    assert h.run_ending(day(2)) == 3
+    assert h.run_ending(day(3)) == 0
+    assert h.longest_streak() == 3
+    assert h.current_streak(day(6)) == 2
+    assert h.current_streak(day(7)) == 2    # today not logged yet: yesterday's run still counts
+    assert h.current_streak(day(8)) == 0
+    assert HabitHistory().longest_streak() == 0
+    assert HabitHistory().current_streak(D) == 0
+
+
+def test_windows_and_counts():
+    h = HabitHistory.from_days([day(0), day(2), day(3)]).marked(day(1), "skipped")
+    assert h.window(day(0), 4) == 0b1101
+    assert h.window(day(0), 4, "skipped") == 0b0010
+    assert h.window(day(-2), 3) == 0b100    # starts before the first logged day
+    assert h.count(day(0), day(3)) == 3
+    assert h.count(day(3), day(0)) == 0
+    assert list(h.days(day(-1), 6)) == [0, 1, 0, 1, 1, 0]
+
+
+def test_marked_before_origin_is_a_copy():
+    h = HabitHistory.from_days([day(5)])
+    earlier = h.marked(day(1), "done")
+    assert earlier.is_done(day(1)) and earlier.is_done(day(5))
+    assert not h.is_done(day(1))
+    assert earlier.gap_before(day(5)) == 3
+    assert earlier.last_done(before=day(5)) == day(1)
+    assert h.gap_before(day(5)) is None
+
+
+def test_build_merges_rows_and_month_masks():
+    rows = [{"habit_id": 1, "log_date": "2026-03-10", "status": "done", "user_id": 7}]
+    archived = [{"habit_id": 1, "month": datetime.date(2026, 2, 1), "done_mask": 0b101, "skipped_mask": 0b10}]
+    built = history.build(rows, habit_ids=[1, 2], archived=archived)
+    assert built[2] is history.EMPTY
+    h = built[1]
+    assert [d for d in (datetime.date(2026, 2, i) for i in range(1, 4)) if h.is_done(d)] == [
+        datetime.date(2026, 2, 1), datetime.date(2026, 2, 3)]
+    assert h.count(datetime.date(2026, 2, 1), datetime.date(2026, 3, 31), "skipped") == 1
+    assert h.is_done(datetime.date(2026, 3, 10))
+
+    packed = history.month_masks(rows)
+    assert packed == {(1, datetime.date(2026, 3, 1)): [7, 1 << 9, 0]}
+    assert history.month_days("2026-02-01", 0b101) == [datetime.date(2026, 2, 1), datetime.date(2026, 2, 3)]
@@ -0,0 +1,39 @@
+# tests/test_instrumentation.py
+import os
+
+import pytest
+
+import instrumentation
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+
+@pytest.fixture
+def aggregates(monkeypatch):
+    fresh = instrumentation.Aggregates()
+    monkeypatch.setattr(instrumentation, "aggregates", fresh)
+    monkeypatch.setattr(instrumentation, "LOG_EVERY", float("inf"))
+    return fresh
+
+
+def test_a_profile_left_open_is_counted_as_aborted(db, make_user, aggregates):
+    user_id, _ = make_user()
+    instrumentation.start("home")
+    db.get_finance(user_id)
+    instrumentation.start("home")   # the next rerun, without finish()
+    instrumentation.finish()
+    home = aggregates.snapshot()["reruns"]["home"]
+    assert (home["count"], home["aborted"], home["queries"]) == (2, 1, 1)
+    assert 'duo_reruns_aborted_total{page="home"} 1' in instrumentation.prometheus_text()
+
+
+def test_reruns_that_stop_early_are_profiled(db, aggregates, monkeypatch):
+    pytest.importorskip("streamlit")
+    from streamlit.testing.v1 import AppTest
+    monkeypatch.setenv("DUO_DEV_PANEL", "1")
+    at = AppTest.from_file(APP, default_timeout=60)
+    at.session_state["nav"] = "\u2705 Habit Tracker"
+    at.run()   # logged out: the page ends with st.stop()
+    assert not at.exception
+    assert aggregates.snapshot()["reruns"]["\u2705 Habit Tracker"]["count"] == 1
+    assert [e.label for e in at.sidebar.expander if "queries" in e.label]
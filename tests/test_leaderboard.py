@@ -0,0 +1,89 @@
+# tests/test_leaderboard.py
+import random
+
+import pytest
+
+import cache
+
+
+class Users:
+    """An XP table standing in for the database behind a Leaderboard."""
+
+    def __init__(self, xp):
+        self.xp = dict(xp)  # id -> xp
+        self.loads = 0
+
+    def ordered(self):
+        return sorted(self.xp, key=lambda i: (-self.xp[i], -i))
+
+    def load_top(self, k):
+        self.loads += 1
+        return [{"id": i, "username": f"u{i}", "xp": self.xp[i]} for i in self.ordered()[:k]]
+
+    def count_above(self, user_id):
+        if user_id not in self.xp:
+            return None
+        return self.ordered().index(user_id)
+
+    def set(self, board, user_id, xp):
+        self.xp[user_id] = xp
+        board.update_xp(user_id, f"u{user_id}", xp)
+
+
+def _expected(users, k):
+    return [{"username": f"u{i}", "xp": users.xp[i]} for i in users.ordered()[:k]]
+
+
+def test_ties_rank_the_newer_user_first():
+    users = Users({1: 50, 2: 50, 3: 70})
+    board = cache.Leaderboard(users.load_top, users.count_above, k=10)
+    assert [r["username"] for r in board.top()] == ["u3", "u2", "u1"]
+    assert [board.rank(i) for i in (3, 2, 1)] == [1, 2, 3]
+    assert board.rank(99) is None
+
+
+def test_patches_move_users_within_the_top_k():
+    users = Users({i: i * 10 for i in range(1, 6)})
+    board = cache.Leaderboard(users.load_top, users.count_above, k=10)
+    board.top()
+    users.set(board, 1, 45)     # from last to second
+    users.set(board, 5, 0)      # from first to last
+    users.set(board, 6, 45)     # a new user, tied with 1 and newer
+    assert board.top(limit=10) == _expected(users, 10)
+    assert [board.rank(i) for i in (6, 1, 4, 5)] == [1, 2, 3, 6]
+    assert users.loads == 1
+
+
+def test_a_full_top_k_admits_and_drops_users():
+    users = Users({i: i * 10 for i in range(1, 11)})   # k = 5 holds 6..10
+    board = cache.Leaderboard(users.load_top, users.count_above, k=5)
+    board.top()
+    users.set(board, 2, 5)       # outside and staying outside: nothing to do
+    users.set(board, 1, 75)      # climbs in, 6 drops out
+    assert board.top(limit=5) == _expected(users, 5)
+    assert board.rank(6) == 6    # counted by the database, not the cache
+    assert users.loads == 1
+
+    users.set(board, 10, 0)      # falls out of a full top K: who replaces it is unknown here
+    assert board.top(limit=5) == _expected(users, 5)
+    assert users.loads == 2
+
+
+def test_updates_before_the_first_load_are_ignored():
+    users = Users({1: 10})
+    board = cache.Leaderboard(users.load_top, users.count_above, k=5)
+    users.set(board, 1, 20)
+    assert board.top() == [{"username": "u1", "xp": 20}]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_updates_match_a_full_sort(seed):
+    rng = random.Random(seed)
+    users = Users({i: rng.randrange(0, 200) for i in range(1, 40)})
+    board = cache.Leaderboard(users.load_top, users.count_above, k=10, ttl=3600)
+    for _ in range(300):
+        users.set(board, rng.randrange(1, 50), rng.randrange(0, 200))
+        assert board.top(limit=10) == _expected(users, 10)
+        # Ranks below the top K are counted by the database and cached for the TTL
+        user_id = rng.choice(users.ordered()[:10])
+        assert board.rank(user_id) == users.ordered().index(user_id) + 1
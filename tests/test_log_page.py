@@ -0,0 +1,62 @@
+# tests/test_log_page.py
+import datetime
+
+from conftest import days_ago
+
+
+def _log_rows(db, user_id, habit_id):
+    """Three days of rows, with ties on completed_at and rows without a time."""
+    at = datetime.datetime.combine(days_ago(1), datetime.time(9))
+    rows = [
+        (days_ago(0), at + datetime.timedelta(days=1)),
+        (days_ago(1), at), (days_ago(1), at), (days_ago(1), None), (days_ago(1), None),
+        (days_ago(1), at - datetime.timedelta(hours=1)),
+        (days_ago(2), None), (days_ago(2), at - datetime.timedelta(days=1)),
+    ]
+    with db.get_cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO progress (user_id, habit_id, status, completed_at, log_date) VALUES (%s, %s, 'done', %s, %s)",
+            # progress is unique per (habit_id, log_date): one habit per row
+            [(user_id, habit_id + i, completed_at, log_date) for i, (log_date, completed_at) in enumerate(rows)]
+        )
+        cursor.execute("""
+            SELECT id FROM progress WHERE user_id=%s
+            ORDER BY log_date DESC, completed_at IS NULL, completed_at DESC, id DESC
+        """, (user_id,))
+        return [r["id"] for r in cursor.fetchall()]
+
+
+def _pages(db, user_id, limit):
+    pages, after = [], None
+    while True:
+        page = db.get_progress_log_page(user_id, limit=limit, after=after)
+        pages.append([r["id"] for r in page["rows"]])
+        after = page["next"]
+        if after is None:
+            return pages
+
+
+def test_pages_cover_the_log_once_in_order(db, make_user):
+    user_id, habit_ids = make_user(habits=8)
+    expected = _log_rows(db, user_id, habit_ids[0])
+    for limit in (1, 2, 3, 7, 8, 50):
+        pages = _pages(db, user_id, limit)
+        assert [i for page in pages for i in page] == expected, limit
+        assert all(len(page) == limit for page in pages[:-1])
+        assert 0 < len(pages[-1]) <= limit
+
+
+def test_empty_log(db, make_user):
+    user_id, _ = make_user()
+    assert db.get_progress_log_page(user_id) == {"rows": [], "next": None}
+
+
+def test_page_is_not_served_from_the_seven_day_log(db, make_user):
+    user_id, (habit_id,) = make_user()
+    db.mark_habit_done(habit_id, days_ago(1))
+    assert len(db.get_user_progress_log(user_id)) == 1
+    page = db.get_progress_log_page(user_id)
+    assert isinstance(page, dict) and len(page["rows"]) == 1
+
+    db.mark_habit_done(habit_id)
+    assert len(db.get_progress_log_page(user_id)["rows"]) == 2
@@ -0,0 +1,110 @@
+# tests/test_progress.py
+import datetime
+
+from conftest import days_ago
+
+
+def _user_row(db, user_id):
+    with db.get_cursor() as cursor:
+        cursor.execute("SELECT xp, daily_streak, daily_last_date, streak_freeze FROM users WHERE id=%s", (user_id,))
+        row = cursor.fetchone()
+    row["daily_last_date"] = db._as_date(row["daily_last_date"])
+    return row
+
+
+def test_mark_twice_is_rejected_and_counted_once(db, make_user):
+    user_id, (habit_id,) = make_user()
+    assert db.mark_habit_done(habit_id)["ok"]
+    again = db.mark_habit_done(habit_id)
+    assert not again["ok"] and "Already marked done" in again["msg"]
+    assert not db.mark_habit_skipped(habit_id)["ok"]
+
+    assert _user_row(db, user_id)["xp"] == 10
+    counts = db.get_user_progress_count(user_id)
+    assert (counts["done_count"], counts["skipped_count"]) == (1, 0)
+
+
+def test_batch_answers_every_event(db, make_user):
+    user_id, (first, second) = make_user(habits=2)
+    results = db.mark_progress_batch([
+        (first, "done", None), (first, "done", None), (second, "skipped", None), (999, "done", None),
+    ])
+    assert [r["ok"] for r in results] == [True, False, True, False]
+    counts = db.get_user_progress_count(user_id)
+    assert (counts["done_count"], counts["skipped_count"]) == (1, 1)
+
+
+def test_habit_and_daily_streaks(db, make_user, today):
+    user_id, (habit_id,) = make_user()
+    for n in (2, 1, 0):
+        result = db.mark_habit_done(habit_id, days_ago(n))
+    assert result["streak"] == 3
+    row = _user_row(db, user_id)
+    assert (row["daily_streak"], row["daily_last_date"]) == (3, today)
+    assert db.get_daily_streak(user_id) == 3
+
+
+def test_freezes_bridge_a_gap_they_can_cover(db, make_user, today):
+    user_id, (habit_id,) = make_user(freezes=2)
+    db.mark_habit_done(habit_id, days_ago(4))
+    db.mark_habit_done(habit_id, days_ago(3))
+    assert db.get_daily_streak(user_id) == 4    # the pending settlement is already counted
+
+    assert db.settle_streak_freezes(today=today) == 1
+    row = _user_row(db, user_id)
+    assert (row["daily_streak"], row["daily_last_date"], row["streak_freeze"]) == (4, days_ago(1), 0)
+    covered = sorted(db._as_date(r["covered_date"]) for r in db.get_streak_freeze_usage(user_id))
+    assert covered == [days_ago(2), days_ago(1)]
+
+    assert db.settle_streak_freezes(today=today) == 0   # settled already
+    db.mark_habit_done(habit_id)
+    assert _user_row(db, user_id)["daily_streak"] == 5
+
+
+def test_a_gap_longer_than_the_freezes_breaks_the_streak(db, make_user, today):
+    user_id, (habit_id,) = make_user(freezes=1)
+    db.mark_habit_done(habit_id, days_ago(3))
+    assert db.get_daily_streak(user_id) == 0
+
+    db.settle_streak_freezes(today=today)
+    row = _user_row(db, user_id)
+    assert (row["daily_streak"], row["streak_freeze"]) == (0, 1)
+    assert db.get_streak_freeze_usage(user_id) == []
+    db.mark_habit_done(habit_id)
+    assert _user_row(db, user_id)["daily_streak"] == 1
+
+
+def test_freezes_do_not_revive_a_broken_streak(db, make_user, today):
+    user_id, (habit_id,) = make_user(freezes=1)
+    db.mark_habit_done(habit_id, days_ago(5))
+    db.settle_streak_freezes(today=today)   # broken: 4 missed days, 1 freeze
+    with db.get_cursor() as cursor:
+        cursor.execute("UPDATE users SET streak_freeze=10 WHERE id=%s", (user_id,))
+    assert db.get_daily_streak(user_id) == 0
+    assert db.settle_streak_freezes(today=today) == 0
+    assert _user_row(db, user_id)["streak_freeze"] == 10
+
+
+def test_a_late_write_for_an_earlier_day_never_moves_streak_dates_back(db, make_user, today):
+    user_id, (first, second) = make_user(habits=2)
+    db.mark_habit_done(first)
+    late = db.mark_habit_done(second, days_ago(1))     # e.g. replayed from the write journal
+    assert late["ok"]
+    row = _user_row(db, user_id)
+    assert (row["xp"], row["daily_streak"], row["daily_last_date"]) == (20, 1, today)
+
+    db.mark_habit_done(first, days_ago(1))
+    habit = db.get_habit(first)
+    assert db._as_date(habit["last_done_date"]) == today and habit["streak"] == 1
+    counts = db.get_user_progress_count(user_id)
+    assert counts["done_count"] == 3
+
+    assert db.settle_streak_freezes(today=today + datetime.timedelta(days=1)) == 0
+
+
+def test_refusals_name_the_day(db, make_user):
+    _, (habit_id,) = make_user()
+    db.mark_habit_skipped(habit_id, days_ago(1))
+    assert db.mark_habit_done(habit_id, days_ago(1))["msg"] == f"Already marked skipped for {days_ago(1).isoformat()}"
+    db.mark_habit_done(habit_id)
+    assert db.mark_habit_done(habit_id)["msg"] == "Already marked done today"
@@ -0,0 +1,57 @@
+# tests/test_projection.py
+import datetime
+import math
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import projection
+
+
+def _months_by_loop(balance, payment, annual_rate):
+    months = 0
+    while balance > 0 and months <= projection.MAX_MONTHS:
+        balance = balance * (1 + annual_rate / 12) - payment
+        months += 1
+    return months if balance <= 0 else math.inf
+
+
+@pytest.mark.parametrize("balance, payment, rate", [
+    (10000, 500, 0.0), (10000, 500, 0.12), (5000, 5000, 0.2), (1234.5, 100, 0.05), (100000, 1001, 0.12),
+])
+def test_closed_form_matches_a_monthly_loop(balance, payment, rate):
+    assert projection.months_to_payoff(balance, payment, rate) == _months_by_loop(balance, payment, rate)
+
+
+def test_payments_that_never_catch_up_are_inf():
+    months = projection.months_to_payoff(10000, [0, 100, 50], [0.0, 0.12, 0.0])
+    assert months[0] == math.inf and months[1] == math.inf   # no payment; interest alone is 100/month
+    assert months[2] == 200
+    assert projection.months_to_payoff(0, 100, 0.1) == 0
+
+
+def test_slower_than_max_months_is_never():
+    months = projection.months_to_payoff(100000, 1001, 0.12)
+    assert months == math.inf
+    summary = projection.project(100000, {"slow": (1001, 0.12)})["summary"]["slow"]
+    assert summary == {"months": None, "payoff_date": None, "total_paid": None, "interest": None}
+
+
+def test_project_summary_and_schedule():
+    start = datetime.date(2024, 11, 1)
+    result = projection.project(1200, {"flat": (100, 0.0), "fast": (600, 0.0)}, start=start)
+    assert result["summary"]["flat"] == {
+        "months": 12, "payoff_date": datetime.date(2025, 11, 1), "total_paid": 1200.0, "interest": 0.0,
+    }
+    assert result["summary"]["fast"]["months"] == 2
+    assert len(result["dates"]) == 13 and result["dates"][2] == datetime.date(2025, 1, 1)
+    assert result["schedule"]["fast"][:4] == [1200, 600, 0, 0]
+    assert result["schedule"]["flat"][-1] == 0
+
+
+def test_interest_is_what_was_paid_over_the_principal():
+    summary = projection.project(1000, {"s": (100, 0.12)})["summary"]["s"]
+    assert summary["months"] == 11
+    assert summary["interest"] == pytest.approx(summary["total_paid"] - 1000)
+    assert 0 < summary["interest"] < 100
@@ -0,0 +1,108 @@
+# tests/test_router.py
+import asyncio
+import socket
+import threading
+import time
+
+import broker
+import cache
+import router
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+# --- Routing ---
+
+def test_choose_pins_by_uid_then_cookie_then_load():
+    r = router.Router(3, 8501, 8599)
+    r.workers[0].active, r.workers[1].active, r.workers[2].active = 2, 0, 1
+    assert r.choose("/?uid=7", "duo_worker=2") == (r.workers[1], False)          # 7 % 3
+    assert r.choose("/_stcore/stream", "a=b; duo_worker=2") == (r.workers[2], True)
+    assert r.choose("/", "duo_worker=9") == (r.workers[1], False)                # no such worker
+    assert r.choose("/?uid=abc", "duo_worker=x") == (r.workers[1], False)
+    assert r.choose("/", "") == (r.workers[1], False)
+
+
+def test_parse_head():
+    head = b"GET /page?uid=4 HTTP/1.1\r\nHost: x\r\nCookie: a=1\r\ncookie: duo_worker=0\r\n\r\n"
+    assert router._parse_head(head) == ("/page?uid=4", "a=1; duo_worker=0")
+    assert router._parse_head(b"\r\n\r\n") == ("/", "")
+
+
+def test_pipe_adds_the_cookie_to_the_first_response_only():
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nokHTTP/1.1 200 OK\r\n\r\n")
+        reader.feed_eof()
+        written = []
+
+        class Writer:
+            def write(self, data):
+                written.append(data)
+
+            async def drain(self):
+                pass
+
+        await router._pipe(reader, Writer(), b"Set-Cookie: duo_worker=1; Path=/\r\n")
+        return b"".join(written)
+
+    assert asyncio.run(run()) == (
+        b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nSet-Cookie: duo_worker=1; Path=/\r\n\r\n"
+        b"okHTTP/1.1 200 OK\r\n\r\n"
+    )
+
+
+def test_worker_argv_and_env(monkeypatch):
+    monkeypatch.setattr(router, "JOURNAL", "w.journal")
+    r = router.Router(2, 9000, 9100, command=["serve", "--port", "{port}"])
+    assert r._argv(r.workers[1]) == ["serve", "--port", "9002"]
+    env = r._env(r.workers[1])
+    assert (env["DUO_BROKER"], env["DUO_WORKER_ID"], env["DUO_WRITE_JOURNAL"]) == ("127.0.0.1:9100", "1", "w.journal.1")
+    assert "streamlit" in router.Router(1, 9000, 9100)._argv(r.workers[0])
+
+
+# --- Broker ---
+
+def test_broker_fans_cache_changes_out_to_the_other_workers():
+    port = _free_port()
+    threading.Thread(target=lambda: asyncio.run(broker.serve("127.0.0.1", port)), daemon=True).start()
+    clients = []
+    try:
+        workers = []
+        for _ in range(2):
+            users = cache.UserCache()
+            histories = cache.HistoryCache()
+            clients.append(broker.join(f"127.0.0.1:{port}", {"users": users, "histories": histories}))
+            workers.append((users, histories))
+        (users_a, histories_a), (users_b, histories_b) = workers
+        # Connected once a change from each side reaches the other (the broker drops lines for no one)
+        for sender, receiver in ((users_a, users_b), (users_b, users_a)):
+            receiver.get_or_load(0, "ping", (), lambda: "before")
+            _wait(lambda: sender.invalidate(0, "ping") or receiver.get_or_load(0, "ping", (), lambda: "after") == "after")
+
+        users_b.get_or_load(1, "page", (), lambda: "cached")
+        histories_b.get_or_load(1, lambda: {})
+        users_a.invalidate(1, "page")
+        histories_a.invalidate(1)
+        _wait(lambda: users_b.get_or_load(1, "page", (), lambda: "reloaded") == "reloaded")
+        _wait(lambda: histories_b.get_or_load(1, lambda: {"reloaded": True}) == {"reloaded": True})
+
+        # A replayed change is applied locally, never published again
+        users_a.get_or_load(2, "page", (), lambda: "a's")
+        users_b.clear()
+        _wait(lambda: users_a.stats()["users"] == 0)
+        assert users_b.stats()["users"] == 0
+    finally:
+        for c in clients:
+            c.close()
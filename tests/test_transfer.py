@@ -0,0 +1,72 @@
+# tests/test_transfer.py
+import backends
+import migrations
+import transfer
+from conftest import days_ago
+
+
+def _state(db):
+    with db.get_cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) AS n FROM habits")
+        habits = cursor.fetchone()["n"]
+        cursor.execute("SELECT COUNT(*) AS n FROM finance_payments")
+        payments = cursor.fetchone()["n"]
+        cursor.execute("SELECT username, total_paid FROM users JOIN finance ON finance.user_id = users.id")
+        paid = {r["username"]: float(r["total_paid"]) for r in cursor.fetchall()}
+    done = {
+        name: db.get_user_progress_count(db.create_or_get_user(name)["id"])["done_count"]
+        for name in ("alice", "bob")
+    }
+    return {"habits": habits, "payments": payments, "paid": paid, "done": done}
+
+
+def _fill(db, make_user):
+    alice, (a1, a2) = make_user("alice", habits=2)
+    bob, (b1,) = make_user("bob")
+    for n in (1, 2, 200):
+        db.mark_habit_done(a1, days_ago(n))
+    db.mark_habit_skipped(a2, days_ago(1))
+    db.mark_habit_done(b1, days_ago(3))
+    db.archive_progress()
+    db.save_finance(alice, 5000, 500, 10000)
+    db.add_payment(alice, 100)
+    db.add_payment(alice, 100)
+    db.add_payment(bob, 20.5)
+
+
+def test_export_import_round_trip(db, make_user, tmp_path):
+    _fill(db, make_user)
+    before = _state(db)
+    transfer.export(str(tmp_path / "dump"))
+
+    db.use_backend(backends.SQLiteBackend(str(tmp_path / "copy.db")))
+    migrations.migrate()
+    counts = transfer.import_dir(str(tmp_path / "dump"))
+    assert (counts["users"], counts["habits"], counts["finance_payments"]) == (2, 3, 3)
+    assert _state(db) == before
+
+
+def test_importing_a_dump_again_adds_nothing(db, make_user, tmp_path):
+    _fill(db, make_user)
+    before = _state(db)
+    transfer.export(str(tmp_path / "dump"))
+
+    counts = transfer.import_dir(str(tmp_path / "dump"))
+    assert counts["users"] == counts["habits"] == counts["finance_payments"] == 0
+    assert _state(db) == before
+    assert db.reconcile_finance() == []
+
+
+def test_import_merges_new_rows_into_existing_users(db, make_user, tmp_path):
+    _fill(db, make_user)
+    transfer.export(str(tmp_path / "dump"))
+    alice = db.create_or_get_user("alice")["id"]
+    with db.get_cursor() as cursor:
+        cursor.execute("SELECT MAX(id) AS id FROM finance_payments WHERE user_id=%s", (alice,))
+        cursor.execute("DELETE FROM finance_payments WHERE id=%s", (cursor.fetchone()["id"],))
+        cursor.execute("DELETE FROM habits WHERE user_id=%s AND name='habit 1'", (alice,))
+    db.reconcile_finance(fix=True)
+
+    counts = transfer.import_dir(str(tmp_path / "dump"))
+    assert (counts["habits"], counts["finance_payments"]) == (1, 1)
+    assert _state(db)["paid"]["alice"] == 200
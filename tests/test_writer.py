@@ -0,0 +1,46 @@
+# tests/test_writer.py
+import json
+
+import writer
+from conftest import days_ago
+
+
+def test_results_go_back_to_the_session_that_clicked(db, make_user, tmp_path):
+    _, (first, second) = make_user(habits=2)
+    queue = writer.WriteQueue(journal=str(tmp_path / "writes.journal"), linger=0.2)
+    try:
+        a = queue.submit("a", first, "done")
+        queue.submit("b", second, "skipped")
+        queue.submit("b", first, "done")       # same habit and day as "a": answered by the first
+        assert queue.in_flight("a") == 1 and queue.in_flight("b") == 2
+        assert queue.flush(timeout=10)
+
+        assert queue.in_flight("a") == 0 and queue.has_results("a")
+        results = queue.poll("a")
+        assert [(r["ticket"], r["ok"]) for r in results] == [(a, True)]
+        assert not queue.has_results("a") and queue.poll("a") == []
+        assert [r["ok"] for r in queue.poll("b")] == [True, False]
+    finally:
+        queue.close()
+    assert (tmp_path / "writes.journal").read_text() == ""     # everything acknowledged
+
+
+def test_unacknowledged_events_are_replayed(db, make_user, tmp_path):
+    user_id, (habit_id,) = make_user()
+    journal = tmp_path / "writes.journal"
+    journal.write_text(
+        json.dumps({"ticket": 1, "session": "a", "habit_id": habit_id, "status": "done",
+                    "log_date": days_ago(1).isoformat()}) + "\n"
+        + json.dumps({"ticket": 2, "session": "a", "habit_id": habit_id, "status": "done",
+                      "log_date": days_ago(0).isoformat()}) + "\n"
+        + json.dumps({"ack": [1]}) + "\n"
+        + '{"ticket": 3, "sess'      # torn by the crash
+    )
+    queue = writer.WriteQueue(journal=str(journal))
+    try:
+        queue.submit("b", habit_id, "done", days_ago(2))
+        assert queue.flush(timeout=10)
+    finally:
+        queue.close()
+    days = {r["date"] for r in db.get_progress(habit_id, days=7)}
+    assert days == {days_ago(0).isoformat(), days_ago(2).isoformat()}
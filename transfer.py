@@ -0,0 +1,433 @@
+# transfer.py
+"""
+Bulk export and import of users, habits, progress (hot rows and the
+monthly archive), finance and payments.
+
+Export streams each table through a server-side cursor into
+<dir>/<table>.csv or <dir>/<table>.parquet, one fetchmany batch at a
+time, so memory stays flat whatever the table size. Parquet needs
+pyarrow (imported only when used).
+
+Import reads the same layout back in batches and writes them with
+executemany (pymysql turns that into multi-row INSERTs), all in one
+transaction. Ids in the files are shifted past the ids already in the
+database, so a dump restores with its own ids into an empty database and
+merges without collisions into a live one. Users are matched by username;
+for users already in the database, habits are matched by name and
+payments by (date, amount), so importing the same dump twice adds
+nothing the second time. Imported progress older than the hot window is
+archived right after.
+
+    python manage.py export DIR [--format csv|parquet] [--user ID]
+    python manage.py import DIR
+"""
+import collections
+import csv
+import datetime
+import decimal
+import os
+
+import database
+
+# Column -> type, per table, in import order (parents before children)
+TABLES = {
+    "users": {
+        "id": "int", "username": "str", "email": "str", "xp": "int",
+        "streak_freeze": "int", "created_at": "datetime",
+    },
+    "habits": {
+        "id": "int", "user_id": "int", "name": "str", "frequency": "str", "target": "int",
+        "target_time": "str", "streak": "int", "longest_streak": "int", "last_done_date": "date",
+    },
+    "progress": {
+        "id": "int", "user_id": "int", "habit_id": "int", "status": "str",
+        "completed_at": "datetime", "log_date": "date",
+    },
+    "progress_archive": {
+        "habit_id": "int", "user_id": "int", "month": "date", "done_mask": "int",
+        "skipped_mask": "int", "done_count": "int", "skipped_count": "int",
+    },
+    "finance": {
+        "id": "int", "user_id": "int", "salary": "decimal", "emi": "decimal", "debt": "decimal",
+    },
+    "finance_payments": {
+        "id": "int", "user_id": "int", "amount": "decimal", "payment_date": "date",
+    },
+}
+FORMATS = ("csv", "parquet")
+ORDER_BY = {"progress_archive": "habit_id, month"}  # tables without an id column
+
+
+class TransferError(Exception):
+    """Raised for missing or inconsistent import files."""
+
+
+# --- Export ---
+
+def export(out_dir, fmt="csv", user_id=None, batch_size=database.STREAM_BATCH):
+    """
+    Write every table (or only one user's rows) to out_dir.
+    Returns {table: rows written}.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown format {fmt!r} (expected one of {', '.join(FORMATS)})")
+    os.makedirs(out_dir, exist_ok=True)
+    counts = {}
+    for table, columns in TABLES.items():
+        path = os.path.join(out_dir, f"{table}.{fmt}")
+        write = _write_csv if fmt == "csv" else _write_parquet
+        counts[table] = write(path, columns, _stream_table(table, columns, user_id, batch_size))
+    return counts
+
+
+def _stream_table(table, columns, user_id, batch_size):
+    sql = f"SELECT {', '.join(columns)} FROM {table}"
+    args = ()
+    if user_id is not None:
+        sql += " WHERE id = %s" if table == "users" else " WHERE user_id = %s"
+        args = (user_id,)
+    with database.stream_cursor() as cursor:
+        cursor.execute(f"{sql} ORDER BY {ORDER_BY.get(table, 'id')}", args)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield rows
+
+
+def _write_csv(path, columns, batches):
+    n = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(columns))
+        writer.writeheader()
+        for rows in batches:
+            writer.writerows(rows)
+            n += len(rows)
+    return n
+
+
+_ARROW_TYPES = {
+    "int": "int64", "str": "string", "date": "date32",
+    "datetime": "timestamp[us]", "decimal": "float64",
+}
+
+
+def _arrow_schema(columns):
+    pa = _pyarrow()
+    return pa.schema([(name, pa.type_for_alias(_ARROW_TYPES[kind])) for name, kind in columns.items()])
+
+
+def _write_parquet(path, columns, batches):
+    pa = _pyarrow()
+    import pyarrow.parquet as pq
+    schema = _arrow_schema(columns)
+    n = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for rows in batches:
+            data = {
+                name: [_to_arrow(kind, r[name]) for r in rows]
+                for name, kind in columns.items()
+            }
+            writer.write_batch(pa.RecordBatch.from_pydict(data, schema=schema))
+            n += len(rows)
+    return n
+
+
+def _to_arrow(kind, value):
+    if value is None:
+        return None
+    if kind == "decimal":
+        return float(value)
+    if kind == "date":
+        return _parse("date", value)
+    if kind == "datetime":
+        return _parse("datetime", value)
+    return value
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise TransferError("Parquet needs pyarrow: pip install pyarrow") from None
+    return pyarrow
+
+
+# --- Import ---
+
+def import_dir(in_dir, batch_size=database.STREAM_BATCH):
+    """
+    Load a directory written by export() (CSV or Parquet per table; only
+    users is required). Returns {table: rows inserted}.
+    """
+    files = {table: _find_file(in_dir, table) for table in TABLES}
+    if files["users"] is None:
+        raise TransferError(f"{in_dir} has no users.csv or users.parquet")
+
+    counts = {}
+    with database.transaction() as cursor:
+        user_map, existing_users = {}, set()
+        counts["users"] = _import_users(cursor, _read(files["users"], batch_size), user_map, existing_users)
+        habit_map = {}
+        if files["habits"]:
+            counts["habits"] = _import_habits(cursor, _read(files["habits"], batch_size),
+                                              user_map, existing_users, habit_map)
+        if files["progress"]:
+            counts["progress"] = _import_progress(cursor, _read(files["progress"], batch_size),
+                                                  user_map, habit_map)
+        if files["progress_archive"]:
+            counts["progress_archive"] = _import_archive(cursor, _read(files["progress_archive"], batch_size),
+                                                         user_map, habit_map)
+        if files["finance"]:
+            counts["finance"] = _import_rows(
+                cursor, "finance", _read(files["finance"], batch_size), user_map,
+                f"{database.backend.insert_ignore} INTO finance (user_id, salary, emi, debt) VALUES (%s, %s, %s, %s)",
+                lambda r, uid: (uid, r["salary"], r["emi"], r["debt"]),
+            )
+        if files["finance_payments"]:
+            counts["finance_payments"] = _import_payments(cursor, _read(files["finance_payments"], batch_size),
+                                                          user_map, existing_users)
+
+    _rebuild_derived(set(user_map.values()))
+    return counts
+
+
+def _import_users(cursor, batches, user_map, existing_users):
+    """
+    Create users that don't exist yet (by username); map every file id to
+    its database id and collect the database ids of the users that did exist.
+    """
+    offset = _max_id(cursor, "users")
+    n = 0
+    for rows in batches:
+        names = [r["username"] for r in rows]
+        cursor.execute(
+            f"SELECT id, username FROM users WHERE username IN ({', '.join(['%s'] * len(names))})", names
+        )
+        existing = {r["username"]: r["id"] for r in cursor.fetchall()}
+        new = []
+        for r in rows:
+            if r["username"] in existing:
+                user_map[r["id"]] = existing[r["username"]]
+                existing_users.add(existing[r["username"]])
+            else:
+                user_map[r["id"]] = r["id"] + offset
+                new.append((r["id"] + offset, r["username"], r["email"], r["xp"] or 0,
+                            r["streak_freeze"] or 0, r["created_at"] or datetime.datetime.now()))
+        if new:
+            cursor.executemany(
+                "INSERT INTO users (id, username, email, xp, streak_freeze, created_at) VALUES (%s, %s, %s, %s, %s, %s)",
+                new
+            )
+            n += len(new)
+    return n
+
+
+def _import_habits(cursor, batches, user_map, existing_users, habit_map):
+    """
+    Insert habits, mapping every file id to its database id in habit_map.
+    A habit of an existing user with the name of one of their habits is
+    that habit (the n-th of a name in the file is the n-th in the database).
+    """
+    offset = _max_id(cursor, "habits")
+    existing = _existing(cursor, "SELECT id, user_id, name FROM habits WHERE user_id IN ({}) ORDER BY id",
+                         existing_users, lambda r: (r["user_id"], r["name"]))
+    n = 0
+    for rows in batches:
+        values = []
+        for r in rows:
+            user_id = _mapped(user_map, r, "habits")
+            same_name = existing.get((user_id, r["name"]))
+            if same_name:
+                habit_map[r["id"]] = same_name.popleft()
+                continue
+            habit_map[r["id"]] = r["id"] + offset
+            values.append((r["id"] + offset, user_id, r["name"], r["frequency"] or "daily",
+                           r["target"] or 1, r["target_time"], r["streak"] or 0, r["longest_streak"] or 0,
+                           r["last_done_date"]))
+        if values:
+            cursor.executemany("""
+                INSERT INTO habits (id, user_id, name, frequency, target, target_time, streak, longest_streak, last_done_date)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, values)
+            n += len(values)
+    return n
+
+
+def _import_progress(cursor, batches, user_map, habit_map):
+    n = 0
+    for rows in batches:
+        values = []
+        for r in rows:
+            if r["habit_id"] not in habit_map:
+                raise TransferError(f"progress row {r['id']} refers to habit {r['habit_id']}, which is not in habits")
+            values.append((_mapped(user_map, r, "progress"), habit_map[r["habit_id"]], r["status"],
+                           r["completed_at"], r["log_date"]))
+        # Same habit and day twice in the file: keep the first, like mark_habit_done would
+        cursor.executemany(f"""
+            {database.backend.insert_ignore} INTO progress (user_id, habit_id, status, completed_at, log_date)
+            VALUES (%s, %s, %s, %s, %s)
+        """, values)
+        n += len(values)
+    return n
+
+
+def _import_archive(cursor, batches, user_map, habit_map):
+    n = 0
+    for rows in batches:
+        values = []
+        for r in rows:
+            if r["habit_id"] not in habit_map:
+                raise TransferError(f"progress_archive month {r['month']} refers to habit {r['habit_id']}, "
+                                    "which is not in habits")
+            values.append((habit_map[r["habit_id"]], r["month"], _mapped(user_map, r, "progress_archive"),
+                           r["done_mask"] or 0, r["skipped_mask"] or 0, r["done_count"] or 0, r["skipped_count"] or 0))
+        cursor.executemany(f"""
+            {database.backend.insert_ignore} INTO progress_archive
+                (habit_id, month, user_id, done_mask, skipped_mask, done_count, skipped_count)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """, values)
+        n += len(values)
+    return n
+
+
+def _import_rows(cursor, table, batches, user_map, sql, to_values):
+    n = 0
+    for rows in batches:
+        cursor.executemany(sql, [to_values(r, _mapped(user_map, r, table)) for r in rows])
+        n += len(rows)
+    return n
+
+
+def _import_payments(cursor, batches, user_map, existing_users):
+    """Insert payments, skipping those an existing user already has (same date and amount, as often)."""
+    existing = _existing(cursor, "SELECT id, user_id, amount, payment_date FROM finance_payments WHERE user_id IN ({})",
+                         existing_users, _payment_key)
+    n = 0
+    for rows in batches:
+        values = []
+        for r in rows:
+            user_id = _mapped(user_map, r, "finance_payments")
+            same = existing.get(_payment_key(dict(r, user_id=user_id)))
+            if same:
+                same.popleft()
+                continue
+            values.append((user_id, r["amount"], r["payment_date"]))
+        if values:
+            cursor.executemany("INSERT INTO finance_payments (user_id, amount, payment_date) VALUES (%s, %s, %s)", values)
+            n += len(values)
+    return n
+
+
+def _existing(cursor, sql, user_ids, key):
+    """{key(row): deque of ids} for the rows `sql` finds for the given (existing) users."""
+    found = collections.defaultdict(collections.deque)
+    user_ids = sorted(user_ids)
+    for i in range(0, len(user_ids), database.STREAM_BATCH):
+        chunk = user_ids[i:i + database.STREAM_BATCH]
+        cursor.execute(sql.format(", ".join(["%s"] * len(chunk))), chunk)
+        for r in cursor.fetchall():
+            found[key(r)].append(r["id"])
+    return found
+
+
+def _payment_key(row):
+    # Stored and parsed values compare alike: SQLite hands back text dates and float amounts
+    return row["user_id"], _parse("date", row["payment_date"]), _parse("decimal", row["amount"])
+
+
+def _mapped(user_map, row, table):
+    try:
+        return user_map[row["user_id"]]
+    except KeyError:
+        raise TransferError(f"{table} row {row.get('id', row.get('habit_id'))} belongs to user {row['user_id']}, "
+                            "who is not in users") from None
+
+
+def _max_id(cursor, table):
+    cursor.execute(f"SELECT COALESCE(MAX(id), 0) AS m FROM {table}")
+    return cursor.fetchone()["m"]
+
+
+def _rebuild_derived(user_ids):
+    """Archive, rollups, daily streaks, balances and caches for the users an import touched."""
+    database.archive_progress()  # old imported rows go straight to the archive
+    if len(user_ids) > 1000:
+        database.rebuild_rollups()
+        database.recompute_daily_streaks()
+        database.reconcile_finance(fix=True)
+    else:
+        for uid in user_ids:
+            database.rebuild_rollups(uid)
+            database.recompute_daily_streaks(uid)
+            database.reconcile_finance(user_id=uid, fix=True)
+    database.leaderboard.invalidate()
+
+
+# --- Reading files ---
+
+def _find_file(in_dir, table):
+    for fmt in FORMATS:
+        path = os.path.join(in_dir, f"{table}.{fmt}")
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _read(path, batch_size):
+    """Batches of typed row dicts from a CSV or Parquet file."""
+    table = os.path.splitext(os.path.basename(path))[0]
+    columns = TABLES[table]
+    if path.endswith(".parquet"):
+        yield from _read_parquet(path, columns, batch_size)
+    else:
+        yield from _read_csv(path, columns, batch_size)
+
+
+def _read_csv(path, columns, batch_size):
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        missing = [c for c in ("id", "user_id", "username") if c in columns and c not in reader.fieldnames]
+        if missing:
+            raise TransferError(f"{path} is missing column(s): {', '.join(missing)}")
+        batch = []
+        for raw in reader:
+            batch.append({name: _parse(kind, raw.get(name)) for name, kind in columns.items()})
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def _read_parquet(path, columns, batch_size):
+    _pyarrow()
+    import pyarrow.parquet as pq
+    f = pq.ParquetFile(path)
+    present = [c for c in columns if c in f.schema_arrow.names]
+    for record_batch in f.iter_batches(batch_size=batch_size, columns=present):
+        yield [
+            {name: _parse(kind, r.get(name)) for name, kind in columns.items()}
+            for r in record_batch.to_pylist()
+        ]
+
+
+def _parse(kind, value):
+    """CSV text (or a Parquet value) -> the Python type database.py writes. '' is NULL."""
+    if value is None or value == "":
+        return None
+    if kind == "int":
+        return int(value)
+    if kind == "decimal":
+        return decimal.Decimal(str(value))
+    if kind == "date":
+        if isinstance(value, datetime.datetime):
+            return value.date()
+        return value if isinstance(value, datetime.date) else datetime.date.fromisoformat(value)
+    if kind == "datetime":
+        if isinstance(value, datetime.datetime):
+            return value
+        if isinstance(value, datetime.date):
+            return datetime.datetime.combine(value, datetime.time())
+        return datetime.datetime.fromisoformat(value)
+    return str(value)
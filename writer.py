@@ -0,0 +1,256 @@
+# writer.py
+"""
+Background write queue for Done/Skip clicks.
+
+submit() journals the event and returns a ticket right away; one worker
+thread per process drains the queue, drops repeated clicks on the same
+habit and day, and writes each drain with database.mark_progress_batch()
+(one transaction, one commit). Results wait per session until the page
+collects them with poll().
+
+Guarantees:
+  * ordering: a single worker applies events in submit order, so a
+    user's clicks land in the order they were made;
+  * durability: an event is fsync'd to the journal before submit()
+    returns, and events a crashed process never acknowledged are replayed
+    on the next start. Replays are safe because progress is unique per
+    (habit_id, log_date). With the journal turned off, clicks still queued
+    when the process dies are lost;
+  * failures are reported back, never dropped: every ticket gets a
+    result dict ({"ok": False, "msg": ...} when the write failed).
+
+    DUO_WRITE_JOURNAL=path    append-only journal (default duo_writes.journal; empty: in memory only)
+    DUO_WRITE_BATCH=200       most events written per transaction
+    DUO_WRITE_LINGER_MS=50    wait this long for more clicks before writing
+"""
+import atexit
+import datetime
+import json
+import logging
+import os
+import queue as queue_module
+import threading
+import time
+
+import database
+
+JOURNAL = os.environ.get("DUO_WRITE_JOURNAL", "duo_writes.journal") or None
+BATCH_SIZE = int(os.environ.get("DUO_WRITE_BATCH", "200"))
+LINGER = float(os.environ.get("DUO_WRITE_LINGER_MS", "50")) / 1000
+
+log = logging.getLogger("duo.writer")
+
+_STOP = object()
+
+
+class WriteQueue:
+    """Progress events waiting to be written, and the results of those already written."""
+
+    def __init__(self, journal=JOURNAL, batch_size=BATCH_SIZE, linger=LINGER):
+        self.journal = journal
+        self.batch_size = batch_size
+        self.linger = linger
+        self._reset()
+
+    def _reset(self):
+        self._queue = queue_module.Queue()
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._results = {}      # session_id -> [result, ...] not yet polled
+        self._in_flight = {}    # session_id -> submitted, result not yet recorded
+        self._outstanding = 0   # submitted, result not yet recorded
+        self._ticket = 0
+        self._journal_file = None
+        self._thread = None
+
+    def after_fork(self):
+        """
+        In a forked child: the worker thread did not survive the fork and
+        what is queued is the parent's to write. Start empty, and without the
+        journal, which the parent still owns (give each worker its own
+        DUO_WRITE_JOURNAL instead, as router.py does).
+        """
+        self.journal = None
+        self._reset()
+
+    # --- Sessions ---
+
+    def submit(self, session_id, habit_id, status, log_date=None):
+        """Queue a "done"/"skipped" event for habit_id. Returns its ticket (an int)."""
+        if status not in ("done", "skipped"):
+            raise ValueError(f"unknown progress status {status!r}")
+        log_date = log_date or datetime.date.today()  # the day of the click, not of the write
+        with self._lock:
+            self._start()
+            self._ticket += 1
+            event = {
+                "ticket": self._ticket, "session": session_id, "habit_id": habit_id,
+                "status": status, "log_date": log_date.isoformat(),
+            }
+            self._append(event)
+            self._outstanding += 1
+            if session_id is not None:
+                self._in_flight[session_id] = self._in_flight.get(session_id, 0) + 1
+        self._queue.put(event)
+        return event["ticket"]
+
+    def has_results(self, session_id):
+        """Whether poll(session_id) has something to return."""
+        with self._lock:
+            return bool(self._results.get(session_id))
+
+    def in_flight(self, session_id):
+        """Events this session submitted that are not written yet."""
+        with self._lock:
+            return self._in_flight.get(session_id, 0)
+
+    def poll(self, session_id):
+        """Results written since the last poll: [{"ticket", "habit_id", "status", "ok", ...}]."""
+        with self._lock:
+            return self._results.pop(session_id, [])
+
+    def flush(self, timeout=None):
+        """Block until everything submitted so far is written. False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._outstanding == 0, timeout)
+
+    def close(self, timeout=10):
+        """Write what is queued, then stop the worker."""
+        with self._lock:
+            thread = self._thread
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+        with self._lock:
+            self._thread = None
+            if self._journal_file:
+                self._journal_file.close()
+                self._journal_file = None
+
+    # --- Worker ---
+
+    def _start(self):
+        """Open the journal, requeue what it still owes and start the worker. Caller holds the lock."""
+        if self._thread is not None:
+            return
+        replay = self._recover() if self.journal else []
+        for event in replay:
+            self._outstanding += 1
+            self._queue.put(event)
+        self._thread = threading.Thread(target=self._run, name="duo-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            batch, stop = self._next_batch()
+            if batch:
+                self._write(batch)
+            if stop:
+                return
+
+    def _next_batch(self):
+        """The next event, plus whatever else arrives within `linger` (up to batch_size)."""
+        first = self._queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.batch_size:
+            try:
+                event = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue_module.Empty:
+                break
+            if event is _STOP:
+                return batch, True
+            batch.append(event)
+        return batch, False
+
+    def _write(self, batch):
+        # A second click on the same habit and day is answered by the first one
+        first = {}
+        unique = []
+        for event in batch:
+            key = (event["habit_id"], event["log_date"])
+            if key not in first:
+                first[key] = event
+                unique.append(event)
+
+        try:
+            results = database.mark_progress_batch([
+                (e["habit_id"], e["status"], datetime.date.fromisoformat(e["log_date"])) for e in unique
+            ])
+        except Exception as e:
+            log.exception("progress write failed")
+            results = [{"ok": False, "msg": f"Could not save: {e}"} for _ in unique]
+        written = {id(event): result for event, result in zip(unique, results)}
+
+        with self._lock:
+            for event in batch:
+                result = written.get(id(event))
+                if result is None:
+                    earlier = first[(event["habit_id"], event["log_date"])]
+                    result = {"ok": False, "msg": database.already_marked_msg(earlier["status"], event["log_date"])}
+                if event["session"] is not None:
+                    left = self._in_flight.pop(event["session"], 1) - 1
+                    if left:
+                        self._in_flight[event["session"]] = left
+                    self._results.setdefault(event["session"], []).append({
+                        "ticket": event["ticket"], "habit_id": event["habit_id"],
+                        "status": event["status"], **result,
+                    })
+                elif not result.get("ok"):
+                    log.info("replayed event %s: %s", event["ticket"], result.get("msg"))
+            self._outstanding -= len(batch)
+            self._append({"ack": [e["ticket"] for e in batch]})
+            if self._outstanding == 0 and self._journal_file:
+                self._journal_file.truncate(0)  # everything acknowledged
+            self._idle.notify_all()
+
+    # --- Journal ---
+
+    def _append(self, record):
+        """Write one line and fsync it. Caller holds the lock."""
+        if not self.journal:
+            return
+        if self._journal_file is None:
+            self._journal_file = open(self.journal, "a", encoding="utf-8")
+        self._journal_file.write(json.dumps(record) + "\n")
+        self._journal_file.flush()
+        os.fsync(self._journal_file.fileno())
+
+    def _recover(self):
+        """Events in the journal without an ack, in submit order. Rewrites the journal to just those."""
+        events, acked = {}, set()
+        try:
+            with open(self.journal, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # torn last line from a crash mid-write: it was never acknowledged
+                    if "ack" in record:
+                        acked.update(record["ack"])
+                    else:
+                        events[record["ticket"]] = record
+        except FileNotFoundError:
+            pass
+        replay = [dict(e, session=None) for t, e in sorted(events.items()) if t not in acked]
+        self._ticket = max(events, default=0)
+
+        tmp = self.journal + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for event in replay:
+                f.write(json.dumps(event) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.journal)
+        if replay:
+            log.warning("replaying %d unacknowledged progress event(s) from %s", len(replay), self.journal)
+        return replay
+
+
+queue = WriteQueue()
+atexit.register(queue.close)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=queue.after_fork)